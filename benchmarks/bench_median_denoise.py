@@ -0,0 +1,66 @@
+"""Benchmark of the median denoising transformer for disk radii 1-10.
+
+Compares ``DenoiseWithMedian`` (which picks the sliding-histogram median for
+integer images with few intensity levels) with ``skimage.filters.median``
+on synthetic uint8 and uint16 images, and checks that the results match.
+
+Example:
+    python benchmarks/bench_median_denoise.py --size 2048
+"""
+
+import argparse
+import time
+
+import numpy as np
+from skimage.filters import median
+from skimage.morphology import disk
+
+from plex_pipe.processors.image_transformers import DenoiseWithMedian
+
+
+def make_image(size, dtype, n_levels, seed=0):
+    """Creates a noisy image with smooth structures and `n_levels` intensities."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size] / size
+    signal = 0.5 + 0.25 * np.sin(12 * yy) * np.cos(9 * xx)
+    noisy = rng.poisson(signal * (n_levels - 1)).clip(0, n_levels - 1)
+    return noisy.astype(dtype)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--radii", type=int, nargs="+", default=list(range(1, 11)))
+    args = parser.parse_args()
+
+    images = {
+        "uint8": make_image(args.size, np.uint8, 256),
+        "uint16 (12 bit)": make_image(args.size, np.uint16, 4096),
+        "uint16 (16 bit)": make_image(args.size, np.uint16, 65536),
+    }
+
+    print(
+        f"{'image':<16} {'radius':>6} {'skimage':>9} {'plex_pipe':>10} {'speedup':>8}"
+    )
+    for name, img in images.items():
+        for radius in args.radii:
+            transformer = DenoiseWithMedian(disk_radius=radius)
+
+            t_ref, expected = timed(median, img, disk(radius))
+            t_new, result = timed(transformer.run, img)
+
+            assert np.array_equal(result, expected), f"Results differ for {name}."
+            print(
+                f"{name:<16} {radius:>6} {t_ref:>8.2f}s {t_new:>9.2f}s "
+                f"{t_ref / t_new:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
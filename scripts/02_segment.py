@@ -2,13 +2,17 @@ import argparse
 import os
 import sys
 from datetime import datetime
+from functools import lru_cache, partial
 
 import spatialdata as sd
 from loguru import logger
 
 from plex_pipe.processors import build_processor
 from plex_pipe.processors.controller import ResourceBuildingController
+from plex_pipe.processors.scheduler import StepScheduler
 from plex_pipe.utils.config_loaders import load_analysis_settings
+from plex_pipe.utils.element_cache import ElementCache
+from plex_pipe.utils.parallel_utils import run_per_core
 
 
 def configure_logging(settings):
@@ -44,56 +48,165 @@ def parse_args():
         action="store_true",
         help="Use remote analysis directory as base.",
     )
+    parser.add_argument(
+        "--recompute",
+        action="store_true",
+        help="Recompute all steps, even if their outputs are up to date.",
+    )
+    parser.add_argument(
+        "--parallel_steps",
+        type=int,
+        default=1,
+        help="Number of independent pipeline steps run at once on a core.",
+    )
+    parser.add_argument(
+        "--step_memory",
+        type=float,
+        default=None,
+        help=(
+            "Memory (GB) for the steps running at once on a core. Tileable steps "
+            "fitting it are run on the whole image instead of in tiles."
+        ),
+    )
+    parser.add_argument(
+        "--cache_memory",
+        type=float,
+        default=2.0,
+        help="Memory (GB) for keeping decoded elements of a core shared between steps.",
+    )
+    parser.add_argument(
+        "--n_workers",
+        type=int,
+        default=1,
+        help="Number of worker processes, each segmenting its own cores.",
+    )
+    parser.add_argument(
+        "--threads_per_worker",
+        type=int,
+        default=None,
+        help="Cap on BLAS, torch and dask threads in every worker.",
+    )
 
     return parser.parse_args()
 
 
-def main():
+def build_controllers(settings, reuse_outputs=True, cache=None, memory_limit=None):
+    """
+    Setup the builders of additional data elements.
+    """
 
-    args = parse_args()
+    builders_list = []
 
-    # read config file
-    settings = load_analysis_settings(
-        args.exp_config, remote_analysis=args.remote_analysis
+    if not getattr(settings, "additional_elements", None):
+        logger.info("No resource builders specified.")
+        return builders_list
+
+    # masks built from a segmentation share its label IDs; only segmentations
+    # produced before any mask builder may be renumbered
+    relabel = settings.sdata_storage.relabel_sequential
+
+    for builder_settings in settings.additional_elements:
+
+        params = dict(getattr(builder_settings, "parameters", None)) or {}
+
+        builder = build_processor(
+            builder_settings.category, builder_settings.type, **params
+        )
+
+        builder_controller = ResourceBuildingController(
+            builder=builder,
+            input_names=builder_settings.input,
+            output_names=builder_settings.output,
+            keep=builder_settings.keep,
+            overwrite=True,
+            pyramid_levels=settings.sdata_storage.max_pyramid_level,
+            downscale=settings.sdata_storage.downscale,
+            chunk_size=settings.sdata_storage.chunk_size,
+            reuse_outputs=reuse_outputs,
+            cache=cache,
+            memory_limit=memory_limit,
+            label_dtype=settings.sdata_storage.label_dtype,
+            relabel_sequential=relabel and builder.kind == "object_segmenter",
+            image_dtype=settings.sdata_storage.image_dtype,
+        )
+
+        logger.info(
+            f"Image transformer of type '{builder_settings.type}' for image '{builder_settings.input}' has been created."
+        )
+
+        if relabel and builder.kind == "mask_builder":
+            relabel = False
+            logger.info(
+                "Labels of segmentations after a mask builder are not relabelled."
+            )
+
+        builders_list.append(builder_controller)
+
+    return builders_list
+
+
+@lru_cache(maxsize=1)
+def setup_pipeline(
+    exp_config, remote_analysis, parallel_steps, recompute, cache_memory, step_memory
+):
+    """
+    Read the config and build the pipeline once per process.
+    """
+
+    settings = load_analysis_settings(exp_config, remote_analysis=remote_analysis)
+    cache = ElementCache(max_bytes=int(cache_memory * 1e9))
+    memory_limit = int(step_memory * 1e9) if step_memory else None
+    builders_list = build_controllers(
+        settings, reuse_outputs=not recompute, cache=cache, memory_limit=memory_limit
+    )
+    scheduler = StepScheduler(
+        builders_list, max_workers=parallel_steps, memory_budget=memory_limit
     )
 
-    # setup logging
-    configure_logging(settings)
-    logger.info("Starting object segmentation script.")
+    return settings, builders_list, scheduler, cache
 
-    # setup builders of additional data elements
-    if getattr(settings, "additional_elements", None):
 
-        builders_list = []
+def process_core(sd_path, args):
+    """
+    Run the pipeline on a single core.
+    """
 
-        for builder_settings in settings.additional_elements:
+    settings, builders_list, scheduler, cache = setup_pipeline(
+        args.exp_config,
+        args.remote_analysis,
+        args.parallel_steps,
+        args.recompute,
+        args.cache_memory,
+        args.step_memory,
+    )
 
-            params = dict(getattr(builder_settings, "parameters", None)) or {}
+    logger.info(f"Processing {sd_path.name}")
 
-            builder = build_processor(
-                builder_settings.category, builder_settings.type, **params
-            )
+    # get sdata
+    sdata = sd.read_zarr(sd_path)
 
-            builder_controller = ResourceBuildingController(
-                builder=builder,
-                input_names=builder_settings.input,
-                output_names=builder_settings.output,
-                keep=builder_settings.keep,
-                overwrite=True,
-                pyramid_levels=settings.sdata_storage.max_pyramid_level,
-                downscale=settings.sdata_storage.downscale,
-                chunk_size=settings.sdata_storage.chunk_size,
-            )
+    # check that the pipeline can run on provide sdata
+    settings.validate_pipeline(sdata)
 
-            logger.info(
-                f"Image transformer of type '{builder_settings.type}' for image '{builder_settings.input}' has been created."
-            )
+    # run builders of additional elements
+    scheduler.run(sdata)
 
-            builders_list.append(builder_controller)
+    # the decoded elements are only reused within a core
+    cache.clear()
 
-    else:
-        builders_list = []
-        logger.info("No resource builders specified.")
+
+def main():
+
+    args = parse_args()
+
+    # read config file
+    settings = load_analysis_settings(
+        args.exp_config, remote_analysis=args.remote_analysis
+    )
+
+    # setup logging
+    configure_logging(settings)
+    logger.info("Starting object segmentation script.")
 
     # define the cores for the analysis
     core_dir = settings.analysis_dir / "cores"
@@ -101,19 +214,19 @@ def main():
     path_list.sort()
 
     # run processing
-    for sd_path in path_list:
-
-        logger.info(f"Processing {sd_path.name}")
-
-        # get sdata
-        sdata = sd.read_zarr(sd_path)
-
-        # check that the pipeline can run on provide sdata
-        settings.validate_pipeline(sdata)
+    result = run_per_core(
+        partial(process_core, args=args),
+        path_list,
+        n_workers=args.n_workers,
+        threads_per_worker=args.threads_per_worker,
+        log_dir=settings.log_dir_path,
+        log_name="cores_segmentation",
+    )
 
-        # run builders of additional elements
-        for builder_controller in builders_list:
-            sdata = builder_controller.run(sdata)
+    failed = [p.name for p in result["failed"]]
+    if failed:
+        logger.error(f"Segmentation failed for {len(failed)} core(s): {failed}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -2,12 +2,16 @@ import argparse
 import os
 import sys
 from datetime import datetime
+from functools import lru_cache, partial
 
 import spatialdata as sd
 from loguru import logger
 
 from plex_pipe.object_quantification.controller import QuantificationController
+from plex_pipe.object_quantification.feature_store import FeatureStore
 from plex_pipe.utils.config_loaders import load_analysis_settings
+from plex_pipe.utils.element_cache import ElementCache
+from plex_pipe.utils.parallel_utils import run_per_core
 
 
 def configure_logging(settings):
@@ -43,24 +47,75 @@ def parse_args():
         action="store_true",
         help="Use remote analysis directory as base.",
     )
+    parser.add_argument(
+        "--cache_memory",
+        type=float,
+        default=2.0,
+        help="Memory (GB) for keeping decoded elements of a core shared between steps.",
+    )
+    parser.add_argument(
+        "--channel_threads",
+        type=int,
+        default=1,
+        help="Number of channels of a core quantified at once.",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=0,
+        help="Number of channels decoded ahead while others are quantified.",
+    )
+    parser.add_argument(
+        "--max_channel_memory",
+        type=float,
+        default=None,
+        help="Upper bound (GB) on the decoded channels held at once.",
+    )
+    parser.add_argument(
+        "--tile_size",
+        type=int,
+        default=None,
+        help="Quantify tile by tile with tiles of this size (pixels) instead of whole images.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only compute the channels and masks missing from existing tables.",
+    )
+    parser.add_argument(
+        "--feature_store",
+        action="store_true",
+        help="Also store the tables of every core in the cohort feature store (Parquet).",
+    )
+    parser.add_argument(
+        "--n_workers",
+        type=int,
+        default=1,
+        help="Number of worker processes, each quantifying its own cores.",
+    )
+    parser.add_argument(
+        "--threads_per_worker",
+        type=int,
+        default=None,
+        help="Cap on BLAS, torch and dask threads in every worker.",
+    )
 
     return parser.parse_args()
 
 
-def main():
-
-    args = parse_args()
-
-    # read config file
-    settings = load_analysis_settings(
-        args.exp_config, remote_analysis=args.remote_analysis
-    )
-
-    # setup logging
-    configure_logging(settings)
-    logger.info("Starting quantification script.")
+def build_controllers(
+    settings,
+    cache=None,
+    n_threads=1,
+    prefetch=0,
+    max_channel_memory=None,
+    tile_size=None,
+    incremental=False,
+):
+    """
+    Setup the quantification controllers.
+    """
 
-    # setup quantification controllers
     quant_controller_list = []
     qc_prefix = settings.qc.prefix
     for quant in settings.quant:
@@ -80,26 +135,125 @@ def main():
             overwrite=True,
             quantify_qc=True,
             qc_prefix=qc_prefix,
+            cache=cache,
+            statistics=quant.statistics,
+            morphology=quant.morphology,
+            neighbors_radius=quant.neighbors_radius,
+            neighbors_k=quant.neighbors_k,
+            contact_graph=quant.contact_graph,
+            n_threads=n_threads,
+            prefetch=prefetch,
+            max_channel_memory=max_channel_memory,
+            tile_size=tile_size,
+            incremental=incremental,
         )
 
         quant_controller_list.append(controller)
 
+    return quant_controller_list
+
+
+@lru_cache(maxsize=1)
+def setup_quantification(
+    exp_config,
+    remote_analysis,
+    cache_memory,
+    channel_threads=1,
+    prefetch=0,
+    max_channel_memory=None,
+    tile_size=None,
+    incremental=False,
+    feature_store=False,
+):
+    """
+    Read the config and build the controllers once per process.
+    """
+
+    settings = load_analysis_settings(exp_config, remote_analysis=remote_analysis)
+    cache = ElementCache(max_bytes=int(cache_memory * 1e9))
+    controllers = build_controllers(
+        settings,
+        cache=cache,
+        n_threads=channel_threads,
+        prefetch=prefetch,
+        max_channel_memory=(
+            int(max_channel_memory * 1e9) if max_channel_memory else None
+        ),
+        tile_size=tile_size,
+        incremental=incremental,
+    )
+
+    store = FeatureStore(settings.feature_store_path) if feature_store else None
+
+    return controllers, cache, store
+
+
+def process_core(sd_path, args):
+    """
+    Quantify a single core.
+    """
+
+    quant_controller_list, cache, store = setup_quantification(
+        args.exp_config,
+        args.remote_analysis,
+        args.cache_memory,
+        args.channel_threads,
+        args.prefetch,
+        args.max_channel_memory,
+        args.tile_size,
+        args.incremental,
+        args.feature_store,
+    )
+
+    logger.info(f"Processing {sd_path.name}")
+
+    # get sdata
+    sdata = sd.read_zarr(sd_path)
+
+    # run quantification
+    for controller in quant_controller_list:
+        controller.run(sdata)
+        if store is not None:
+            store.write(
+                controller.table_name, sd_path.stem, sdata[controller.table_name]
+            )
+
+    # the decoded elements are only reused within a core
+    cache.clear()
+
+
+def main():
+
+    args = parse_args()
+
+    # read config file
+    settings = load_analysis_settings(
+        args.exp_config, remote_analysis=args.remote_analysis
+    )
+
+    # setup logging
+    configure_logging(settings)
+    logger.info("Starting quantification script.")
+
     # define the cores for the analysis
     core_dir = settings.analysis_dir / "cores"
     path_list = [core_dir / f for f in os.listdir(core_dir)]
     path_list.sort()
 
     # run processing
-    for sd_path in path_list:
-
-        logger.info(f"Processing {sd_path.name}")
-
-        # get sdata
-        sdata = sd.read_zarr(sd_path)
+    result = run_per_core(
+        partial(process_core, args=args),
+        path_list,
+        n_workers=args.n_workers,
+        threads_per_worker=args.threads_per_worker,
+        log_dir=settings.log_dir_path,
+        log_name="cores_quantification",
+    )
 
-        # run quantification
-        for controller in quant_controller_list:
-            controller.run(sdata)
+    if result["failed"]:
+        failed = [p.name for p in result["failed"]]
+        logger.error(f"Quantification failed for {len(failed)} core(s): {failed}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+import argparse
+import sys
+
+from loguru import logger
+
+from plex_pipe.processors.object_segmenters import worker_params
+from plex_pipe.processors.segmentation_worker import (
+    SegmentationClient,
+    SegmentationWorker,
+)
+from plex_pipe.utils.config_loaders import load_analysis_settings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Keep segmentation models loaded and serve them to pipeline processes on this node."
+    )
+
+    parser.add_argument(
+        "--address",
+        default=None,
+        help="Unix socket path to listen on. Defaults to a socket in the per-user runtime directory. Use the same value as 'worker_address' in the segmenter parameters.",
+    )
+    parser.add_argument(
+        "--exp_config",
+        help="Optional experiment YAML config; its object segmenters are loaded at start-up.",
+    )
+    parser.add_argument(
+        "--stop",
+        action="store_true",
+        help="Stop the worker listening on --address.",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+
+    args = parse_args()
+
+    if args.stop:
+        SegmentationClient(args.address).request({"op": "shutdown"})
+        return
+
+    logger.remove()
+    logger.add(sys.stdout, level="INFO")
+
+    worker = SegmentationWorker(args.address)
+
+    # warm up the models requested in the experiment config
+    if args.exp_config:
+        settings = load_analysis_settings(args.exp_config)
+        for step in settings.additional_elements or []:
+            if step.category != "object_segmenter":
+                continue
+            worker.get_processor(
+                step.category, step.type, worker_params(step.parameters)
+            )
+
+    worker.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
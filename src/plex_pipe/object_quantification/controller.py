@@ -1,16 +1,49 @@
 import re
-from typing import Dict, List, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Sequence
 
 import anndata as ad
+import dask.array as da
 import numpy as np
 import pandas as pd
 import spatialdata as sd
 from loguru import logger
-from skimage.measure import regionprops_table
 from spatialdata.models import TableModel
 
+from plex_pipe.object_quantification.engine import (
+    DEFAULT_MORPHOLOGY,
+    LabelIndex,
+    feature_columns,
+    morphology_table,
+    validate_statistics,
+)
+from plex_pipe.object_quantification.morphology_store import (
+    load_morphology,
+    save_morphology,
+)
 from plex_pipe.object_quantification.qc_shape_masker import QcShapeMasker
-from plex_pipe.utils.im_utils import calculate_median
+from plex_pipe.object_quantification.spatial_graph import (
+    contact_graph,
+    contact_pairs,
+    knn_graph,
+    radius_graph,
+)
+from plex_pipe.object_quantification.tiled import (
+    TiledQuantifier,
+    tiled_contact_pairs,
+)
+from plex_pipe.processors.controller import ResourceBuildingController
+from plex_pipe.utils.element_cache import ElementCache
+from plex_pipe.utils.im_utils import (
+    QUANTIZATION_KEY,
+    dequantize_image,
+)
+
+# key in the `uns` of a table mapping mask suffixes to the fingerprints of the
+# masks it was quantified on
+MASKS_KEY = "plex_pipe_masks"
 
 
 class QuantificationController:
@@ -23,10 +56,53 @@ class QuantificationController:
         quantify_qc=False,
         qc_prefix: Optional[str] = "qc_exclude",
         overwrite: bool = False,
+        cache: Optional[ElementCache] = None,
+        statistics: Sequence[str] = ("mean", "median"),
+        n_threads: int = 1,
+        prefetch: int = 0,
+        max_channel_memory: Optional[int] = None,
+        tile_size: Optional[int] = None,
+        incremental: bool = False,
+        morphology: Sequence[str] = DEFAULT_MORPHOLOGY,
+        reuse_morphology: bool = True,
+        neighbors_radius: Optional[float] = None,
+        neighbors_k: Optional[int] = None,
+        contact_graph: bool = False,
+        graph_mask: Optional[str] = None,
     ) -> None:
         """
         mask_keys: dict mapping mask suffix (e.g. 'cell') to sdata.labels key (e.g. 'cell_mask')
         channels: list of channels to quantify
+        cache: element cache shared by the controllers of one process, so masks
+            and channels are decoded from disk once per core
+        statistics: per-object intensity statistics computed for every channel
+            and mask (see `engine.STATISTICS`; percentiles as e.g. 'p90'),
+            stored as '{ch}_{stat}_{mask}'
+        n_threads: number of channels reduced at once
+        prefetch: number of channels decoded ahead while others are reduced
+        max_channel_memory: upper bound (bytes) on the decoded channels held
+            at once; limits n_threads + prefetch for large cores
+        tile_size: if given, masks and channels are read in tiles of this size
+            and never loaded whole (see `TiledQuantifier`), for cores that do
+            not fit into memory
+        incremental: if the table already exists, only its missing columns
+            (new channels, statistics or masks) are computed and appended;
+            existing columns are kept. If a mask changed since the table was
+            written (see `stale_masks`), the table is rebuilt.
+        morphology: morphology features of every mask (see
+            `engine.MOMENT_FEATURES`); costly `regionprops` properties such as
+            'solidity' or 'perimeter' are computed only if listed
+        reuse_morphology: keep the morphology of every mask in a table next to
+            the labels (see `morphology_store`), so tables sharing masks
+            measure them once
+        neighbors_radius: if given, objects with centroids closer than this
+            (pixels) are connected in obsp['spatial_radius_distances']
+        neighbors_k: if given, every object is connected to its k nearest
+            neighbours in obsp['spatial_knn_distances']
+        contact_graph: connect touching objects in obsp['spatial_contacts'],
+            weighted by the length of their shared border (pixels)
+        graph_mask: suffix of the mask whose objects form the graphs; by
+            default the mask the table is connected to, or the first mask
         """
 
         if (connect_to_mask) and (connect_to_mask not in mask_keys.values()):
@@ -34,6 +110,24 @@ class QuantificationController:
                 f"connect_to_mask '{connect_to_mask}' must be one of the provided mask_keys: {list(mask_keys.keys())}"
             )
 
+        validate_statistics(statistics)
+
+        if graph_mask is None:
+            connected = [s for s, k in mask_keys.items() if k == connect_to_mask]
+            graph_mask = (connected or list(mask_keys) or [None])[0]
+        if (neighbors_radius is not None or neighbors_k is not None) and (
+            "centroid" not in morphology
+        ):
+            raise ValueError(
+                "Neighbour graphs are built from centroids; add 'centroid' to the morphology features."
+            )
+        if (
+            neighbors_radius is not None or neighbors_k is not None or contact_graph
+        ) and graph_mask not in mask_keys:
+            raise ValueError(
+                f"graph_mask '{graph_mask}' must be one of the provided mask_keys: {list(mask_keys.keys())}"
+            )
+
         self.mask_keys = mask_keys.copy()
         self.connect_to_mask = connect_to_mask
         self.channels = to_quantify
@@ -41,21 +135,76 @@ class QuantificationController:
         self.quantify_qc = quantify_qc
         self.qc_prefix = qc_prefix
         self.overwrite = overwrite
+        self.cache = cache
+        self.statistics = list(statistics)
+        self.n_threads = max(1, n_threads)
+        self.prefetch = max(0, prefetch)
+        self.max_channel_memory = max_channel_memory
+        self.tile_size = tile_size
+        self.tiled = None
+        self.incremental = incremental
+        self.morphology = list(morphology)
+        self.reuse_morphology = reuse_morphology
+        self.neighbors_radius = neighbors_radius
+        self.neighbors_k = neighbors_k
+        self.contact_graph = contact_graph
+        self.graph_mask = graph_mask
 
     def prepare_masks(self):
+        if self.tile_size is not None:
+            # masks stay on disk; objects are found and measured tile by tile
+            self.tiled = TiledQuantifier(
+                {
+                    suffix: self.get_lazy_element(mask_key)
+                    for suffix, mask_key in self.mask_keys.items()
+                },
+                self.tile_size,
+                self.statistics,
+                self.morphology,
+            )
+            self.tiled.scan_masks()
+            self.masks = {}
+            self.indexes = {}
+            return
+
         # Load all user-requested masks
         self.masks = {
             suffix: self.get_mask(mask_key)
             for suffix, mask_key in self.mask_keys.items()
         }
+        # sort the pixels of every mask by label once, for all channels
+        self.indexes = {suffix: LabelIndex(mask) for suffix, mask in self.masks.items()}
+
+    def load_element(self, key: str) -> np.ndarray:
+        if self.cache is not None:
+            return self.cache.get(
+                self.sdata, key, 0, loader=lambda: self.read_element(key)
+            )
+        return self.read_element(key)
+
+    def read_element(self, key: str) -> np.ndarray:
+        # quantized images are restored to float32
+        arr = np.array(sd.get_pyramid_levels(self.sdata[key], n=0)).squeeze()
+        return dequantize_image(
+            arr, self.sdata.attrs.get(QUANTIZATION_KEY, {}).get(key)
+        )
+
+    def get_lazy_element(self, key: str) -> da.Array:
+        level = sd.get_pyramid_levels(self.sdata[key], n=0)
+        arr = da.asarray(getattr(level, "data", level)).squeeze()
+        arr = dequantize_image(arr, self.sdata.attrs.get(QUANTIZATION_KEY, {}).get(key))
+        if arr.ndim > 2:
+            # as in get_channel, multi-channel images are averaged
+            arr = arr.mean(axis=0)
+        return arr
 
     def get_mask(self, mask_key: str) -> np.ndarray:
-        mask = np.array(sd.get_pyramid_levels(self.sdata[mask_key], n=0)).squeeze()
+        mask = self.load_element(mask_key)
         return mask
 
     def get_channel(self, channel_key: str) -> np.ndarray:
 
-        img = np.array(sd.get_pyramid_levels(self.sdata[channel_key], n=0)).squeeze()
+        img = self.load_element(channel_key)
 
         if img.ndim > 2:
             # warning if more than 2D will take the mean across channels
@@ -66,29 +215,22 @@ class QuantificationController:
 
         return img
 
-    def build_obs(self):
+    def build_obs(self, mask_suffixes: Optional[Sequence[str]] = None):
+        """
+        mask_suffixes: masks to measure the morphology of; all masks by default
+        """
+        if mask_suffixes is None:
+            mask_suffixes = list(self.mask_keys)
+
+        morphology = {s: self.get_morphology(s) for s in mask_suffixes}
+
         morph_dfs = []
-        for mask_suffix, mask in self.masks.items():
-            logger.info(f"Quantifying morphology features for mask '{mask_suffix}'")
-            morph_props = regionprops_table(
-                mask,
-                properties=[
-                    "label",
-                    "area",
-                    "eccentricity",
-                    "solidity",
-                    "perimeter",
-                    "centroid",
-                    "euler_number",
-                ],
-            )
-            morph_df = pd.DataFrame(morph_props)
+        for mask_suffix, morph_df in morphology.items():
             morph_df = morph_df.rename(
                 columns={
                     c: f"{c}_{mask_suffix}" for c in morph_df.columns if c != "label"
                 }
             )
-            morph_df = morph_df.set_index("label", drop=True)
             morph_dfs.append(morph_df)
 
         # create obs object
@@ -99,6 +241,93 @@ class QuantificationController:
 
         return obs
 
+    def get_morphology(self, mask_suffix: str) -> pd.DataFrame:
+        """
+        Returns the requested morphology features of a mask.
+
+        Features stored for the mask by another table are reused; only the
+        missing ones are computed.
+        """
+        mask_key = self.mask_keys[mask_suffix]
+        stored = (
+            load_morphology(self.sdata, mask_key) if self.reuse_morphology else None
+        )
+        missing = [
+            f
+            for f in self.morphology
+            if stored is None or not feature_columns(f, stored.columns)
+        ]
+
+        if not missing:
+            logger.info(f"Reusing stored morphology features of mask '{mask_suffix}'")
+        else:
+            if self.tiled is not None:
+                table = self.tiled.morphology[mask_suffix]
+            else:
+                logger.info(
+                    f"Quantifying morphology features {missing} for mask '{mask_suffix}'"
+                )
+                table = morphology_table(
+                    self.masks[mask_suffix],
+                    properties=missing,
+                    index=self.indexes[mask_suffix],
+                )
+            if self.reuse_morphology:
+                stored = save_morphology(self.sdata, mask_key, table)
+            else:
+                stored = table
+
+        return stored[
+            [c for f in self.morphology for c in feature_columns(f, stored.columns)]
+        ]
+
+    def graph_keys(self) -> List[str]:
+        """Returns the obsp keys of the requested neighbour graphs."""
+        keys = []
+        if self.neighbors_radius is not None:
+            keys.append("spatial_radius_distances")
+        if self.neighbors_k is not None:
+            keys.append("spatial_knn_distances")
+        if self.contact_graph:
+            keys.append("spatial_contacts")
+        return keys
+
+    def build_obsp(self, obs, obsm, keys: Optional[Sequence[str]] = None):
+        """
+        Builds the requested neighbour graphs of the objects of the table.
+
+        Radius and k-NN graphs connect the centroids of the objects of
+        `graph_mask` with a KD-tree; the contact graph is read from the borders
+        of its label image. Objects missing from the mask stay unconnected.
+        """
+        keys = self.graph_keys() if keys is None else list(keys)
+        obsp = {}
+        if not keys:
+            return obsp
+
+        logger.info(f"Building neighbour graphs {keys} of mask '{self.graph_mask}'")
+        if "spatial_radius_distances" in keys or "spatial_knn_distances" in keys:
+            coords = np.asarray(obsm[f"centroid_{self.graph_mask}"])
+        if "spatial_radius_distances" in keys:
+            obsp["spatial_radius_distances"] = radius_graph(
+                coords, self.neighbors_radius
+            )
+        if "spatial_knn_distances" in keys:
+            obsp["spatial_knn_distances"] = knn_graph(coords, self.neighbors_k)
+        if "spatial_contacts" in keys:
+            mask_key = self.mask_keys[self.graph_mask]
+            if self.tile_size is not None:
+                pairs = tiled_contact_pairs(
+                    self.get_lazy_element(mask_key), self.tile_size
+                )
+            elif self.masks and self.graph_mask in self.masks:
+                pairs = contact_pairs(self.masks[self.graph_mask])
+            else:
+                pairs = contact_pairs(self.get_mask(mask_key))
+            obsp["spatial_contacts"] = contact_graph(obs["label"].to_numpy(), *pairs)
+
+        return obsp
+
     def find_ndims_columns(self, names: List[str]) -> List[str]:
         """
         Identify columns in the provided list that represent multi-dimensional data.
@@ -151,30 +380,47 @@ class QuantificationController:
 
         return obsm, cols_to_drop
 
+    def quantify_channel(self, ch: str, img: np.ndarray) -> List[pd.DataFrame]:
+        # one frame per mask: one row per object, one column per statistic
+        quant_dfs = []
+        for mask_suffix, index in self.indexes.items():
+            logger.info(f"Quantifying channel '{ch}' with mask '{mask_suffix}'")
+            stats = index.reduce(img, self.statistics)
+            df = pd.DataFrame(
+                {
+                    f"{ch}_{stat}_{mask_suffix}": values
+                    for stat, values in stats.items()
+                },
+                index=pd.Index(index.labels.astype(np.int64), name="label"),
+            )
+            quant_dfs.append(df)
+        return quant_dfs
+
+    def channels_in_flight(self) -> int:
+        """
+        Number of decoded channels held at once, bounded by max_channel_memory.
+        """
+        window = self.n_threads + self.prefetch
+        if self.max_channel_memory is not None and self.channels:
+            level = sd.get_pyramid_levels(self.sdata[self.channels[0]], n=0)
+            # channels are reduced as float64 copies of their pixels
+            channel_bytes = int(np.prod(level.shape)) * max(level.dtype.itemsize, 8)
+            window = min(window, self.max_channel_memory // channel_bytes)
+        return max(1, window)
+
     def build_X_and_var(self):
 
-        # For each mask: one row per object; For each channel: quantification columns
-        quant_dfs = []
-        for ch in self.channels:
-            img = self.get_channel(ch)
-            for mask_suffix, mask in self.masks.items():
-                logger.info(f"Quantifying channel '{ch}' with mask '{mask_suffix}'")
-                props = regionprops_table(
-                    mask,
-                    intensity_image=img,
-                    properties=["label", "mean_intensity"],
-                    extra_properties=[calculate_median],
-                )
-                df = pd.DataFrame(props)
-                df = df.rename(
-                    columns={
-                        c: f"{ch}_{c.replace('mean_intensity', 'mean').replace('calculate_median', 'median')}_{mask_suffix}"
-                        for c in df.columns
-                        if c != "label"
-                    }
-                )
-                df = df.set_index("label", drop=True)
-                quant_dfs.append(df)
+        if self.tiled is not None:
+            lazy = {ch: self.get_lazy_element(ch) for ch in self.channels}
+            quant_dfs = self.tiled.quantify(
+                {ch: partial(TiledQuantifier.read, arr) for ch, arr in lazy.items()}
+            )
+        elif self.n_threads == 1 and self.prefetch == 0:
+            quant_dfs = []
+            for ch in self.channels:
+                quant_dfs.extend(self.quantify_channel(ch, self.get_channel(ch)))
+        else:
+            quant_dfs = self.quantify_channels_parallel()
 
         # create X
         quant_df = pd.concat(quant_dfs, axis=1, join="outer")
@@ -183,6 +429,38 @@ class QuantificationController:
 
         return quant_df
 
+    def quantify_channels_parallel(self) -> List[pd.DataFrame]:
+        """
+        Decodes channels in background threads and reduces them in a thread pool.
+
+        A channel takes a slot before it is decoded and frees it once it is
+        reduced, so at most `channels_in_flight` images are in memory. Slots
+        are taken in channel order and decoding never waits for a slot, so
+        the reducers always make progress. Results are collected in channel
+        order, so the table equals the serial one.
+        """
+        slots = threading.Semaphore(self.channels_in_flight())
+
+        def quantify(ch, load):
+            try:
+                return self.quantify_channel(ch, load.result())
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, self.prefetch), thread_name_prefix="decode"
+        ) as loaders:
+            with ThreadPoolExecutor(
+                max_workers=self.n_threads, thread_name_prefix="quantify"
+            ) as reducers:
+                reduces = []
+                for ch in self.channels:
+                    slots.acquire()
+                    load = loaders.submit(self.get_channel, ch)
+                    reduces.append(reducers.submit(quantify, ch, load))
+
+                return [df for future in reduces for df in future.result()]
+
     def prepare_to_overwrite(self):
 
         if self.table_name in self.sdata:
@@ -232,23 +510,10 @@ class QuantificationController:
                 f"Channels not specified. Quantifying all existing channels ({len(self.channels)})."
             )
 
-    def run(
-        self,
-        spatial_data: sd.SpatialData,
-    ) -> None:
-
-        ########################################################################
-        # Validate inputs and prepare data
-        ########################################################################
-
-        # set data
-        self.sdata = spatial_data
-
-        # Validate masks and channels
-        self.validate_sdata_as_input()
-
-        # Handle overwiting
-        self.prepare_to_overwrite()
+    def build_table(self) -> ad.AnnData:
+        """
+        Quantifies all masks and channels into a new AnnData table.
+        """
 
         # prepare masks
         self.prepare_masks()
@@ -279,8 +544,12 @@ class QuantificationController:
 
         quant_df = self.build_X_and_var()
 
+        obsp = self.build_obsp(obs, obsm)
+
         # cleanup
         self.masks = None
+        self.indexes = None
+        self.tiled = None
 
         # re-index to match obs
         quant_df = quant_df.reindex(obs.index)
@@ -293,11 +562,193 @@ class QuantificationController:
         ########################################################################
 
         # create AnnData object
-        adata = ad.AnnData(X=X, obs=obs, var=var, obsm=obsm)
+        adata = ad.AnnData(X=X, obs=obs, var=var, obsm=obsm, obsp=obsp)
         logger.info(
             f"Quantification complete. Resulting AnnData has {adata.n_obs} observations and {adata.n_vars} variables."
         )
 
+        return adata
+
+    def find_missing(self, adata: ad.AnnData):
+        """
+        Compares an existing table with the requested channels and masks.
+
+        Returns the channels with missing intensity columns and the masks
+        with missing morphology features in the table.
+        """
+        present = set(adata.var_names)
+        channels = [
+            ch
+            for ch in self.channels
+            if any(
+                f"{ch}_{stat}_{suffix}" not in present
+                for stat in self.statistics
+                for suffix in self.mask_keys
+            )
+        ]
+        # single-valued features are obs columns, multi-dimensional ones obsm
+        measured = set(adata.obs.columns) | set(adata.obsm.keys())
+        masks = [
+            s
+            for s in self.mask_keys
+            if any(f"{f}_{s}" not in measured for f in self.morphology)
+        ]
+        return channels, masks
+
+    def mask_fingerprints(self) -> Dict[str, str]:
+        """Returns the fingerprints of the masks, by mask suffix."""
+        return {
+            suffix: ResourceBuildingController.element_fingerprint(self.sdata, key)
+            for suffix, key in self.mask_keys.items()
+        }
+
+    def stale_masks(self, adata: ad.AnnData) -> List[str]:
+        """
+        Returns the masks that may have changed since the table was written.
+
+        A mask is stale if its fingerprint differs from the one stored with
+        the table, or if the table has columns of the mask but no fingerprint.
+        """
+        stored = adata.uns.get(MASKS_KEY, {})
+        columns = [*adata.var_names, *adata.obs.columns, *adata.obsm.keys()]
+        stale = []
+        for suffix, fingerprint in self.mask_fingerprints().items():
+            if suffix in stored:
+                if stored[suffix] != fingerprint:
+                    stale.append(suffix)
+            elif any(c.endswith(f"_{suffix}") for c in columns):
+                stale.append(suffix)
+        return stale
+
+    def extend_table(
+        self, adata: ad.AnnData, channels: List[str], masks: List[str]
+    ) -> Optional[ad.AnnData]:
+        """
+        Appends the missing columns to an existing table.
+
+        Only the missing channels are quantified, and only with the masks that
+        lack some of their columns; the morphology is measured for the given
+        masks. Returns None if the objects of the masks are not the rows of the
+        table, in which case it has to be rebuilt.
+        """
+        logger.info(
+            f"Extending table '{self.table_name}' with channels {channels} and the morphology of masks {masks}."
+        )
+        mask_keys, all_channels = self.mask_keys, self.channels
+        self.channels = channels
+        self.mask_keys = {
+            suffix: key
+            for suffix, key in mask_keys.items()
+            if suffix in masks
+            or any(
+                f"{ch}_{stat}_{suffix}" not in adata.var_names
+                for ch in channels
+                for stat in self.statistics
+            )
+        }
+        try:
+            if self.mask_keys:
+                self.prepare_masks()
+            obs = self.build_obs(masks) if masks else None
+            if channels:
+                quant_df = self.build_X_and_var().drop(columns="label")
+            else:
+                quant_df = pd.DataFrame(index=pd.Index([], dtype=np.int64))
+        finally:
+            self.mask_keys, self.channels = mask_keys, all_channels
+            self.masks = None
+            self.indexes = None
+            self.tiled = None
+
+        labels = pd.Index(adata.obs["label"].to_numpy().astype(np.int64))
+        found = quant_df.index if obs is None else quant_df.index.union(obs.index)
+        if not found.isin(labels).all():
+            logger.warning(
+                f"Objects of the masks do not match the rows of table '{self.table_name}'; rebuilding it."
+            )
+            return None
+
+        quant_df = quant_df.drop(columns=quant_df.columns.intersection(adata.var_names))
+        quant_df = quant_df.reindex(labels)
+
+        obs_new = adata.obs.copy()
+        obsm = dict(adata.obsm)
+        if obs is not None:
+            obs = obs.drop(columns="label").reindex(labels)
+            # only features missing from the table are added
+            obs = obs.drop(columns=obs.columns.intersection(obs_new.columns))
+            ndims_buckets = self.find_ndims_columns(list(obs.columns))
+            if ndims_buckets:
+                new_obsm, cols_to_drop = self.build_obsm(obs, ndims_buckets)
+                obs = obs.drop(columns=cols_to_drop)
+                obsm.update({k: v for k, v in new_obsm.items() if k not in obsm})
+            obs.index = obs_new.index
+            obs_new = pd.concat([obs_new, obs], axis=1)
+
+        X = np.hstack([np.asarray(adata.X), quant_df.to_numpy()])
+        var = pd.concat([adata.var, pd.DataFrame(index=quant_df.columns)])
+
+        obsp = dict(adata.obsp)
+        missing_graphs = [k for k in self.graph_keys() if k not in obsp]
+        if missing_graphs:
+            obsp.update(self.build_obsp(obs_new, obsm, missing_graphs))
+
+        # layers (e.g. the qc mask) cover the old columns; they are rebuilt
+        extended = ad.AnnData(
+            X=X, obs=obs_new, var=var, obsm=obsm, obsp=obsp, uns=adata.uns
+        )
+        logger.info(
+            f"Appended {quant_df.shape[1]} variables and the morphology of masks {masks} to table '{self.table_name}'."
+        )
+        return extended
+
+    def run(
+        self,
+        spatial_data: sd.SpatialData,
+    ) -> None:
+
+        ########################################################################
+        # Validate inputs and prepare data
+        ########################################################################
+
+        # set data
+        self.sdata = spatial_data
+
+        # Validate masks and channels
+        self.validate_sdata_as_input()
+
+        adata = None
+        stale = None
+        if self.incremental and self.table_name in self.sdata:
+            existing = self.sdata[self.table_name]
+            stale = self.stale_masks(existing)
+        if stale:
+            logger.warning(
+                f"Masks {stale} changed since table '{self.table_name}' was written; rebuilding it."
+            )
+        elif stale is not None:
+            channels, masks = self.find_missing(existing)
+            graphs = [k for k in self.graph_keys() if k not in existing.obsp]
+            if not channels and not masks and not graphs:
+                logger.info(f"Table '{self.table_name}' is up to date.")
+                return
+            adata = self.extend_table(existing, channels, masks)
+
+        if adata is None:
+            # Handle overwiting
+            self.prepare_to_overwrite()
+            adata = self.build_table()
+        else:
+            # the extended table replaces the existing one
+            del self.sdata[self.table_name]
+            self.sdata.delete_element_from_disk(self.table_name)
+
+        # record the masks the table was quantified on
+        adata.uns[MASKS_KEY] = {
+            **adata.uns.get(MASKS_KEY, {}),
+            **self.mask_fingerprints(),
+        }
+
         # add for connectivity
         if self.connect_to_mask:
             adata.obs["region"] = self.connect_to_mask
@@ -0,0 +1,391 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from skimage.measure import regionprops_table
+
+# morphology features computed from the pixel coordinates of the objects with
+# grouped reductions; any other `regionprops` property (e.g. 'solidity',
+# 'perimeter', 'euler_number') is computed per object and has to be requested
+MOMENT_FEATURES = (
+    "area",
+    "centroid",
+    "bbox",
+    "eccentricity",
+    "axis_major_length",
+    "axis_minor_length",
+)
+
+DEFAULT_MORPHOLOGY = ("area", "centroid", "eccentricity")
+
+# the other `regionprops` properties with one value (or a fixed number of
+# values) per object that need no intensity image
+REGIONPROPS_FEATURES = (
+    "area_bbox",
+    "area_convex",
+    "area_filled",
+    "centroid_local",
+    "equivalent_diameter_area",
+    "euler_number",
+    "extent",
+    "feret_diameter_max",
+    "inertia_tensor",
+    "inertia_tensor_eigvals",
+    "moments",
+    "moments_central",
+    "moments_hu",
+    "moments_normalized",
+    "num_pixels",
+    "orientation",
+    "perimeter",
+    "perimeter_crofton",
+    "solidity",
+)
+
+STATISTICS = ("count", "sum", "mean", "std", "min", "max", "median")
+
+# percentiles are requested as e.g. 'p90' or 'p99.5'
+_PERCENTILE = re.compile(r"^p(?P<q>\d+(\.\d+)?)$")
+
+
+def percentile_of(stat: str) -> Optional[float]:
+    """Returns the percentile requested by a statistic name, or None."""
+    m = _PERCENTILE.match(stat)
+    if m is None:
+        return None
+    return float(m.group("q"))
+
+
+def validate_statistics(statistics: Sequence[str]) -> None:
+    """Raises a ValueError for unknown statistics or percentiles above 100."""
+    unknown = [
+        stat
+        for stat in statistics
+        if stat not in STATISTICS
+        and (percentile_of(stat) is None or percentile_of(stat) > 100)
+    ]
+    if unknown:
+        raise ValueError(
+            f"Unknown statistics {unknown}. Available: {list(STATISTICS)} "
+            "and percentiles 'p0' to 'p100' (e.g. 'p90')."
+        )
+
+
+def validate_morphology(properties: Sequence[str]) -> None:
+    """Raises a ValueError for properties `morphology_table` cannot measure."""
+    unknown = [
+        prop
+        for prop in properties
+        if prop not in MOMENT_FEATURES and prop not in REGIONPROPS_FEATURES
+    ]
+    if unknown:
+        raise ValueError(
+            f"Unknown morphology features {unknown}. Available: "
+            f"{sorted(set(MOMENT_FEATURES) | set(REGIONPROPS_FEATURES))}."
+        )
+
+
+def segment_quantile(
+    sorted_values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float
+) -> np.ndarray:
+    """
+    Returns the q-th quantile of every segment of values sorted within segments.
+
+    Uses linear interpolation between the closest ranks, like `np.quantile`,
+    so q=0.5 gives the median.
+    """
+    position = q * (counts - 1)
+    below = np.floor(position).astype(np.int64)
+    above = np.minimum(below + 1, counts - 1)
+    low = sorted_values[starts + below]
+    high = sorted_values[starts + above]
+    return low + (position - below) * (high - low)
+
+
+class LabelIndex:
+    """
+    Pixel index of a label image, grouped by object.
+
+    The foreground pixels are sorted by label once; every object then owns a
+    contiguous segment of the sorted pixels. Per-object statistics of any
+    intensity image are computed with vectorized grouped reductions over
+    these segments, so a label image is scanned once for all channels.
+    """
+
+    def __init__(self, mask: np.ndarray) -> None:
+        """
+        mask: 2D label image, background 0
+        """
+        flat = np.asarray(mask).ravel()
+        foreground = np.flatnonzero(flat)
+        order = np.argsort(flat[foreground], kind="stable")
+
+        self.shape = np.shape(mask)
+        self.pixels = foreground[order]
+        self.labels, self.starts, self.counts = np.unique(
+            flat[self.pixels], return_index=True, return_counts=True
+        )
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def gather(self, img: np.ndarray) -> np.ndarray:
+        """Returns the pixel values of all objects, grouped by label."""
+        if np.shape(img) != self.shape:
+            raise ValueError(
+                f"Image of shape {np.shape(img)} does not match the mask of shape {self.shape}."
+            )
+        return np.asarray(img).ravel()[self.pixels]
+
+    def sort_segments(self, values: np.ndarray) -> np.ndarray:
+        """Sorts ``values`` within the segment of every object."""
+        segment = np.repeat(np.arange(len(self)), self.counts)
+        return values[np.lexsort((values, segment))]
+
+    def segment_quantile(self, sorted_values: np.ndarray, q: float) -> np.ndarray:
+        """
+        Returns the q-th quantile of every object, from values sorted per segment.
+        """
+        return segment_quantile(sorted_values, self.starts, self.counts, q)
+
+    def reduce(
+        self, img: np.ndarray, statistics: Sequence[str] = ("mean",)
+    ) -> Dict[str, np.ndarray]:
+        """
+        Computes per-object statistics of an intensity image.
+
+        statistics: names from `STATISTICS` or percentiles such as 'p90'
+        Returns a dict mapping every statistic to an array aligned with `labels`.
+
+        Medians and percentiles of all objects come from one sort of the pixel
+        values by (label, intensity).
+        """
+        validate_statistics(statistics)
+
+        if len(self) == 0:
+            return {stat: np.empty(0, dtype=np.float64) for stat in statistics}
+
+        values = self.gather(img).astype(np.float64, copy=False)
+
+        result = {}
+        sorted_values = None
+        sums = None
+        if {"sum", "mean", "std"} & set(statistics):
+            sums = np.add.reduceat(values, self.starts)
+        for stat in statistics:
+            if stat == "count":
+                result[stat] = self.counts.astype(np.float64)
+            elif stat == "sum":
+                result[stat] = sums
+            elif stat == "mean":
+                result[stat] = sums / self.counts
+            elif stat == "std":
+                mean = sums / self.counts
+                centered = values - np.repeat(mean, self.counts)
+                result[stat] = np.sqrt(
+                    np.add.reduceat(centered * centered, self.starts) / self.counts
+                )
+            elif stat == "min":
+                result[stat] = np.minimum.reduceat(values, self.starts)
+            elif stat == "max":
+                result[stat] = np.maximum.reduceat(values, self.starts)
+            else:
+                q = 0.5 if stat == "median" else percentile_of(stat) / 100
+                if sorted_values is None:
+                    sorted_values = self.sort_segments(values)
+                result[stat] = self.segment_quantile(sorted_values, q)
+
+        return result
+
+
+def grouped_quantiles(
+    labels: np.ndarray, values: np.ndarray, quantiles: Sequence[float]
+) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Computes quantiles of values grouped by (unsorted) labels.
+
+    Returns the unique labels and one array per quantile aligned with them.
+    """
+    order = np.lexsort((values, labels))
+    unique, starts, counts = np.unique(
+        labels[order], return_index=True, return_counts=True
+    )
+    sorted_values = values[order]
+    return unique, [
+        segment_quantile(sorted_values, starts, counts, q) for q in quantiles
+    ]
+
+
+class PartialStatistics:
+    """
+    Per-object sufficient statistics of one part (e.g. a tile) of an image.
+
+    Parts are merged by label, so the moments of objects crossing tile
+    borders are exact: count, sum and sum of squares add up, min and max
+    combine. Quantiles cannot be merged this way.
+    """
+
+    MOMENTS = ("count", "sum", "mean", "std", "min", "max")
+
+    def __init__(self, labels, count, total, sumsq, minimum, maximum) -> None:
+        self.labels = labels
+        self.count = count
+        self.total = total
+        self.sumsq = sumsq
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def from_index(cls, index: LabelIndex, values: np.ndarray) -> "PartialStatistics":
+        """
+        values: pixel values grouped by label, as returned by `LabelIndex.gather`
+        """
+        if len(index) == 0:
+            empty = np.empty(0, dtype=np.float64)
+            return cls(index.labels, empty, empty, empty, empty, empty)
+        return cls(
+            index.labels,
+            index.counts.astype(np.float64),
+            np.add.reduceat(values, index.starts),
+            np.add.reduceat(values * values, index.starts),
+            np.minimum.reduceat(values, index.starts),
+            np.maximum.reduceat(values, index.starts),
+        )
+
+    @classmethod
+    def merge(cls, parts: Sequence["PartialStatistics"]) -> "PartialStatistics":
+        """Combines the statistics of several parts, by label."""
+        labels, inverse = np.unique(
+            np.concatenate([p.labels for p in parts]), return_inverse=True
+        )
+
+        def combine(attr, ufunc, initial):
+            out = np.full(len(labels), initial, dtype=np.float64)
+            ufunc.at(out, inverse, np.concatenate([getattr(p, attr) for p in parts]))
+            return out
+
+        return cls(
+            labels,
+            combine("count", np.add, 0.0),
+            combine("total", np.add, 0.0),
+            combine("sumsq", np.add, 0.0),
+            combine("minimum", np.minimum, np.inf),
+            combine("maximum", np.maximum, -np.inf),
+        )
+
+    def finalize(self, statistics: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Returns the requested moments, aligned with `labels`."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.total / self.count
+            variance = np.maximum(self.sumsq / self.count - mean * mean, 0.0)
+        available = {
+            "count": self.count,
+            "sum": self.total,
+            "mean": mean,
+            "std": np.sqrt(variance),
+            "min": self.minimum,
+            "max": self.maximum,
+        }
+        return {stat: available[stat] for stat in statistics if stat in available}
+
+
+def feature_columns(feature: str, columns: Sequence[str]) -> List[str]:
+    """Returns the columns of a feature, e.g. 'centroid-0' and 'centroid-1'."""
+    return [c for c in columns if c == feature or c.startswith(f"{feature}-")]
+
+
+def moment_features(
+    index: LabelIndex, features: Sequence[str]
+) -> Dict[str, np.ndarray]:
+    """
+    Computes morphology features of all objects from their pixel coordinates.
+
+    Columns are named as by `regionprops_table` and aligned with
+    `index.labels`; the axes follow the central moments of every object.
+    """
+    rows, cols = np.divmod(index.pixels, index.shape[1])
+    coords = (rows.astype(np.float64), cols.astype(np.float64))
+    counts = index.counts.astype(np.float64)
+
+    result = {}
+    if "area" in features:
+        result["area"] = counts
+    if "bbox" in features:
+        for i, reduce in enumerate((np.minimum, np.maximum)):
+            for axis, c in enumerate(coords):
+                # the bounding box end is exclusive, as in regionprops
+                result[f"bbox-{2 * i + axis}"] = reduce.reduceat(c, index.starts) + i
+
+    if {"centroid", "eccentricity", "axis_major_length", "axis_minor_length"} & set(
+        features
+    ):
+        means = [np.add.reduceat(c, index.starts) / counts for c in coords]
+        if "centroid" in features:
+            result["centroid-0"], result["centroid-1"] = means
+
+        # eigenvalues of the covariance of the pixel coordinates
+        centered = [c - np.repeat(m, index.counts) for c, m in zip(coords, means)]
+        var_r, var_c, cov = (
+            np.add.reduceat(a * b, index.starts) / counts
+            for a, b in (
+                (centered[0], centered[0]),
+                (centered[1], centered[1]),
+                (centered[0], centered[1]),
+            )
+        )
+        half_trace = (var_r + var_c) / 2
+        spread = np.sqrt(((var_r - var_c) / 2) ** 2 + cov**2)
+        major = half_trace + spread
+        minor = np.maximum(half_trace - spread, 0.0)
+
+        if "eccentricity" in features:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result["eccentricity"] = np.where(
+                    major > 0, np.sqrt(1 - minor / np.where(major > 0, major, 1)), 0.0
+                )
+        if "axis_major_length" in features:
+            result["axis_major_length"] = 4 * np.sqrt(major)
+        if "axis_minor_length" in features:
+            result["axis_minor_length"] = 4 * np.sqrt(minor)
+
+    return result
+
+
+def morphology_table(
+    mask: np.ndarray,
+    offset: Tuple[int, int] = (0, 0),
+    properties: Optional[Sequence[str]] = None,
+    index: Optional[LabelIndex] = None,
+) -> pd.DataFrame:
+    """
+    Morphology features of the objects of a mask, indexed by label.
+
+    properties: features to compute (default `DEFAULT_MORPHOLOGY`); those in
+        `MOMENT_FEATURES` are vectorized over all objects, others are passed
+        to `regionprops_table`
+    offset: position of the mask in the full image, added to the centroids and
+        bounding boxes so that tiles and crops give full image coordinates
+    index: a `LabelIndex` of the mask, if already built
+    """
+    properties = [p for p in (properties or DEFAULT_MORPHOLOGY) if p != "label"]
+    if index is None:
+        index = LabelIndex(mask)
+
+    props = pd.DataFrame(
+        moment_features(index, [p for p in properties if p in MOMENT_FEATURES]),
+        index=pd.Index(index.labels.astype(np.int64), name="label"),
+    )
+    costly = [p for p in properties if p not in MOMENT_FEATURES]
+    if costly:
+        measured = pd.DataFrame(regionprops_table(mask, properties=["label", *costly]))
+        props = props.join(measured.set_index("label"))
+
+    props = props[
+        [c for p in properties for c in feature_columns(p, props.columns)]
+    ].copy()
+    for col in props.columns:
+        if col.startswith(("centroid-", "bbox-")):
+            axis = int(col.split("-")[1]) % 2
+            props[col] = props[col] + offset[axis]
+    return props
@@ -0,0 +1,223 @@
+"""Cohort-level columnar store of the quantification tables of all cores."""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import anndata as ad
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+# key in the Parquet schema metadata describing the columns of a core
+METADATA_KEY = b"plex_pipe"
+
+PARTITION_KEY = "core"
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "The feature store needs pyarrow: pip install 'plex_pipe[feature-store]'."
+        ) from e
+    return pa, ds, pq
+
+
+class FeatureStore:
+    """
+    Quantification tables of all cores of a cohort in partitioned Parquet.
+
+    Every table is a directory partitioned by core::
+
+        <root>/<table>/core=<core_id>/part-0.parquet
+
+    with one row per object: the obs columns, the obsm entries as
+    '{key}-{i}' columns, the intensities (var) and the layers as
+    '{layer}:{var}' columns. Writing a core replaces its partition, so
+    re-running a core is idempotent and worker processes quantifying
+    different cores never write the same files.
+
+    Cohort-wide queries read only the requested columns and cores, without
+    opening the SpatialData objects of the cores.
+    """
+
+    def __init__(self, root) -> None:
+        """
+        root: directory of the store, e.g. '<analysis_dir>/feature_store'
+        """
+        self.root = Path(root)
+
+    def table_dir(self, table_name: str) -> Path:
+        return self.root / table_name
+
+    def files(self, table_name: str) -> List[Path]:
+        """Returns the Parquet file of every core of a table."""
+        return sorted(self.table_dir(table_name).glob(f"{PARTITION_KEY}=*/*.parquet"))
+
+    def cores(self, table_name: str) -> List[str]:
+        """Returns the ids of the cores stored for a table."""
+        return [f.parent.name.split("=", 1)[1] for f in self.files(table_name)]
+
+    def write(self, table_name: str, core_id: str, adata: ad.AnnData) -> Path:
+        """
+        Stores the table of one core, replacing an earlier version.
+
+        Returns the path of the written file.
+        """
+        pa, _, pq = _pyarrow()
+
+        var_names = list(adata.var_names)
+        X = adata.X.toarray() if hasattr(adata.X, "toarray") else np.asarray(adata.X)
+
+        columns = {"obs_name": np.asarray(adata.obs_names)}
+        # extension arrays keep categories (e.g. the region)
+        columns.update({c: adata.obs[c].array for c in adata.obs.columns})
+        obsm = {}
+        for key, values in adata.obsm.items():
+            values = np.asarray(values)
+            obsm[key] = values.shape[1]
+            columns.update({f"{key}-{i}": values[:, i] for i in range(values.shape[1])})
+        columns.update({v: X[:, i] for i, v in enumerate(var_names)})
+        for layer, values in adata.layers.items():
+            values = np.asarray(values)
+            columns.update(
+                {f"{layer}:{v}": values[:, i] for i, v in enumerate(var_names)}
+            )
+
+        frame = pd.DataFrame(columns)
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        description = {
+            "obs": list(adata.obs.columns),
+            "obsm": obsm,
+            "var": var_names,
+            "layers": list(adata.layers),
+        }
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), METADATA_KEY: json.dumps(description)}
+        )
+
+        partition = self.table_dir(table_name) / f"{PARTITION_KEY}={core_id}"
+        partition.mkdir(parents=True, exist_ok=True)
+        path = partition / "part-0.parquet"
+        # files starting with '.' are ignored by readers until renamed
+        tmp_path = partition / f".part-0.parquet.{os.getpid()}"
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+        logger.info(
+            f"Table '{table_name}' of core '{core_id}' stored in the feature store ({len(frame)} objects)."
+        )
+        return path
+
+    def remove(self, table_name: str, core_id: str) -> None:
+        """Drops the table of one core from the store."""
+        shutil.rmtree(
+            self.table_dir(table_name) / f"{PARTITION_KEY}={core_id}",
+            ignore_errors=True,
+        )
+
+    def describe(self, table_name: str, cores: Optional[Sequence[str]] = None):
+        """
+        Returns the column descriptions of the cores of a table, by core id.
+        """
+        _, _, pq = _pyarrow()
+        described = {}
+        for path in self.files(table_name):
+            core_id = path.parent.name.split("=", 1)[1]
+            if cores is not None and core_id not in cores:
+                continue
+            metadata = pq.read_schema(path).metadata or {}
+            described[core_id] = json.loads(metadata[METADATA_KEY])
+        return described
+
+    def read(
+        self,
+        table_name: str,
+        columns: Optional[Sequence[str]] = None,
+        cores: Optional[Sequence[str]] = None,
+        where=None,
+    ) -> pd.DataFrame:
+        """
+        Reads a table of several cores into one frame.
+
+        columns: columns to read (default: all); the core id is always read
+            into the 'core' column
+        cores: ids of the cores to read (default: all)
+        where: a `pyarrow.dataset` expression selecting rows, e.g.
+            ``pyarrow.dataset.field('area_cell') > 50``
+        Columns missing from some cores (e.g. channels added later) are null
+        for their objects.
+        """
+        pa, ds, pq = _pyarrow()
+
+        files = self.files(table_name)
+        if cores is not None:
+            files = [f for f in files if f.parent.name.split("=", 1)[1] in cores]
+        if not files:
+            raise ValueError(f"No cores of table '{table_name}' in {self.root}.")
+
+        partitioning = ds.partitioning(
+            pa.schema([(PARTITION_KEY, pa.string())]), flavor="hive"
+        )
+        schema = pa.unify_schemas(
+            [pq.read_schema(f).remove_metadata() for f in files]
+            + [pa.schema([(PARTITION_KEY, pa.string())])]
+        )
+        dataset = ds.dataset(
+            [str(f) for f in files],
+            schema=schema,
+            format="parquet",
+            partitioning=partitioning,
+            partition_base_dir=str(self.table_dir(table_name)),
+        )
+
+        if columns is not None:
+            columns = [PARTITION_KEY, *[c for c in columns if c != PARTITION_KEY]]
+        return dataset.to_table(columns=columns, filter=where).to_pandas()
+
+    def read_anndata(
+        self, table_name: str, cores: Optional[Sequence[str]] = None
+    ) -> ad.AnnData:
+        """
+        Reads a table of several cores into one AnnData object.
+
+        The variables are the union over cores, in order of appearance;
+        objects are named '{core}_{label}' and their core is in obs['core'].
+        """
+        described = self.describe(table_name, cores)
+        if not described:
+            raise ValueError(f"No cores of table '{table_name}' in {self.root}.")
+
+        def union(key):
+            return list(dict.fromkeys(c for d in described.values() for c in d[key]))
+
+        var_names = union("var")
+        obs_columns = union("obs")
+        layers = union("layers")
+        obsm = {k: n for d in described.values() for k, n in d["obsm"].items()}
+
+        frame = self.read(table_name, cores=list(described))
+
+        X = frame.reindex(columns=var_names).to_numpy(dtype=np.float64)
+        obs = frame.reindex(columns=[PARTITION_KEY, *obs_columns])
+        obs.index = (frame[PARTITION_KEY] + "_" + frame["obs_name"]).to_numpy()
+        adata = ad.AnnData(
+            X=X,
+            obs=obs,
+            var=pd.DataFrame(index=var_names),
+            obsm={
+                k: frame.reindex(columns=[f"{k}-{i}" for i in range(n)]).to_numpy()
+                for k, n in obsm.items()
+            },
+        )
+        for layer in layers:
+            adata.layers[layer] = frame.reindex(
+                columns=[f"{layer}:{v}" for v in var_names]
+            ).to_numpy()
+        return adata
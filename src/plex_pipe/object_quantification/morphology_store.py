@@ -0,0 +1,85 @@
+"""Morphology features of the masks of a core, shared by all tables."""
+
+from typing import Optional
+
+import anndata as ad
+import numpy as np
+import pandas as pd
+import spatialdata as sd
+from loguru import logger
+from spatialdata.models import TableModel
+
+from plex_pipe.processors.controller import ResourceBuildingController
+
+# key in the `uns` of a morphology table recording the mask it describes
+MORPHOLOGY_KEY = "plex_pipe_morphology"
+
+
+def morphology_table_name(mask_key: str) -> str:
+    """Name of the table element holding the morphology of a mask."""
+    return f"{mask_key}_morphology"
+
+
+def load_morphology(sdata: sd.SpatialData, mask_key: str) -> Optional[pd.DataFrame]:
+    """
+    Returns the stored morphology features of a mask, indexed by label.
+
+    Returns None if no features are stored, or if they were measured on an
+    earlier version of the mask.
+    """
+    name = morphology_table_name(mask_key)
+    if name not in sdata:
+        return None
+
+    adata = sdata[name]
+    stored = adata.uns.get(MORPHOLOGY_KEY, {}).get("fingerprint")
+    if stored != ResourceBuildingController.element_fingerprint(sdata, mask_key):
+        logger.info(f"Stored morphology of mask '{mask_key}' is outdated.")
+        return None
+
+    return pd.DataFrame(
+        np.asarray(adata.X),
+        index=pd.Index(adata.obs_names.astype(np.int64), name="label"),
+        columns=list(adata.var_names),
+    )
+
+
+def save_morphology(
+    sdata: sd.SpatialData, mask_key: str, table: pd.DataFrame, persist: bool = True
+) -> pd.DataFrame:
+    """
+    Adds morphology features of a mask to the store.
+
+    Features already stored for the current mask are kept; the table is
+    written next to the labels if the sdata is backed and persist is True.
+    Returns all stored features.
+    """
+    name = morphology_table_name(mask_key)
+    stored = load_morphology(sdata, mask_key)
+    if stored is not None:
+        new_columns = [c for c in table.columns if c not in stored.columns]
+        table = stored.join(table[new_columns], how="outer")
+
+    adata = ad.AnnData(
+        X=table.to_numpy(dtype=np.float64),
+        obs=pd.DataFrame(index=table.index.astype(str)),
+        var=pd.DataFrame(index=list(table.columns)),
+    )
+    adata.uns[MORPHOLOGY_KEY] = {
+        "mask": mask_key,
+        "fingerprint": ResourceBuildingController.element_fingerprint(sdata, mask_key),
+    }
+    adata = TableModel.parse(adata, overwrite_metadata=True)
+
+    on_disk = sdata.is_backed() and f"tables/{name}" in sdata.elements_paths_on_disk()
+    if name in sdata:
+        del sdata[name]
+    if on_disk and persist:
+        sdata.delete_element_from_disk(name)
+    sdata[name] = adata
+
+    if persist and sdata.is_backed():
+        sdata.write_element(name)
+        logger.info(f"Morphology of mask '{mask_key}' stored as table '{name}'.")
+
+    return table
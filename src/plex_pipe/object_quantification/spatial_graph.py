@@ -0,0 +1,138 @@
+"""Spatial neighbour graphs of the objects of a quantification table."""
+
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+
+def _valid_points(coords: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # objects missing from the mask of the graph have no centroid
+    coords = np.asarray(coords, dtype=np.float64)
+    rows = np.flatnonzero(~np.isnan(coords).any(axis=1))
+    return coords[rows], rows
+
+
+def radius_graph(coords: np.ndarray, radius: float) -> sparse.csr_matrix:
+    """
+    Connects all pairs of objects closer than a radius.
+
+    coords: (n, 2) centroids, NaN for objects left out of the graph
+    Returns a symmetric (n, n) matrix of the distances between neighbours.
+    """
+    n = len(coords)
+    points, rows = _valid_points(coords)
+    pairs = cKDTree(points).query_pairs(radius, output_type="ndarray")
+
+    distances = np.linalg.norm(points[pairs[:, 0]] - points[pairs[:, 1]], axis=1)
+    i, j = rows[pairs[:, 0]], rows[pairs[:, 1]]
+    return sparse.csr_matrix(
+        (np.concatenate([distances, distances]), (np.r_[i, j], np.r_[j, i])),
+        shape=(n, n),
+    )
+
+
+def knn_graph(coords: np.ndarray, k: int) -> sparse.csr_matrix:
+    """
+    Connects every object to its k nearest neighbours.
+
+    coords: (n, 2) centroids, NaN for objects left out of the graph
+    Returns an (n, n) matrix of the distances from every object (row) to its
+    neighbours (columns); it is not symmetric.
+    """
+    n = len(coords)
+    points, rows = _valid_points(coords)
+    m = len(points)
+    if m < 2:
+        return sparse.csr_matrix((n, n), dtype=np.float64)
+
+    distances, neighbours = cKDTree(points).query(points, k=min(k, m - 1) + 1)
+
+    # drop every object from its own neighbours; with duplicate points it
+    # may not come first, then the farthest neighbour is dropped instead
+    own = neighbours == np.arange(m)[:, None]
+    own[~own.any(axis=1), -1] = True
+    keep = ~own
+
+    source = np.repeat(np.arange(m), keep.sum(axis=1))
+    return sparse.csr_matrix(
+        (distances[keep], (rows[source], rows[neighbours[keep]])), shape=(n, n)
+    )
+
+
+def contact_pairs(
+    mask: np.ndarray, height: Optional[int] = None, width: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Finds the pairs of touching objects of a label image.
+
+    Pixels of different objects sharing an edge (4-connectivity) are in
+    contact. Only pixel pairs starting in ``mask[:height, :width]`` are
+    counted, so tiles read with one extra row and column count every pair
+    once.
+
+    Returns the labels a < b of every pair and the number of pixel edges
+    they share (their border length).
+    """
+    mask = np.asarray(mask)
+    height = mask.shape[0] if height is None else height
+    width = mask.shape[1] if width is None else width
+
+    firsts, seconds = [], []
+    # right and lower neighbours of every pixel
+    for first, second in (
+        (mask[:height, : mask.shape[1] - 1][:, :width], mask[:height, 1:][:, :width]),
+        (mask[: mask.shape[0] - 1, :width][:height], mask[1:, :width][:height]),
+    ):
+        touching = (first != second) & (first > 0) & (second > 0)
+        firsts.append(first[touching])
+        seconds.append(second[touching])
+
+    first = np.concatenate(firsts).astype(np.int64)
+    second = np.concatenate(seconds).astype(np.int64)
+    a, b = np.minimum(first, second), np.maximum(first, second)
+    return merge_contacts(a, b, np.ones(len(a), dtype=np.int64))
+
+
+def merge_contacts(
+    a: np.ndarray, b: np.ndarray, lengths: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sums the border lengths of repeated label pairs."""
+    if len(a) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    key = a * (int(b.max()) + 1) + b
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    return a[first], b[first], np.bincount(inverse, weights=lengths).astype(np.int64)
+
+
+def contact_graph(
+    labels: np.ndarray, a: np.ndarray, b: np.ndarray, lengths: np.ndarray
+) -> sparse.csr_matrix:
+    """
+    Builds the adjacency matrix of touching objects.
+
+    labels: the label of every row of the table
+    a, b, lengths: contact pairs, as returned by `contact_pairs`
+    Returns a symmetric (n, n) matrix of the border lengths between objects.
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    n = len(labels)
+    if n == 0:
+        return sparse.csr_matrix((0, 0), dtype=np.float64)
+
+    order = np.argsort(labels)
+    sorted_labels = labels[order]
+
+    def rows_of(values):
+        pos = np.minimum(np.searchsorted(sorted_labels, values), n - 1)
+        return order[pos], sorted_labels[pos] == values
+
+    i, found_a = rows_of(a)
+    j, found_b = rows_of(b)
+    keep = found_a & found_b
+    i, j, lengths = i[keep], j[keep], lengths[keep].astype(np.float64)
+    return sparse.csr_matrix(
+        (np.r_[lengths, lengths], (np.r_[i, j], np.r_[j, i])), shape=(n, n)
+    )
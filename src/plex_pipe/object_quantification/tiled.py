@@ -0,0 +1,236 @@
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import dask.array as da
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from plex_pipe.object_quantification.engine import (
+    DEFAULT_MORPHOLOGY,
+    LabelIndex,
+    PartialStatistics,
+    grouped_quantiles,
+    morphology_table,
+    percentile_of,
+)
+from plex_pipe.object_quantification.spatial_graph import (
+    contact_pairs,
+    merge_contacts,
+)
+
+Tile = Tuple[slice, slice]
+
+
+def tile_grid(shape: Tuple[int, int], tile_size: int) -> List[Tile]:
+    """Returns the slices of non-overlapping tiles covering an image."""
+    return [
+        (slice(y, min(y + tile_size, shape[0])), slice(x, min(x + tile_size, shape[1])))
+        for y in range(0, shape[0], tile_size)
+        for x in range(0, shape[1], tile_size)
+    ]
+
+
+def tiled_contact_pairs(
+    mask: da.Array, tile_size: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Finds the touching objects of a lazy label image, tile by tile.
+
+    Every tile is read with one extra row and column, so contacts across tile
+    borders are found; see `contact_pairs`.
+    """
+    parts = []
+    for rows, cols in tile_grid(mask.shape, tile_size):
+        tile = np.asarray(mask[rows.start : rows.stop + 1, cols.start : cols.stop + 1])
+        parts.append(
+            contact_pairs(tile, rows.stop - rows.start, cols.stop - cols.start)
+        )
+    a, b, lengths = (np.concatenate(arrays) for arrays in zip(*parts))
+    return merge_contacts(a, b, lengths)
+
+
+class TiledQuantifier:
+    """
+    Quantifies objects tile by tile, without loading full masks or channels.
+
+    A first pass over the masks finds the objects spread over several tiles.
+    All other objects lie within one tile and are quantified there. For the
+    spread objects:
+
+    - intensity moments are merged from per-tile `PartialStatistics`,
+    - quantiles are computed from their pixel values collected over tiles,
+    - morphology is computed on a crop of their bounding box.
+
+    The results match a whole-image quantification; only the standard
+    deviation of spread objects is computed from merged moments and may
+    differ in the last digits.
+    """
+
+    def __init__(
+        self,
+        masks: Dict[str, da.Array],
+        tile_size: int,
+        statistics: Sequence[str] = ("mean", "median"),
+        morphology: Sequence[str] = DEFAULT_MORPHOLOGY,
+    ) -> None:
+        """
+        masks: lazy 2D label images by mask suffix, all of the same shape
+        tile_size: edge length of the square tiles in pixels
+        morphology: morphology features measured in `scan_masks`
+        """
+        shapes = {mask.shape for mask in masks.values()}
+        if len(shapes) != 1:
+            raise ValueError(
+                f"Masks for tiled quantification must have the same shape, got {shapes}."
+            )
+
+        self.masks = masks
+        self.shape = shapes.pop()
+        self.tiles = tile_grid(self.shape, tile_size)
+        self.statistics = list(statistics)
+        self.morphology_features = list(morphology)
+
+        self.spread: Dict[str, np.ndarray] = {}
+        self.morphology: Dict[str, pd.DataFrame] = {}
+
+    @staticmethod
+    def read(arr: da.Array, tile: Tile) -> np.ndarray:
+        return np.asarray(arr[tile])
+
+    def scan_masks(self) -> None:
+        """
+        Finds the objects spread over several tiles and computes morphology.
+        """
+        properties = list(dict.fromkeys([*self.morphology_features, "bbox"]))
+
+        for suffix, mask in self.masks.items():
+            logger.info(
+                f"Scanning mask '{suffix}' in {len(self.tiles)} tile(s) for morphology."
+            )
+            tables = [
+                morphology_table(
+                    self.read(mask, tile),
+                    offset=(tile[0].start, tile[1].start),
+                    properties=properties,
+                )
+                for tile in self.tiles
+            ]
+            table = pd.concat(tables)
+
+            labels, n_tiles = np.unique(table.index.to_numpy(), return_counts=True)
+            spread = labels[n_tiles > 1]
+            self.spread[suffix] = spread
+
+            single = table.loc[~table.index.isin(spread)]
+            crops = [
+                self.crop_morphology(mask, label, boxes, properties)
+                for label, boxes in table.loc[table.index.isin(spread)].groupby(level=0)
+            ]
+            table = pd.concat([single, *crops]).sort_index()
+            if "bbox" not in self.morphology_features:
+                table = table.drop(
+                    columns=[c for c in table.columns if c.startswith("bbox-")]
+                )
+            self.morphology[suffix] = table
+
+    @staticmethod
+    def crop_morphology(
+        mask: da.Array, label: int, boxes: pd.DataFrame, properties: List[str]
+    ) -> pd.DataFrame:
+        # union of the bounding boxes of the object's pieces in all tiles
+        y0, x0 = int(boxes["bbox-0"].min()), int(boxes["bbox-1"].min())
+        y1, x1 = int(boxes["bbox-2"].max()), int(boxes["bbox-3"].max())
+        crop = np.asarray(mask[y0:y1, x0:x1])
+        crop = np.where(crop == label, crop, 0)
+        return morphology_table(crop, offset=(y0, x0), properties=properties)
+
+    def quantify(
+        self, channels: Dict[str, Callable[[Tile], np.ndarray]]
+    ) -> List[pd.DataFrame]:
+        """
+        Computes the intensity statistics of every channel and mask.
+
+        channels: functions reading a tile of every channel, by channel name
+        Returns one frame per channel and mask, in channel order, with columns
+        named '{ch}_{stat}_{mask}'.
+        """
+        quantiles = {
+            stat: 0.5 if stat == "median" else percentile_of(stat) / 100
+            for stat in self.statistics
+            if stat not in PartialStatistics.MOMENTS
+        }
+        keys = [(ch, suffix) for ch in channels for suffix in self.masks]
+        parts = {key: [] for key in keys}
+        # quantiles of objects within one tile, and pixels of spread objects
+        local = {key: [] for key in keys}
+        pooled = {key: [] for key in keys}
+
+        for i, tile in enumerate(self.tiles):
+            logger.info(f"Quantifying tile {i + 1}/{len(self.tiles)}.")
+            indexes = {
+                suffix: LabelIndex(self.read(mask, tile))
+                for suffix, mask in self.masks.items()
+            }
+            for ch, read_channel in channels.items():
+                img = read_channel(tile)
+                for suffix, index in indexes.items():
+                    values = index.gather(img).astype(np.float64, copy=False)
+                    parts[ch, suffix].append(
+                        PartialStatistics.from_index(index, values)
+                    )
+                    if not quantiles or len(index) == 0:
+                        continue
+
+                    spread = np.isin(index.labels, self.spread[suffix])
+                    sorted_values = index.sort_segments(values)
+                    local[ch, suffix].append(
+                        pd.DataFrame(
+                            {
+                                stat: index.segment_quantile(sorted_values, q)[~spread]
+                                for stat, q in quantiles.items()
+                            },
+                            index=index.labels[~spread],
+                        )
+                    )
+                    pixel_spread = np.repeat(spread, index.counts)
+                    pooled[ch, suffix].append(
+                        (
+                            np.repeat(index.labels, index.counts)[pixel_spread],
+                            values[pixel_spread],
+                        )
+                    )
+
+        quant_dfs = []
+        for ch, suffix in keys:
+            merged = PartialStatistics.merge(parts[ch, suffix])
+            columns = merged.finalize(self.statistics)
+            if quantiles:
+                frames = local[ch, suffix]
+                labels = np.concatenate(
+                    [lab for lab, _ in pooled[ch, suffix]] or [np.empty(0)]
+                )
+                if len(labels):
+                    values = np.concatenate([val for _, val in pooled[ch, suffix]])
+                    unique, results = grouped_quantiles(
+                        labels, values, list(quantiles.values())
+                    )
+                    frames.append(
+                        pd.DataFrame(dict(zip(quantiles, results)), index=unique)
+                    )
+                table = (
+                    pd.concat(frames) if frames else pd.DataFrame(columns=[*quantiles])
+                )
+                table = table.reindex(merged.labels)
+                columns.update({stat: table[stat].to_numpy() for stat in quantiles})
+
+            quant_dfs.append(
+                pd.DataFrame(
+                    {
+                        f"{ch}_{stat}_{suffix}": columns[stat]
+                        for stat in self.statistics
+                    },
+                    index=pd.Index(merged.labels.astype(np.int64), name="label"),
+                )
+            )
+
+        return quant_dfs
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from enum import Enum
 from typing import (
     Any,
@@ -30,6 +31,40 @@ class OutputType(str, Enum):
     LABELS = "labels"
 
 
+@dataclass(frozen=True)
+class ProcessorCapabilities:
+    """Describes how an operation can be executed.
+
+    Schedulers and controllers use it to size concurrency and to choose
+    between tiled and whole-image execution.
+
+    Attributes:
+        tileable: Whether the operation can be run independently on
+            overlapping tiles of its inputs.
+        halo: The tile overlap (in pixels) needed by a tileable operation.
+            None if it depends on the parameters of the operation.
+        tile_multiple: The size (in pixels) that tile offsets have to be a
+            multiple of for exact tiled results. None if it depends on the
+            parameters of the operation.
+        in_place_safe: Whether the operation leaves its inputs untouched, so
+            it can be given shared, read-only arrays.
+        memory_multiplier: The estimated peak memory of a run as a multiple of
+            the size of its inputs.
+        thread_safe: Whether the operation can run concurrently with other
+            operations of its kind in the same process.
+        gpu_optional: Whether the operation can use a GPU but also runs on the
+            CPU.
+    """
+
+    tileable: bool = False
+    halo: int | None = 0
+    tile_multiple: int | None = 1
+    in_place_safe: bool = True
+    memory_multiplier: float = 2.0
+    thread_safe: bool = True
+    gpu_optional: bool = False
+
+
 class ProcessorParamsBase(BaseModel):
     """
     A base model for processor parameters that logs a warning for any
@@ -73,6 +108,19 @@ class BaseOp(ABC):
         EXPECTED_OUTPUTS: The number of expected outputs for the operation. If
             None, a variable number of outputs is allowed.
         OUTPUT_TYPE: The type of output produced by the operation.
+        TILEABLE: Whether the operation gives the same result when it is run
+            independently on overlapping tiles of its inputs. Tileable
+            operations can be executed chunk-wise by the controller without
+            loading the full inputs into memory.
+        IN_PLACE_SAFE: Whether the operation leaves its inputs untouched.
+        MEMORY_MULTIPLIER: The estimated peak memory of a run as a multiple of
+            the size of its inputs.
+        THREAD_SAFE: Whether the operation can run concurrently with other
+            operations of its kind in the same process.
+        GPU_OPTIONAL: Whether the operation can use a GPU but also runs on
+            the CPU.
+        output_chunks: The spatial chunk size of lazy outputs. Set by the
+            controller running the operation; None uses dask's default.
         cfg: A dictionary containing the configuration for the operation.
     """
 
@@ -81,6 +129,12 @@ class BaseOp(ABC):
     EXPECTED_INPUTS: int | None = None
     EXPECTED_OUTPUTS: int | None = None
     OUTPUT_TYPE: OutputType
+    TILEABLE: bool = False
+    IN_PLACE_SAFE: bool = True
+    MEMORY_MULTIPLIER: float = 2.0
+    THREAD_SAFE: bool = True
+    GPU_OPTIONAL: bool = False
+    output_chunks: Tuple[int, int] | None = None
 
     class _NoParamsModel(BaseModel):
         model_config = ConfigDict(extra="forbid")
@@ -183,6 +237,80 @@ class BaseOp(ABC):
 
         return in_list, out_list
 
+    def halo(self) -> int:
+        """Returns the tile overlap (in pixels) needed by a tileable operation.
+
+        The halo is the distance over which a pixel of the output depends on
+        its neighbourhood in the inputs. Operations that only combine pixels
+        at the same position use the default of 0.
+
+        Returns:
+            The number of pixels each tile has to be extended by on every side.
+        """
+        return 0
+
+    def tile_multiple(self) -> int:
+        """Returns the size (in pixels) tile offsets have to be a multiple of.
+
+        Operations that work on a reduced grid (e.g. blocks of pixels) only
+        give the whole-image result on tiles aligned to that grid. Other
+        operations use the default of 1.
+
+        Returns:
+            The alignment of tiles along both axes.
+        """
+        return 1
+
+    def label_bound(self, input_maxima: Sequence[int | None]) -> int | None:
+        """Returns an upper bound of the labels the operation can output.
+
+        Operations that only keep, remove or combine the labels of their
+        inputs know the bound without looking at their outputs, which spares
+        the controller a pass over lazy outputs to find their storage dtype.
+
+        Args:
+            input_maxima: The largest value of every input, None if unknown.
+
+        Returns:
+            The bound, or None if the outputs have to be inspected.
+        """
+        return None
+
+    @classmethod
+    def declared_capabilities(cls) -> ProcessorCapabilities:
+        """Returns the capabilities declared by the class.
+
+        The halo is None if the class computes it from its parameters.
+
+        Returns:
+            The capabilities of the operation, independent of its parameters.
+        """
+        return ProcessorCapabilities(
+            tileable=cls.TILEABLE,
+            halo=0 if cls.halo is BaseOp.halo else None,
+            tile_multiple=1 if cls.tile_multiple is BaseOp.tile_multiple else None,
+            in_place_safe=cls.IN_PLACE_SAFE,
+            memory_multiplier=cls.MEMORY_MULTIPLIER,
+            thread_safe=cls.THREAD_SAFE,
+            gpu_optional=cls.GPU_OPTIONAL,
+        )
+
+    def capabilities(self) -> ProcessorCapabilities:
+        """Returns the capabilities of this configured operation.
+
+        Returns:
+            The capabilities, with the halo resolved from the parameters.
+        """
+        return ProcessorCapabilities(
+            tileable=self.TILEABLE,
+            halo=self.halo() if self.TILEABLE else 0,
+            tile_multiple=self.tile_multiple() if self.TILEABLE else 1,
+            in_place_safe=self.IN_PLACE_SAFE,
+            memory_multiplier=self.MEMORY_MULTIPLIER,
+            thread_safe=self.THREAD_SAFE,
+            gpu_optional=self.GPU_OPTIONAL,
+        )
+
     @abstractmethod
     def run(self, *sources: Any) -> Any:
         """Executes the operation on the given source(s).
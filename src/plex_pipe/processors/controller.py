@@ -1,12 +1,37 @@
-from typing import Optional, Sequence, Union
-
+import copy
+import hashlib
+import json
+import os
+from importlib.metadata import PackageNotFoundError, version
+from typing import List, Optional, Sequence, Tuple, Union
+
+import dask
+import dask.array as da
 import numpy as np
 import spatialdata as sd
 from loguru import logger
-from skimage.transform import resize
 from spatialdata.models import Image2DModel, Labels2DModel
 
 from plex_pipe.processors.base import BaseOp
+from plex_pipe.utils.element_cache import ElementCache
+from plex_pipe.utils.im_utils import (
+    QUANTIZATION_KEY,
+    compact_labels,
+    dequantize_image,
+    quantize_image,
+    upscale_nearest,
+)
+
+# key in `SpatialData.attrs` mapping element names to the fingerprint of the
+# step that produced them
+PROVENANCE_KEY = "plex_pipe_provenance"
+
+
+def package_version() -> str:
+    try:
+        return version("plex_pipe")
+    except PackageNotFoundError:
+        return "unknown"
 
 
 class ResourceBuildingController:
@@ -16,6 +41,25 @@ class ResourceBuildingController:
     manages input validation, fetching data from the correct resolution,
     handling overwrites, executing the operation, and saving the results back
     into the SpatialData object.
+
+    Builders that declare themselves as `TILEABLE` are executed lazily over
+    the dask chunks of their inputs (extended by the builder's halo), so the
+    full inputs are never loaded into memory. All other builders receive
+    the complete inputs as numpy arrays. With a `memory_limit`, tileable
+    builders whose estimated memory use (see `BaseOp.capabilities`) fits
+    the limit are run on the whole image instead, avoiding the overhead of
+    overlapping tiles.
+
+    Every output is stamped with a fingerprint of the step: the fingerprints
+    of its inputs, the builder kind, type and validated parameters, the
+    package version and the storage settings. A step whose outputs carry
+    the current fingerprint is skipped and the existing elements are
+    reused, so changing one parameter only recomputes the affected steps.
+
+    Outputs are stored compactly: labels in the smallest unsigned dtype that
+    fits them (optionally renumbered sequentially) and, if requested, kept
+    float images quantized. Quantized inputs are restored to float32 when
+    read.
     """
 
     def __init__(
@@ -29,6 +73,13 @@ class ResourceBuildingController:
         pyramid_levels: int = 1,
         downscale: int = 2,
         chunk_size: Optional[Sequence[int]] = None,
+        tiled: bool = True,
+        reuse_outputs: bool = True,
+        cache: Optional[ElementCache] = None,
+        memory_limit: Optional[int] = None,
+        label_dtype: str = "smallest",
+        relabel_sequential: bool = False,
+        image_dtype: str = "float32",
     ) -> None:
         """Initializes the ResourceBuildingController.
 
@@ -41,10 +92,34 @@ class ResourceBuildingController:
             overwrite: Whether to overwrite existing elements with the same name.
             pyramid_levels: The number of pyramid levels for the output.
             downscale: The downscaling factor between pyramid levels.
-            chunk_size: The chunk size for the output Dask array.
+            chunk_size: The chunk size for the output Dask array. Its spatial
+                part is also used as the tile size for tiled execution.
+            tiled: Whether to run tileable builders chunk-wise. If False,
+                every builder receives the full inputs in memory.
+            reuse_outputs: Whether to skip the step if its outputs were
+                produced from the same inputs with the same settings.
+            cache: An element cache shared with other controllers, so inputs
+                are decoded from disk once per core.
+            memory_limit: The memory in bytes a tileable builder may use on
+                the whole image. If None, tileable builders are always tiled.
+            label_dtype: "smallest" to store labels in the smallest unsigned
+                dtype that fits them, "int32" to always use int32.
+            relabel_sequential: Whether to renumber output labels 1..n. All
+                outputs of the step share one lookup table. Only allowed for
+                segmenters: masks derived by other steps would lose the
+                label IDs they share with their sources.
+            image_dtype: The dtype of kept float images: "float32",
+                "float16" or "uint16" (scaled to the value range).
         """
 
-        self.builder = builder
+        if relabel_sequential and getattr(builder, "kind", None) == "mask_builder":
+            raise ValueError(
+                "Masks derived by a mask builder cannot be relabelled; they "
+                "must keep the label IDs of the masks they are built from."
+            )
+
+        # a private copy, as the builder may be shared with other controllers
+        self.builder = copy.copy(builder)
         self.input_names = input_names
         self.output_names = output_names
         self.resolution_level = resolution_level
@@ -52,9 +127,17 @@ class ResourceBuildingController:
         self.pyramid_levels = pyramid_levels
         self.downscale = downscale
         self.chunk_size = list(chunk_size) if chunk_size else [1, 512, 512]
+        self.builder.output_chunks = tuple(self.chunk_size[-2:])
 
         self.keep = keep
         self.overwrite = overwrite
+        self.tiled = tiled
+        self.reuse_outputs = reuse_outputs
+        self.cache = cache
+        self.memory_limit = memory_limit
+        self.label_dtype = label_dtype
+        self.relabel_sequential = relabel_sequential
+        self.image_dtype = image_dtype
 
     def validate_elements_present(self, sdata):
         """Checks if all specified input elements exist in the sdata object.
@@ -113,34 +196,256 @@ class ResourceBuildingController:
                         f"Mask name '{out_name}' already exists and will be overwritten."
                     )
                     del sdata[out_name]
+                    self.invalidate_cache(sdata, out_name)
                     logger.info(f"Existing element '{out_name}' deleted from sdata.")
-                    if out_name in [
+                    if sdata.is_backed() and out_name in [
                         x.split("/")[-1] for x in sdata.elements_paths_on_disk()
                     ]:
                         sdata.delete_element_from_disk(out_name)
                         logger.info(f"Existing element '{out_name}' deleted from disk.")
 
-    def bring_to_max_resolution(self, el):
+    def get_source(self, sdata, name):
+        """Loads an input element into memory at the requested resolution.
+
+        Args:
+            sdata: The SpatialData object holding the element.
+            name: The name of the element.
+
+        Returns:
+            The squeezed numpy array. Cached arrays are shared and read-only;
+            builders that are not in-place safe receive a copy.
+        """
+        if self.cache is not None:
+            arr = self.cache.get(
+                sdata,
+                name,
+                self.resolution_level,
+                loader=lambda: self.read_source(sdata, name),
+            )
+            if not self.builder.capabilities().in_place_safe:
+                arr = arr.copy()
+            return arr
+
+        return self.read_source(sdata, name)
+
+    def read_source(self, sdata, name):
+        """Reads an input element from the sdata, restoring quantized values."""
+        arr = np.array(
+            sd.get_pyramid_levels(sdata[name], n=self.resolution_level)
+        ).squeeze()
+        return dequantize_image(arr, self.get_quantization(sdata).get(name))
+
+    def invalidate_cache(self, sdata, name):
+        """Drops an element from the cache after it has been replaced."""
+        if self.cache is not None:
+            self.cache.invalidate(sdata, name)
+
+    def get_lazy_source(self, sdata, name):
+        """Returns an input element as a dask array chunked into tiles.
+
+        Args:
+            sdata: The SpatialData object holding the element.
+            name: The name of the element.
+
+        Returns:
+            The squeezed dask array, rechunked to the controller's tile size.
+            The tile size is rounded up to the alignment the builder needs.
+        """
+        level = sd.get_pyramid_levels(sdata[name], n=self.resolution_level)
+        arr = da.asarray(getattr(level, "data", level)).squeeze()
+        arr = dequantize_image(arr, self.get_quantization(sdata).get(name))
+        multiple = self.builder.capabilities().tile_multiple
+        chunks = [-(-c // multiple) * multiple for c in self.chunk_size[-arr.ndim :]]
+        return arr.rechunk(tuple(chunks))
+
+    def estimate_memory(self, sdata, tiled: Optional[bool] = None) -> int:
+        """Estimates the peak memory of running the builder on the sdata.
+
+        The size of the inputs (or of one tile of every input, extended by
+        the halo) is scaled by the builder's memory multiplier.
+
+        Args:
+            sdata: The SpatialData object holding the inputs.
+            tiled: Whether to estimate a tiled run. If None, it is decided by
+                `use_tiling`.
+
+        Returns:
+            The estimate in bytes, or 0 if an input is missing.
+        """
+        if any(name not in sdata for name in self.input_names):
+            return 0
+
+        capabilities = self.builder.capabilities()
+        sources = [self.get_lazy_source(sdata, ch) for ch in self.input_names]
+        if tiled is None:
+            tiled = self.use_tiling(sdata)
+
+        if tiled:
+            halo = capabilities.halo or 0
+            nbytes = sum(
+                int(np.prod([c + 2 * halo for c in src.chunksize])) * src.dtype.itemsize
+                for src in sources
+            )
+        else:
+            nbytes = sum(src.nbytes for src in sources)
+
+        return int(capabilities.memory_multiplier * nbytes)
+
+    def use_tiling(self, sdata) -> bool:
+        """Decides whether the builder is run tile by tile.
+
+        Args:
+            sdata: The SpatialData object holding the inputs.
+
+        Returns:
+            True if tiled execution is enabled, supported by the builder and
+            all inputs are 2D arrays of the same shape, unless the whole-image
+            run fits the memory limit.
+        """
+        if not (self.tiled and self.builder.capabilities().tileable):
+            return False
+
+        shapes = {self.get_lazy_source(sdata, ch).shape for ch in self.input_names}
+        if len(shapes) != 1 or len(next(iter(shapes))) != 2:
+            logger.info(
+                f"Inputs of '{self.builder.type_name}' are not 2D arrays of one shape. "
+                "Falling back to in-memory execution."
+            )
+            return False
+
+        if self.memory_limit is not None:
+            estimate = self.estimate_memory(sdata, tiled=False)
+            if estimate <= self.memory_limit:
+                logger.info(
+                    f"'{self.builder.type_name}' needs about {estimate / 1e9:.2f} GB on the "
+                    "whole image; running it without tiling."
+                )
+                return False
+
+        return True
+
+    @staticmethod
+    def merge_small_chunks(chunks: Sequence[int], size: int) -> Tuple[int, ...]:
+        """Merges chunks along one axis until each one has at least `size` elements.
+
+        Args:
+            chunks: The chunk sizes along the axis.
+            size: The minimum size of a chunk.
+
+        Returns:
+            The merged chunk sizes. A single chunk is kept even if it is smaller.
+        """
+        merged = []
+        for chunk in chunks:
+            if merged and merged[-1] < size:
+                merged[-1] += chunk
+            else:
+                merged.append(chunk)
+        if len(merged) > 1 and merged[-1] < size:
+            last = merged.pop()
+            merged[-1] += last
+        return tuple(merged)
+
+    def run_tiled(self, sources: Sequence[da.Array]) -> List[da.Array]:
+        """Builds lazy outputs by mapping the builder over overlapping tiles.
+
+        Each tile is extended by the builder's halo on every side; the halo is
+        trimmed from the result, so the output matches a whole-image run. The
+        builder runs once per tile: its outputs are stacked along a new first
+        axis, which is sliced into one array per output.
+
+        Args:
+            sources: The lazy input arrays, chunked into tiles.
+
+        Returns:
+            A list with one lazy dask array per output of the builder.
+        """
+        halo = self.builder.capabilities().halo
+
+        # run the builder on a small dummy tile to learn the output dtypes
+        probe_shape = (2 * halo + 2, 2 * halo + 2)
+        probe = self.builder.run(
+            *[np.zeros(probe_shape, dtype=src.dtype) for src in sources]
+        )
+        probes = list(probe) if isinstance(probe, (list, tuple)) else [probe]
+        dtypes = [np.asarray(out_probe).dtype for out_probe in probes]
+        stacked_dtype = np.result_type(*dtypes)
+
+        # blocks may be chunks of elements held in memory
+        copy_blocks = not self.builder.capabilities().in_place_safe
+
+        # a tile has to be as large as the halo it lends to its neighbours;
+        # small tiles are merged, so tile offsets stay offsets of the chunks
+        if halo:
+            chunks = tuple(self.merge_small_chunks(c, halo) for c in sources[0].chunks)
+            sources = [src.rechunk(chunks) for src in sources]
+
+        # without padding at the image border, as boundary="none" of map_overlap
+        extended = [
+            da.overlap.overlap(src, depth=halo, boundary="none") if halo else src
+            for src in sources
+        ]
+
+        def run_tile(*blocks, block_info=None):
+            if copy_blocks:
+                blocks = [block.copy() for block in blocks]
+            result = self.builder.run(*blocks)
+            results = list(result) if isinstance(result, (list, tuple)) else [result]
+
+            trim = ...
+            if halo:
+                info = block_info[0]
+                trim = tuple(
+                    slice(halo if pos > 0 else 0, -halo if pos < n - 1 else None)
+                    for pos, n in zip(info["chunk-location"], info["num-chunks"])
+                )
+            return np.stack(
+                [np.asarray(out)[trim].astype(stacked_dtype) for out in results]
+            )
+
+        stacked = da.map_blocks(
+            run_tile,
+            *extended,
+            new_axis=0,
+            chunks=((len(probes),), *sources[0].chunks),
+            dtype=stacked_dtype,
+        )
+
+        logger.info(
+            f"Running '{self.builder.type_name}' in tiles of {sources[0].chunksize} with halo {halo}."
+        )
+        return [stacked[i].astype(dtype) for i, dtype in enumerate(dtypes)]
+
+    def bring_to_max_resolution(self, el, shape=None):
         """Upscales an element to the base resolution (level 0).
 
+        Pixels are replicated into blocks (nearest-neighbour upscaling by an
+        integer factor), lazily and chunk-wise, keeping the dtype of `el`.
+
         Args:
-            el: The numpy array to upscale.
+            el: The numpy or dask array to upscale.
+            shape: The level 0 shape. If given, the upscaled array is cropped
+                or edge-padded to it.
 
         Returns:
-            The upscaled numpy array.
+            The upscaled dask array.
         """
 
         scale_factor = self.downscale**self.resolution_level
-        new_shape = tuple(dim * scale_factor for dim in el.shape)
-        el_res0 = resize(
+
+        return upscale_nearest(
             el,
-            new_shape,
-            order=0,
-            preserve_range=True,
-            anti_aliasing=False,
+            scale_factor,
+            shape=shape,
+            chunks=tuple(self.chunk_size[-np.ndim(el) :]),
         )
 
-        return el_res0
+    def level0_shape(self, sdata):
+        """Returns the spatial shape of the first input at level 0, if present."""
+        for name in self.input_names:
+            if name in sdata:
+                return tuple(sd.get_pyramid_levels(sdata[name], n=0).shape[-2:])
+        return None
 
     def pack_into_model(self, el):
         """Packs a numpy array into the appropriate SpatialData model.
@@ -152,8 +457,10 @@ class ResourceBuildingController:
             An `Image2DModel` or `Labels2DModel` instance.
         """
         if self.builder.OUTPUT_TYPE.value == "labels":
+            if not np.issubdtype(el.dtype, np.integer):
+                el = el.astype(np.int32)
             el_model = Labels2DModel.parse(
-                data=el.astype(np.int32),
+                data=el,
                 dims=("y", "x"),
                 scale_factors=[self.downscale] * (self.pyramid_levels - 1),
                 chunks=self.chunk_size[1:],
@@ -169,14 +476,165 @@ class ResourceBuildingController:
 
         return el_model
 
-    def run(self, sdata):
-        """Executes the full pipeline for the processor. It starts with running validation of a compatibility of a processor with the sdata object to process.
+    @staticmethod
+    def get_provenance(sdata) -> dict:
+        """Returns the fingerprints of the elements produced by the pipeline."""
+        return sdata.attrs.setdefault(PROVENANCE_KEY, {})
+
+    @staticmethod
+    def get_quantization(sdata) -> dict:
+        """Returns how the quantized image elements can be restored."""
+        return sdata.attrs.get(QUANTIZATION_KEY, {})
+
+    def input_maxima(self, sdata) -> List[Optional[int]]:
+        """Returns the largest value of every integer input, None for others."""
+        sources = [self.get_lazy_source(sdata, name) for name in self.input_names]
+        integer = [np.issubdtype(src.dtype, np.integer) for src in sources]
+        maxima = iter(da.compute(*(s.max() for s, i in zip(sources, integer) if i)))
+        return [int(next(maxima)) if i else None for i in integer]
+
+    def to_storage_dtype(self, new_elements, sdata=None) -> List:
+        """Converts the builder outputs to the storage dtypes.
+
+        Labels are compacted (see `compact_labels`) jointly over all outputs.
+        For lazy outputs the dtype is taken from the bound the builder derives
+        from the maxima of its inputs, if it can, so the outputs are not
+        computed just to find it. Kept float images are quantized to
+        `image_dtype`; the scale is recorded in `sdata.attrs` by
+        `store_outputs`.
+
+        Args:
+            new_elements: The outputs returned by the builder.
+            sdata: The SpatialData object holding the inputs, if available.
+
+        Returns:
+            A list of (array, quantization) pairs; quantization is None for
+            arrays stored as they are.
+        """
+        if self.builder.OUTPUT_TYPE.value == "labels":
+            if self.label_dtype == "int32":
+                return [(el.astype(np.int32), None) for el in new_elements]
+            arrays = [
+                el if isinstance(el, da.Array) else np.asarray(el)
+                for el in new_elements
+            ]
+
+            max_label = None
+            lazy = any(isinstance(el, da.Array) for el in arrays)
+            if lazy and sdata is not None and not self.relabel_sequential:
+                max_label = self.builder.label_bound(self.input_maxima(sdata))
+            if max_label is not None and all(
+                np.issubdtype(el.dtype, np.integer) for el in arrays
+            ):
+                # the outputs cannot hold more than their dtype does
+                max_label = min(max_label, max(np.iinfo(el.dtype).max for el in arrays))
+
+            compacted = compact_labels(
+                arrays, relabel=self.relabel_sequential, max_label=max_label
+            )
+            return [(el, None) for el in compacted]
+
+        converted = []
+        for el in new_elements:
+            if (
+                self.keep
+                and self.image_dtype != "float32"
+                and np.issubdtype(el.dtype, np.floating)
+            ):
+                converted.append(quantize_image(el, self.image_dtype))
+            else:
+                converted.append((el, None))
+        return converted
+
+    @staticmethod
+    def element_fingerprint(sdata, name) -> str:
+        """Returns a fingerprint of an input element.
+
+        Elements produced by the pipeline are identified by the fingerprint of
+        the step that produced them. Other elements (e.g. the channels of a
+        core) by their shape, data type and the modification times and sizes
+        of their files on disk, metadata and chunks alike. The directory
+        itself is not enough: rewriting a chunk leaves its mtime unchanged.
+
+        Args:
+            sdata: The SpatialData object holding the element.
+            name: The name of the element.
+
+        Returns:
+            The fingerprint as a string.
+        """
+        provenance = ResourceBuildingController.get_provenance(sdata)
+        if name in provenance:
+            return provenance[name]
+
+        level = sd.get_pyramid_levels(sdata[name], n=0)
+        description = [name, list(level.shape), str(level.dtype)]
+
+        digest = hashlib.sha256(json.dumps(description).encode())
+        if sdata.is_backed():
+            for path in sdata.elements_paths_on_disk():
+                if path.split("/")[-1] == name:
+                    root = sdata.path / path
+                    for dirpath, dirnames, filenames in os.walk(root):
+                        dirnames.sort()
+                        for filename in sorted(filenames):
+                            file_path = os.path.join(dirpath, filename)
+                            stat = os.stat(file_path)
+                            entry = [
+                                os.path.relpath(file_path, root),
+                                stat.st_mtime_ns,
+                                stat.st_size,
+                            ]
+                            digest.update(json.dumps(entry).encode())
+
+        return digest.hexdigest()
+
+    def step_fingerprint(self, sdata) -> str:
+        """Returns the fingerprint of this step applied to the sdata.
+
+        Args:
+            sdata: The SpatialData object holding the inputs.
+
+        Returns:
+            A hash of the input fingerprints, the builder and its parameters,
+            the package version and the storage settings.
+        """
+        params = getattr(self.builder, "params", None)
+        description = {
+            "inputs": [self.element_fingerprint(sdata, ch) for ch in self.input_names],
+            "kind": getattr(self.builder, "kind", None),
+            "type": getattr(self.builder, "type_name", None),
+            "params": params.model_dump(mode="json") if params is not None else None,
+            "version": package_version(),
+            "resolution_level": self.resolution_level,
+            "pyramid_levels": self.pyramid_levels,
+            "downscale": self.downscale,
+            "chunk_size": self.chunk_size,
+            "label_dtype": self.label_dtype,
+            "relabel_sequential": self.relabel_sequential,
+            "image_dtype": self.image_dtype,
+        }
+        return hashlib.sha256(
+            json.dumps(description, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def outputs_up_to_date(self, sdata, fingerprint) -> bool:
+        """Checks whether all outputs exist and were produced by this step."""
+        provenance = self.get_provenance(sdata)
+        return all(
+            name in sdata and provenance.get(name) == fingerprint
+            for name in self.output_names
+        )
+
+    def prepare(self, sdata) -> Optional[str]:
+        """Validates the builder and the sdata and clears the outputs.
 
         Args:
             sdata: The SpatialData object to process.
 
         Returns:
-            The processed SpatialData object.
+            The fingerprint of the step, or None if the existing outputs are
+            up to date and the step can be skipped.
         """
 
         # validate builder settings
@@ -189,49 +647,182 @@ class ResourceBuildingController:
         # validate sdata as input
         self.validate_sdata_as_input(sdata)
 
+        fingerprint = self.step_fingerprint(sdata)
+        if self.reuse_outputs and self.outputs_up_to_date(sdata, fingerprint):
+            logger.info(
+                f"Element(s) '{self.output_names}' are up to date; skipping '{self.builder.type_name}'."
+            )
+            return None
+
         # Handle overwiting
         self.prepare_to_overwrite(sdata)
 
-        # Build
-        data_sources = [
-            np.array(
-                sd.get_pyramid_levels(sdata[ch], n=self.resolution_level)
-            ).squeeze()
-            for ch in self.input_names
-        ]
-        # data_sources = [
-        #         sd.get_pyramid_levels(sdata[ch], n=self.resolution_level).squeeze()
-        #     for ch in self.input_names
-        # ]
-        new_elements = self.builder.run(*data_sources)
+        return fingerprint
 
-        # forced cleanup
-        del data_sources
+    def prepare_outputs(self, sdata, new_elements, persist=False):
+        """Converts the builder outputs into the data models to be stored.
+
+        Args:
+            sdata: The SpatialData object holding the inputs.
+            new_elements: The output(s) returned by the builder.
+            persist: Whether to compute lazy outputs (e.g. of tiled runs)
+                into memory, so that later reads do no further processing.
+                Outputs saved to disk need not be persisted; they are written
+                tile by tile and read back lazily. Several lazy outputs are
+                always computed jointly, since they come from the same tiles
+                of one builder run.
+
+        Returns:
+            A list of (name, data model, quantization) triples.
+        """
 
         if not isinstance(new_elements, Sequence):
             new_elements = [new_elements]
 
-        logger.info(f"New element(s) '{self.output_names}' have been created.")
+        shape = self.level0_shape(sdata) if self.resolution_level > 0 else None
 
-        # save output
-        for el, el_name in zip(new_elements, self.output_names):
+        arrays, scales = [], []
+        for el, scale in self.to_storage_dtype(new_elements, sdata):
 
             # bring to max resolution level
             if self.resolution_level > 0:
-                el = self.bring_to_max_resolution(el)
+                el = self.bring_to_max_resolution(el, shape)
+
+            arrays.append(el)
+            scales.append(scale)
+
+        # forced cleanup
+        del new_elements
+
+        lazy = sum(isinstance(el, da.Array) for el in arrays)
+        if persist or lazy > 1:
+            # the outputs of one run may share a graph; compute it once
+            arrays = list(dask.persist(*arrays))
+
+        prepared = []
+        for el_name, scale in zip(self.output_names, scales):
 
             # pack into the data model
-            el_model = self.pack_into_model(el)
+            el_model = self.pack_into_model(arrays.pop(0))
+            if persist:
+                el_model = el_model.persist()
+
+            prepared.append((el_name, el_model, scale))
+
+        return prepared
+
+    def commit_outputs(self, sdata, prepared, fingerprint=None):
+        """Puts prepared outputs into the sdata and saves them if requested.
+
+        Args:
+            sdata: The SpatialData object to store the outputs in.
+            prepared: The outputs as returned by `prepare_outputs`.
+            fingerprint: The fingerprint of the step, recorded for every
+                output.
+
+        Returns:
+            The updated SpatialData object.
+        """
+
+        logger.info(f"New element(s) '{self.output_names}' have been created.")
+
+        provenance = self.get_provenance(sdata)
+        quantization = sdata.attrs.setdefault(QUANTIZATION_KEY, {})
 
-            # forced cleanup
-            del el
+        for el_name, el_model, scale in prepared:
 
             # put the data model into the sdata
             sdata[el_name] = el_model
+            self.invalidate_cache(sdata, el_name)
+
+            if scale is not None:
+                quantization[el_name] = scale
+            else:
+                quantization.pop(el_name, None)
+
+            if fingerprint is not None:
+                provenance[el_name] = fingerprint
+            else:
+                provenance.pop(el_name, None)
 
             # save to disk if requested
             if self.keep:
                 sdata.write_element(el_name)
                 logger.info(f"Mask '{el_name}' has been saved to disk.")
+                if sdata.is_backed():
+                    self.reload_element(sdata, el_name)
+
+        # persist the fingerprints next to the saved elements
+        if self.keep and sdata.is_backed():
+            sdata.write_attrs()
 
         return sdata
+
+    def reload_element(self, sdata, name):
+        """Replaces a saved element by a lazy view of its copy on disk.
+
+        Later steps then read the stored chunks instead of recomputing a lazy
+        output or holding a computed one in memory.
+        """
+        element_type = (
+            "labels" if self.builder.OUTPUT_TYPE.value == "labels" else "images"
+        )
+        stored = sd.read_zarr(sdata.path, selection=(element_type,))
+        sdata[name] = stored[name]
+        self.invalidate_cache(sdata, name)
+
+    def store_outputs(self, sdata, new_elements, fingerprint=None):
+        """Packs the builder outputs and puts them into the sdata.
+
+        Args:
+            sdata: The SpatialData object to store the outputs in.
+            new_elements: The output(s) returned by the builder.
+            fingerprint: The fingerprint of the step, recorded for every
+                output.
+
+        Returns:
+            The updated SpatialData object.
+        """
+
+        prepared = self.prepare_outputs(sdata, new_elements)
+
+        return self.commit_outputs(sdata, prepared, fingerprint)
+
+    def run(self, sdata):
+        """Executes the full pipeline for the processor. It starts with running validation of a compatibility of a processor with the sdata object to process.
+
+        Args:
+            sdata: The SpatialData object to process.
+
+        Returns:
+            The processed SpatialData object.
+        """
+
+        fingerprint = self.prepare(sdata)
+        if fingerprint is None:
+            return sdata
+
+        new_elements = self.build(sdata)
+
+        return self.store_outputs(sdata, new_elements, fingerprint)
+
+    def build(self, sdata):
+        """Runs the builder on the inputs found in the sdata.
+
+        Args:
+            sdata: The SpatialData object holding the inputs.
+
+        Returns:
+            The output(s) of the builder.
+        """
+        if self.use_tiling(sdata):
+            data_sources = [self.get_lazy_source(sdata, ch) for ch in self.input_names]
+            new_elements = self.run_tiled(data_sources)
+        else:
+            data_sources = [self.get_source(sdata, ch) for ch in self.input_names]
+            new_elements = self.builder.run(*data_sources)
+
+        # forced cleanup
+        del data_sources
+
+        return new_elements
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import warnings
+from typing import Any, List, Literal, Optional, Tuple
+
 import numpy as np
 from loguru import logger
 from pydantic import (
@@ -20,12 +23,64 @@ from plex_pipe.processors.registry import register
 ################################################################################
 
 
+def percentile_range(arr: np.ndarray, low: float, high: float) -> Tuple[float, float]:
+    """Returns the intensities at the `low` and `high` percentiles of an image.
+
+    Raises:
+        ValueError: If the range between the percentiles is empty or not finite.
+    """
+    p_low, p_high = np.percentile(arr, [low, high])
+
+    denom = p_high - p_low
+    if denom <= 0 or not np.isfinite(denom):
+        message = f"Normalization skipped: invalid percentiles (low={p_low}, high={p_high}, Δ={denom})"
+        logger.error(message)
+        raise ValueError(message)
+
+    return p_low, p_high
+
+
+def median_histogram(img: np.ndarray, radius: int) -> np.ndarray:
+    """Exact disk median of an unsigned integer image with a sliding histogram.
+
+    Intensities are shifted to start at 0, so the histogram only spans the
+    range actually present in the image (images with less than 256 levels
+    are filtered as uint8). The image is edge-padded, which gives the same
+    result as `skimage.filters.median` with its default 'nearest' mode.
+
+    Args:
+        img: A 2D uint8 or uint16 image.
+        radius: The radius of the disk footprint.
+
+    Returns:
+        The filtered image with the dtype of `img`.
+    """
+    from skimage.filters import rank
+    from skimage.morphology import disk
+
+    offset = img.min()
+    shifted = img - offset
+    if shifted.max() < 256:
+        shifted = shifted.astype(np.uint8)
+
+    padded = np.pad(shifted, radius, mode="edge")
+    with warnings.catch_warnings():
+        # the histogram size is already bounded by DenoiseWithMedian
+        warnings.filterwarnings("ignore", message="Bad rank filter performance")
+        med = rank.median(padded, disk(radius))[radius:-radius, radius:-radius]
+
+    out = med.astype(img.dtype)
+    out += offset
+    return out
+
+
 @register("image_transformer", "normalize")
 class Normalize(BaseOp):
 
     EXPECTED_INPUTS = 1
     EXPECTED_OUTPUTS = 1
     OUTPUT_TYPE = OutputType.IMAGE
+    MEMORY_MULTIPLIER = 6.0
 
     class Params(ProcessorParamsBase):
         """Parameters for percentile normalization."""
@@ -58,16 +113,9 @@ class Normalize(BaseOp):
         arr = np.asarray(img)
 
         low, high = self.params.low, self.params.high
-        p_low = np.percentile(arr, low)
-        p_high = np.percentile(arr, high)
+        p_low, p_high = percentile_range(arr, low, high)
 
-        denom = p_high - p_low
-        if denom <= 0 or not np.isfinite(denom):
-            message = f"Normalization skipped: invalid percentiles (low={p_low}, high={p_high}, Δ={denom})"
-            logger.error(message)
-            raise ValueError(message)
-
-        out = (arr - p_low) / denom
+        out = (arr - p_low) / (p_high - p_low)
         out = np.clip(out, 0, 1).astype(np.float32, copy=False)
 
         logger.info(
@@ -86,6 +134,12 @@ class DenoiseWithMedian(BaseOp):
     EXPECTED_INPUTS = 1
     EXPECTED_OUTPUTS = 1
     OUTPUT_TYPE = OutputType.IMAGE
+    TILEABLE = True
+
+    # the histogram median is used when its histogram is small compared
+    # with the footprint; the bounds come from benchmarks/bench_median_denoise.py
+    HISTOGRAM_BINS_PER_FOOTPRINT_AREA = 48
+    MAX_HISTOGRAM_BINS = 2**12
 
     class Params(ProcessorParamsBase):
         """Parameters for the median denoising operation."""
@@ -97,6 +151,21 @@ class DenoiseWithMedian(BaseOp):
             description="The radius of the disk-shaped kernel for the median filter.",
         )
 
+    def halo(self) -> int:
+        return self.params.disk_radius
+
+    def use_histogram(self, img) -> bool:
+        """Checks whether the sliding-histogram median is faster for an image."""
+        if img.dtype not in (np.uint8, np.uint16) or img.ndim != 2 or img.size == 0:
+            return False
+
+        n_bins = int(img.max()) - int(img.min()) + 1
+        radius = self.params.disk_radius
+        return n_bins <= min(
+            self.HISTOGRAM_BINS_PER_FOOTPRINT_AREA * radius**2,
+            self.MAX_HISTOGRAM_BINS,
+        )
+
     def run(self, img):
         # Must be array-like
         if not hasattr(img, "__array__"):
@@ -105,6 +174,18 @@ class DenoiseWithMedian(BaseOp):
                 f"got {type(img).__name__}."
             )
 
+        img = np.asarray(img)
+        if self.use_histogram(img):
+            return median_histogram(img, self.params.disk_radius)
+
+        if img.dtype == np.uint16 and img.ndim == 2 and img.size > 0:
+            # wide 16-bit ranges are filtered on the ranks of the intensities
+            # present; ranks keep the order, so the median stays exact
+            levels, ranks = np.unique(img, return_inverse=True)
+            ranks = ranks.reshape(img.shape).astype(np.uint16)
+            if self.use_histogram(ranks):
+                return levels[median_histogram(ranks, self.params.disk_radius)]
+
         from skimage.filters import median
         from skimage.morphology import disk
 
@@ -113,16 +194,194 @@ class DenoiseWithMedian(BaseOp):
         return med
 
 
+@register("image_transformer", "subtract_background")
+class SubtractBackground(BaseOp):
+    """Subtract a smooth background estimated at a reduced resolution.
+
+    The image is shrunk by `radius / work_radius` with block minima, the
+    background is estimated there (grey opening for 'tophat', or a rolling
+    ball) with a radius of about `work_radius` pixels, and subtracted from
+    the full-resolution image band by band after bilinear upsampling. The
+    cost of the background estimate therefore stays nearly constant as
+    `radius` grows. The result is clipped at 0 and has the input dtype for
+    integer images and float32 otherwise.
+
+    The background of a pixel depends on the image within about twice the
+    radius, so the operation is run tile by tile with that halo. Tiles
+    whose offsets are multiples of the shrink factor give exactly the
+    whole-image result; the controller aligns its tiles accordingly.
+    """
+
+    EXPECTED_INPUTS = 1
+    EXPECTED_OUTPUTS = 1
+    OUTPUT_TYPE = OutputType.IMAGE
+    TILEABLE = True
+    MEMORY_MULTIPLIER = 6.0
+
+    # rows of the full-resolution image subtracted at once
+    BAND_ROWS = 1024
+
+    class Params(ProcessorParamsBase):
+        """Parameters for the background subtraction."""
+
+        radius: int = Field(
+            50,
+            gt=0,
+            description="Radius of the structuring element (or ball) in full-resolution pixels.",
+        )
+        method: Literal["tophat", "rolling_ball"] = Field(
+            "tophat",
+            description="'tophat' subtracts a grey opening, 'rolling_ball' the rolling-ball background.",
+        )
+        work_radius: int = Field(
+            10,
+            gt=0,
+            description="Radius in pixels at the resolution where the background is estimated.",
+        )
+
+    def shrink(self) -> Tuple[int, int]:
+        """Returns the shrink factor and the radius at the reduced resolution."""
+        factor = max(1, self.params.radius // self.params.work_radius)
+        work_radius = max(1, round(self.params.radius / factor))
+        return factor, work_radius
+
+    def halo(self) -> int:
+        # the opening (or ball) reaches 2 * work_radius shrunk pixels, plus
+        # one for partial blocks and one for the interpolation
+        factor, work_radius = self.shrink()
+        return factor * (2 * work_radius + 2)
+
+    def tile_multiple(self) -> int:
+        # blocks of the shrunk image have to start at the same pixels
+        return self.shrink()[0]
+
+    @staticmethod
+    def block_min(img: np.ndarray, factor: int) -> np.ndarray:
+        """Shrinks an image by taking the minimum of every `factor` x `factor` block."""
+        rows = np.arange(0, img.shape[0], factor)
+        cols = np.arange(0, img.shape[1], factor)
+        reduced = np.minimum.reduceat(img, rows, axis=0)
+        return np.minimum.reduceat(reduced, cols, axis=1)
+
+    @staticmethod
+    def upsample_linear(
+        small: np.ndarray, factor: int, rows: Tuple[int, int], cols: Tuple[int, int]
+    ) -> np.ndarray:
+        """Bilinearly upsamples the window `rows` x `cols` of the full-resolution grid.
+
+        Pixel centres of the full-resolution grid are mapped onto the grid of
+        `small`, so neighbouring windows join without seams.
+        """
+
+        def weights(start, stop, size):
+            pos = (np.arange(start, stop) + 0.5) / factor - 0.5
+            pos = np.clip(pos, 0, size - 1)
+            i0 = np.floor(pos).astype(np.intp)
+            i1 = np.minimum(i0 + 1, size - 1)
+            w = (pos - i0).astype(np.float32)
+            return i0, i1, w
+
+        y0, y1, wy = weights(*rows, small.shape[0])
+        x0, x1, wx = weights(*cols, small.shape[1])
+
+        top = small[y0] * (1 - wy[:, None]) + small[y1] * wy[:, None]
+        return top[:, x0] * (1 - wx) + top[:, x1] * wx
+
+    def estimate_background(self, small: np.ndarray, radius: int) -> np.ndarray:
+        """Estimates the background of the shrunk image."""
+        if self.params.method == "rolling_ball":
+            from skimage.restoration import rolling_ball
+
+            return rolling_ball(small, radius=radius)
+
+        from scipy.ndimage import grey_opening
+        from skimage.morphology import disk
+
+        return grey_opening(small, footprint=disk(radius))
+
+    def run(self, img):
+        # Must be array-like
+        if not hasattr(img, "__array__"):
+            raise TypeError(
+                f"{self.__class__.__name__}.run() expected a NumPy array–like object, "
+                f"got {type(img).__name__}."
+            )
+
+        img = np.asarray(img)
+        factor, work_radius = self.shrink()
+
+        small = self.block_min(img, factor).astype(np.float32)
+        background = self.estimate_background(small, work_radius).astype(np.float32)
+
+        is_int = np.issubdtype(img.dtype, np.integer)
+        out = np.empty(img.shape, dtype=img.dtype if is_int else np.float32)
+        for r0 in range(0, img.shape[0], self.BAND_ROWS):
+            r1 = min(r0 + self.BAND_ROWS, img.shape[0])
+            bg = self.upsample_linear(background, factor, (r0, r1), (0, img.shape[1]))
+            band = img[r0:r1].astype(np.float32) - bg
+            np.maximum(band, 0, out=band)
+            if is_int:
+                np.rint(band, out=band)
+            out[r0:r1] = band
+
+        return out
+
+
 @register("image_transformer", "mean_of_images")
 class MeanOfImages(BaseOp):
-    """Compute the mean of multiple image arrays."""
+    """Compute the (weighted) mean of multiple image arrays.
+
+    Inputs are added one at a time into a float32 accumulator, so the extra
+    memory does not grow with the number of inputs. Optionally, every input
+    is rescaled between its own percentiles before it is added.
+    """
 
     EXPECTED_INPUTS = None  # allow any number of inputs
     EXPECTED_OUTPUTS = 1
     OUTPUT_TYPE = OutputType.IMAGE  # produces a single averaged image
+    TILEABLE = True
+
+    class Params(ProcessorParamsBase):
+        """Parameters for averaging images."""
+
+        weights: Optional[List[float]] = Field(
+            None,
+            description="Weight of each input, in the order of the inputs. Inputs are weighted equally if not given.",
+        )
+        normalize: bool = Field(
+            False,
+            description="Rescale each input to [0, 1] between its 'low' and 'high' percentiles before averaging.",
+        )
+        low: float = Field(
+            1.0, ge=0.0, le=100.0, description="Lower percentile bound (0-100)."
+        )
+        high: float = Field(
+            99.0, ge=0.0, le=100.0, description="Upper percentile bound (0-100)."
+        )
+
+        @model_validator(mode="after")
+        def check_params(self, info: ValidationInfo):
+            """Ensures valid percentile bounds and non-negative weights."""
+            if self.low >= self.high:
+                raise ValueError(
+                    f"'low' ({self.low}) must be less than 'high' ({self.high})."
+                )
+            if self.weights is not None and (
+                any(w < 0 for w in self.weights) or sum(self.weights) <= 0
+            ):
+                raise ValueError("'weights' must be non-negative with a positive sum.")
+            return self
+
+    def __init__(self, **cfg: Any):
+
+        super().__init__(**cfg)
+
+        # percentiles are image-wide, so normalized inputs cannot be tiled
+        if self.params.normalize:
+            self.TILEABLE = False
 
     def run(self, *images):
-        """Compute elementwise mean over all provided images."""
+        """Compute elementwise (weighted) mean over all provided images."""
 
         # --- validation ---
         if len(images) == 0:
@@ -130,8 +389,18 @@ class MeanOfImages(BaseOp):
                 f"{self.__class__.__name__}.run() expected at least one image."
             )
 
-        arrays = []
-        for i, img in enumerate(images):
+        weights = self.params.weights
+        if weights is None:
+            weights = [1.0] * len(images)
+        elif len(weights) != len(images):
+            raise ValueError(
+                f"{self.__class__.__name__}: got {len(weights)} weights for {len(images)} images."
+            )
+
+        # --- accumulate one input at a time ---
+        mean_img = None
+        buffer = None
+        for i, (img, weight) in enumerate(zip(images, weights)):
             if not hasattr(img, "__array__"):
                 raise TypeError(
                     f"{self.__class__.__name__}.run(): input #{i} is not array-like "
@@ -140,21 +409,31 @@ class MeanOfImages(BaseOp):
             arr = np.asarray(img)
             if arr.ndim == 0:
                 raise ValueError(f"Input #{i} is scalar; expected image array.")
-            arrays.append(arr)
 
-        # --- shape consistency ---
-        ref_shape = arrays[0].shape
-        if any(a.shape != ref_shape for a in arrays[1:]):
-            raise ValueError(
-                f"All input images must have the same shape; got {[a.shape for a in arrays]}."
-            )
+            if mean_img is None:
+                mean_img = np.zeros(arr.shape, dtype=np.float32)
+                buffer = np.empty(arr.shape, dtype=np.float32)
+            elif arr.shape != mean_img.shape:
+                raise ValueError(
+                    f"All input images must have the same shape; got {mean_img.shape} "
+                    f"for input #0 and {arr.shape} for input #{i}."
+                )
+
+            if self.params.normalize:
+                p_low, p_high = percentile_range(arr, self.params.low, self.params.high)
+                np.subtract(arr, p_low, out=buffer, casting="unsafe")
+                buffer *= np.float32(1 / (p_high - p_low))
+                np.clip(buffer, 0, 1, out=buffer)
+                buffer *= np.float32(weight)
+            else:
+                np.multiply(arr, np.float32(weight), out=buffer, casting="unsafe")
+
+            mean_img += buffer
 
-        # --- compute mean ---
-        stack = np.stack(arrays, axis=0)
-        mean_img = np.mean(stack, axis=0).astype(np.float32, copy=False)
+        mean_img /= sum(weights)
 
         logger.info(
-            f"{self.__class__.__name__}: computed mean of {len(arrays)} images "
-            f"with shape {ref_shape}."
+            f"{self.__class__.__name__}: computed mean of {len(images)} images "
+            f"with shape {mean_img.shape}."
         )
         return mean_img
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-from typing import Tuple
+import ast
+import re
+from typing import Any, Dict, List, Tuple
 
+import numpy as np
 from pydantic import Field, field_validator, model_validator
 from skimage.morphology import closing, disk, opening
-from skimage.transform import resize
 
 from plex_pipe.processors.base import (
     BaseOp,
@@ -12,6 +14,7 @@ from plex_pipe.processors.base import (
     ProcessorParamsBase,
 )
 from plex_pipe.processors.registry import register
+from plex_pipe.utils.im_utils import upscale_nearest
 
 ################################################################################
 # Mask Builders
@@ -24,11 +27,17 @@ class SubtractionBuilder(BaseOp):
     EXPECTED_INPUTS = 2
     EXPECTED_OUTPUTS = 1
     OUTPUT_TYPE = OutputType.LABELS
+    TILEABLE = True
+    # mask_cell is overwritten; the controller passes a private copy if shared
+    IN_PLACE_SAFE = False
+
+    def label_bound(self, input_maxima):
+        return input_maxima[0]
 
     def run(self, mask_cell, mask_nucleus):
         if mask_cell.shape != mask_nucleus.shape:
             raise ValueError("Source masks must have the same shape for subtraction.")
-        result = mask_cell.copy()
+        result = np.asarray(mask_cell)
         result[mask_nucleus > 0] = 0  # zero out regions where mask_nucleus is present
         return result
 
@@ -43,26 +52,203 @@ class MultiplicationBuilder(BaseOp):
     EXPECTED_INPUTS = 2
     EXPECTED_OUTPUTS = 1
     OUTPUT_TYPE = OutputType.LABELS
+    TILEABLE = True
+
+    def label_bound(self, input_maxima):
+        if None in input_maxima[:2]:
+            return None
+        return input_maxima[0] * input_maxima[1]
 
     def run(self, mask1, mask2):
         if mask1.shape != mask2.shape:
             raise ValueError("Source masks must have the same shape.")
-        result = mask1 * mask2
+        # the wider of the input dtypes, whichever comes first; numpy would
+        # promote e.g. int32 * uint32 to int64
+        dtype = np.promote_types(mask1.dtype, mask2.dtype)
+        if dtype.itemsize > max(mask1.dtype.itemsize, mask2.dtype.itemsize):
+            wider = mask2.dtype.itemsize > mask1.dtype.itemsize
+            dtype = mask2.dtype if wider else mask1.dtype
+        result = (mask1 * mask2).astype(dtype, copy=False)
         return result
 
 
+###############################################################################
+###############################################################################
+@register("mask_builder", "mask_algebra")
+class MaskAlgebraBuilder(BaseOp):
+    """Evaluate expressions over several label/mask inputs in one pass.
+
+    Every expression produces one output. Inputs are referred to by their
+    position as `x0`, `x1`, ... and combined with the functions:
+
+    - `multiply(a, b)`: elementwise product (as the 'multiply' builder).
+    - `subtract(a, b)`: `a` with pixels removed where `b` is set (as the
+      'subtract' builder).
+    - `select(a, b)`: labels of `a` kept only where `b` is set, in the
+      dtype of `a`.
+    - `intersect(a, b)`: binary (uint8) mask where both `a` and `b` are set.
+
+    For example, with inputs `[nucleus, cell, blob]` the expressions
+    `select(x0, x2)`, `select(x1, x2)` and
+    `subtract(select(x1, x2), select(x0, x2))` give the nucleus, cell and
+    cytoplasm masks restricted to the blob. Subexpressions shared between
+    outputs are evaluated once, and since the builder is tileable no
+    intermediate result is ever allocated at full size.
+    """
+
+    EXPECTED_INPUTS = None
+    EXPECTED_OUTPUTS = None
+    OUTPUT_TYPE = OutputType.LABELS
+    TILEABLE = True
+    MEMORY_MULTIPLIER = 4.0
+
+    FUNCTIONS = {
+        "multiply": lambda a, b: a * b,
+        "subtract": lambda a, b: np.where(b > 0, np.zeros_like(a), a),
+        "select": lambda a, b: np.where(b > 0, a, np.zeros_like(a)),
+        "intersect": lambda a, b: ((a > 0) & (b > 0)).astype(np.uint8),
+    }
+
+    class Params(ProcessorParamsBase):
+        """Parameters for the mask algebra operation."""
+
+        expressions: List[str] = Field(
+            ...,
+            min_length=1,
+            description="One expression per output, e.g. 'subtract(x1, x0)'.",
+        )
+
+        @field_validator("expressions")
+        def check_expressions(cls, v: List[str]) -> List[str]:
+            """Ensures every expression can be parsed and uses known functions."""
+            for expression in v:
+                MaskAlgebraBuilder.parse_expression(expression)
+            return v
+
+    @classmethod
+    def parse_expression(cls, expression: str) -> ast.expr:
+        """Parses an expression and checks that it only uses allowed syntax.
+
+        Args:
+            expression: The expression, e.g. 'select(x1, x2)'.
+
+        Returns:
+            The root node of the parsed expression.
+
+        Raises:
+            ValueError: If the expression is not valid.
+        """
+        try:
+            root = ast.parse(expression, mode="eval").body
+        except SyntaxError as e:
+            raise ValueError(f"Cannot parse expression '{expression}': {e}") from e
+
+        for node in ast.walk(root):
+            if isinstance(node, ast.Call):
+                if not (
+                    isinstance(node.func, ast.Name) and node.func.id in cls.FUNCTIONS
+                ):
+                    raise ValueError(
+                        f"Unknown function in '{expression}'. Available: {sorted(cls.FUNCTIONS)}"
+                    )
+                if len(node.args) != 2 or node.keywords:
+                    raise ValueError(
+                        f"Functions take exactly two positional arguments: '{expression}'."
+                    )
+            elif isinstance(node, ast.Name):
+                if node.id not in cls.FUNCTIONS and not re.fullmatch(r"x\d+", node.id):
+                    raise ValueError(
+                        f"Unknown input '{node.id}' in '{expression}'. Refer to inputs as x0, x1, ..."
+                    )
+            elif not isinstance(node, ast.Load):
+                raise ValueError(f"Unsupported syntax in expression '{expression}'.")
+
+        return root
+
+    def __init__(self, **cfg: Any):
+
+        super().__init__(**cfg)
+
+        self.trees = [self.parse_expression(e) for e in self.params.expressions]
+        self.n_inputs_used = 1 + max(
+            int(node.id[1:])
+            for tree in self.trees
+            for node in ast.walk(tree)
+            if isinstance(node, ast.Name) and node.id not in self.FUNCTIONS
+        )
+
+    def validate_io(self, inputs, outputs):
+        in_list, out_list = super().validate_io(inputs, outputs)
+
+        if len(out_list) != len(self.trees):
+            raise ValueError(
+                f"{self.__class__.__name__}: expected {len(self.trees)} output name(s), "
+                f"one per expression, got {len(out_list)}: {out_list!r}"
+            )
+        if len(in_list) < self.n_inputs_used:
+            raise ValueError(
+                f"{self.__class__.__name__}: expressions refer to {self.n_inputs_used} input(s), "
+                f"got {len(in_list)}: {in_list!r}"
+            )
+
+        return in_list, out_list
+
+    def evaluate(self, node: ast.expr, sources, cache: Dict[str, np.ndarray]):
+        """Evaluates a parsed expression, reusing already computed subexpressions."""
+        key = ast.dump(node)
+        if key not in cache:
+            if isinstance(node, ast.Name):
+                cache[key] = sources[int(node.id[1:])]
+            else:
+                a, b = (self.evaluate(arg, sources, cache) for arg in node.args)
+                cache[key] = self.FUNCTIONS[node.func.id](a, b)
+        return cache[key]
+
+    def label_bound(self, input_maxima):
+
+        def bound(node):
+            if isinstance(node, ast.Name):
+                return input_maxima[int(node.id[1:])]
+            if node.func.id == "intersect":
+                return 1
+            a, b = (bound(arg) for arg in node.args)
+            if node.func.id == "multiply":
+                return None if a is None or b is None else a * b
+            return a
+
+        bounds = [bound(tree) for tree in self.trees]
+        return None if None in bounds else max(bounds)
+
+    def run(self, *masks):
+        if len(masks) < self.n_inputs_used:
+            raise ValueError(
+                f"Expressions refer to {self.n_inputs_used} input(s), got {len(masks)}."
+            )
+        sources = [np.asarray(m) for m in masks]
+        if len({m.shape for m in sources}) > 1:
+            raise ValueError("Source masks must have the same shape.")
+
+        cache: Dict[str, np.ndarray] = {}
+        return [self.evaluate(tree, sources, cache) for tree in self.trees]
+
+
 ###############################################################################
 ###############################################################################
 @register("mask_builder", "ring")
 class RingBuilder(BaseOp):
+    """Build a ring of pixels between an inner and an outer distance from labels.
+
+    Both radii are taken from a single Euclidean distance transform of the
+    background. Every background pixel inside the ring gets the label of its
+    nearest object, so the result equals expanding the labels by `outer`
+    and removing the expansion by `inner`. The labels keep their dtype.
+    """
 
     EXPECTED_INPUTS = 1
     EXPECTED_OUTPUTS = 1
     OUTPUT_TYPE = OutputType.LABELS
-
-    ######################################################
-    # current implementation is super slow and not memory efficient
-    ######################################################
+    TILEABLE = True
+    MEMORY_MULTIPLIER = 6.0
 
     class Params(ProcessorParamsBase):
         """Parameters for creating a ring mask."""
@@ -83,20 +269,42 @@ class RingBuilder(BaseOp):
                 )
             return self
 
+    def halo(self) -> int:
+        # labels further away than the outer radius cannot reach a tile
+        return self.params.outer
+
+    def label_bound(self, input_maxima):
+        return input_maxima[0]
+
     def run(self, mask):
-        from skimage.segmentation import expand_labels
+        from scipy.ndimage import distance_transform_edt
+
+        mask = np.asarray(mask)
+        ring = np.zeros_like(mask)
+        if not mask.any():
+            return ring
+
+        # distance to (and position of) the nearest labelled pixel
+        distances, nearest = distance_transform_edt(mask == 0, return_indices=True)
 
-        mask_big = expand_labels(mask, self.params.outer)
-        mask_small = expand_labels(mask, self.params.inner)
-        mask_big[mask_small > 0] = 0
+        in_ring = (distances > self.params.inner) & (distances <= self.params.outer)
+        ring[in_ring] = mask[tuple(nearest[:, in_ring])]
 
-        return mask_big
+        return ring
 
 
 ###############################################################################
 ###############################################################################
 @register("mask_builder", "blob")
 class BlobBuilder(BaseOp):
+    """Build a smooth binary mask covering the tissue occupied by objects.
+
+    The mask is reduced to roughly `work_shape` by block reductions (a block
+    is foreground if any of its pixels is), cleaned with a morphological
+    opening and closing at that resolution and brought back to the full
+    shape by block replication. The upsampling is lazy: the result is a
+    uint8 dask array whose chunks are produced on demand.
+    """
 
     EXPECTED_INPUTS = 1
     EXPECTED_OUTPUTS = 1
@@ -117,35 +325,47 @@ class BlobBuilder(BaseOp):
                 )
             return v
 
+    @staticmethod
+    def block_any(mask: np.ndarray, factors: Tuple[int, int]) -> np.ndarray:
+        """Reduces a mask by blocks, marking blocks with any foreground pixel.
+
+        Args:
+            mask: A 2D label or binary mask with non-negative values.
+            factors: The block size along each axis.
+
+        Returns:
+            A boolean array with one pixel per (possibly partial) block.
+        """
+        rows = np.arange(0, mask.shape[0], factors[0])
+        cols = np.arange(0, mask.shape[1], factors[1])
+        reduced = np.maximum.reduceat(mask, rows, axis=0)
+        reduced = np.maximum.reduceat(reduced, cols, axis=1)
+        return reduced > 0
+
+    def label_bound(self, input_maxima):
+        return 1
+
     def run(self, source):
 
+        source = np.asarray(source)
         orig_shape = source.shape
-        binary_mask = source > 0
+        factors = tuple(
+            max(1, -(-dim // work))
+            for dim, work in zip(orig_shape, self.params.work_shape)
+        )
 
         # Downsample mask for robust morphological cleaning
-        resized_mask = (
-            resize(
-                binary_mask.astype(int),
-                self.params.work_shape,
-                order=1,
-                preserve_range=True,
-            )
-            > 0
-        )
+        small_mask = self.block_any(source, factors)
 
         # Morphological opening & closing
         selem = disk(self.params.radius)
-        blob_mask = opening(resized_mask, selem)
+        blob_mask = opening(small_mask, selem)
         blob_mask = closing(blob_mask, selem)
 
         # Upsample to original shape
-        blob_mask = (
-            resize(
-                blob_mask.astype(float),
-                orig_shape,
-                order=1,
-                preserve_range=True,
-            )
-            > 0
+        return upscale_nearest(
+            blob_mask.astype(np.uint8),
+            factors,
+            shape=orig_shape,
+            chunks=self.output_chunks,
         )
-        return blob_mask.astype("int")
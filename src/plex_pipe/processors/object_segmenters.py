@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from typing import Any, Literal, Optional
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Literal, Optional, Tuple
 
 import numpy as np
 from loguru import logger
@@ -8,6 +10,7 @@ from pydantic import (
     BaseModel,
     ConfigDict,
     Field,
+    field_validator,
 )
 
 from plex_pipe.processors.base import (
@@ -15,17 +18,44 @@ from plex_pipe.processors.base import (
     OutputType,
     ProcessorParamsBase,
 )
-from plex_pipe.processors.registry import register
+from plex_pipe.processors.registry import REGISTRY, register
+from plex_pipe.processors.segmentation_worker import SegmentationClient
+from plex_pipe.utils.parallel_utils import inherited_thread_limits
 
 ################################################################################
 # Object Segmenters
 ################################################################################
 
 
+def model_params(params: BaseModel) -> dict:
+    """Return the parameters understood by the model itself."""
+    return params.model_dump(exclude={"worker_address", "gpu"})
+
+
+def worker_params(params: BaseModel) -> dict:
+    """Return the parameters a segmentation worker builds the processor with.
+
+    They also key the worker's processor cache, so warm-up and client
+    requests must both use this helper to share a loaded model.
+    """
+    return params.model_dump(exclude={"worker_address"})
+
+
+def connect_worker(params: BaseModel) -> SegmentationClient | None:
+    """Return a client for the configured segmentation worker, if any."""
+    if params.worker_address is None:
+        return None
+    logger.info(f"Segmentation will run in the worker at {params.worker_address}.")
+    return SegmentationClient(params.worker_address)
+
+
 @register("object_segmenter", "instanseg")
 class InstansegSegmenter(BaseOp):
 
     OUTPUT_TYPE = OutputType.LABELS
+    MEMORY_MULTIPLIER = 10.0
+    THREAD_SAFE = False
+    GPU_OPTIONAL = True
 
     class Params(ProcessorParamsBase):
         """Parameters for the Instanseg segmenter."""
@@ -42,6 +72,11 @@ class InstansegSegmenter(BaseOp):
         normalise: bool = True
         overlap: int = 80
 
+        worker_address: Optional[str] = Field(
+            None,
+            description="Address of a running segmentation worker (scripts/segmentation_worker.py). If given, the model is not loaded in this process and segmentation is sent to the worker.",
+        )
+
         # warn the user about any unrecognized parameters
         model_config = ConfigDict(extra="forbid")
 
@@ -54,6 +89,10 @@ class InstansegSegmenter(BaseOp):
         else:
             self.EXPECTED_OUTPUTS = 1
 
+        self.client = connect_worker(self.params)
+        if self.client is not None:
+            return
+
         # import model
         from instanseg import InstanSeg
 
@@ -81,11 +120,18 @@ class InstansegSegmenter(BaseOp):
 
     def run(self, *in_image):
 
+        if self.client is not None:
+            return self.client.run(
+                self.kind, self.type_name, worker_params(self.params), in_image
+            )
+
         # standardize input
         in_image = self.prepare_input(in_image)
 
         # Call InstanSeg
-        labeled_output, _ = self.model.eval_medium_image(in_image, **dict(self.params))
+        labeled_output, _ = self.model.eval_medium_image(
+            in_image, **model_params(self.params)
+        )
 
         # extract result
         segm_arrays = [np.array(x).astype(np.int32) for x in labeled_output[0, :, :, :]]
@@ -104,6 +150,9 @@ class Cellpose4Segmenter(BaseOp):
 
     EXPECTED_OUTPUTS = 1
     OUTPUT_TYPE = OutputType.LABELS
+    MEMORY_MULTIPLIER = 10.0
+    THREAD_SAFE = False
+    GPU_OPTIONAL = True
 
     class Params(BaseModel):
         """Parameters for the Cellpose segmenter."""
@@ -129,6 +178,15 @@ class Cellpose4Segmenter(BaseOp):
             description="From Cellpose documentation: If niter is None or 0, it scales with ROI size—use larger values (e.g., niter=2000) for longer ROIs.",
         )
 
+        gpu: bool = Field(
+            True,
+            description="Run Cellpose on the GPU. Set to false on CPU-only nodes.",
+        )
+        worker_address: Optional[str] = Field(
+            None,
+            description="Address of a running segmentation worker (scripts/segmentation_worker.py). If given, the model is not loaded in this process and segmentation is sent to the worker.",
+        )
+
         # warn the user about any unrecognized parameters
         model_config = ConfigDict(extra="forbid")
 
@@ -136,10 +194,14 @@ class Cellpose4Segmenter(BaseOp):
 
         super().__init__(**cfg)
 
+        self.client = connect_worker(self.params)
+        if self.client is not None:
+            return
+
         # import model
         from cellpose import models
 
-        self.model = models.CellposeModel(gpu=True)
+        self.model = models.CellposeModel(gpu=self.params.gpu)
 
     def prepare_input(self, in_image):
 
@@ -170,10 +232,255 @@ class Cellpose4Segmenter(BaseOp):
         It can accept a single image or a pair of images for nucleus and cytoplasm in any order.
         """
 
+        if self.client is not None:
+            return self.client.run(
+                self.kind, self.type_name, worker_params(self.params), in_image
+            )
+
         # prepare input
         in_image = self.prepare_input(in_image)
 
         # run segmentation
-        mask, *_ = self.model.eval(in_image, **dict(self.params))
+        mask, *_ = self.model.eval(in_image, **model_params(self.params))
 
         return mask
+
+
+_TILE_SEGMENTER: BaseOp | None = None
+
+
+def set_torch_threads(n_threads: int | None) -> None:
+    """Limit the intra-op threads of torch (if it is installed)."""
+    if n_threads is None:
+        return
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(n_threads)
+
+
+def _init_tile_worker(processor_class, parameters, n_threads):
+    """Build the wrapped segmenter once per worker process."""
+    global _TILE_SEGMENTER
+
+    # the BLAS/OpenMP caps are inherited from the parent (see `run`)
+    set_torch_threads(n_threads)
+
+    _TILE_SEGMENTER = processor_class(**parameters)
+
+
+def _segment_tile(tiles):
+    return _TILE_SEGMENTER.run(*tiles)
+
+
+@register("object_segmenter", "tiled")
+class TiledSegmenter(BaseOp):
+    """Runs another object segmenter on overlapping tiles and stitches them.
+
+    The image is cut into a grid of ``tile_size`` tiles, each extended by
+    ``overlap`` pixels on every side. An object found in a tile is kept only
+    if its centroid lies inside the tile before extension, so every object
+    is owned by exactly one tile. For segmenters with several outputs (e.g.
+    Instanseg nuclei and cells) ownership is decided on the union of the
+    outputs and all outputs are relabelled with the same lookup table, which
+    preserves the pairing of object IDs between them.
+
+    ``overlap`` should be larger than the diameter of the biggest object,
+    otherwise objects crossing tile seams may be truncated.
+
+    Inputs are expected to have the spatial axes last.
+    """
+
+    OUTPUT_TYPE = OutputType.LABELS
+    MEMORY_MULTIPLIER = 4.0
+    THREAD_SAFE = False
+    GPU_OPTIONAL = True
+
+    class Params(ProcessorParamsBase):
+        """Parameters for the tiled segmenter."""
+
+        segmenter: str = Field(
+            ..., description="Registered object_segmenter to run on the tiles."
+        )
+        parameters: Dict[str, Any] = Field(
+            default_factory=dict, description="Parameters of the wrapped segmenter."
+        )
+        tile_size: int = Field(2048, gt=0)
+        overlap: int = Field(128, ge=0)
+        n_workers: int = Field(
+            1,
+            ge=1,
+            description="Number of processes segmenting tiles in parallel. Each process loads its own copy of the model.",
+        )
+        threads_per_worker: Optional[int] = Field(
+            None, ge=1, description="Torch intra-op threads of every process."
+        )
+
+        model_config = ConfigDict(extra="forbid")
+
+        @field_validator("segmenter")
+        @classmethod
+        def _check_segmenter(cls, v: str) -> str:
+            available = REGISTRY["object_segmenter"]
+            if v == "tiled" or v not in available:
+                raise ValueError(
+                    f"Unknown segmenter '{v}'. Available: {', '.join(sorted(set(available) - {'tiled'}))}"
+                )
+            return v
+
+    def __init__(self, **cfg: Any):
+
+        super().__init__(**cfg)
+
+        entry = REGISTRY["object_segmenter"][self.params.segmenter]
+        self.processor_class = entry.processor_class
+
+        if self.params.n_workers == 1:
+            set_torch_threads(self.params.threads_per_worker)
+            self.segmenter = self.processor_class(**self.params.parameters)
+            self.EXPECTED_INPUTS = self.segmenter.EXPECTED_INPUTS
+            self.EXPECTED_OUTPUTS = self.segmenter.EXPECTED_OUTPUTS
+        else:
+            # the models are loaded in the worker processes only
+            entry.param_model(**self.params.parameters)
+            self.segmenter = None
+            self.EXPECTED_INPUTS = self.processor_class.EXPECTED_INPUTS
+            self.EXPECTED_OUTPUTS = self.processor_class.EXPECTED_OUTPUTS
+
+    @staticmethod
+    def tile_grid(
+        shape: Tuple[int, int], tile_size: int, overlap: int
+    ) -> List[Tuple[Tuple[slice, slice], Tuple[slice, slice]]]:
+        """Return ``(extended, core)`` slice pairs covering an image.
+
+        ``core`` tiles partition the image; ``extended`` tiles add the
+        overlap on every side, clipped to the image.
+        """
+        grid = []
+        for y0 in range(0, shape[0], tile_size):
+            for x0 in range(0, shape[1], tile_size):
+                y1 = min(y0 + tile_size, shape[0])
+                x1 = min(x0 + tile_size, shape[1])
+                extended = (
+                    slice(max(y0 - overlap, 0), min(y1 + overlap, shape[0])),
+                    slice(max(x0 - overlap, 0), min(x1 + overlap, shape[1])),
+                )
+                grid.append((extended, (slice(y0, y1), slice(x0, x1))))
+        return grid
+
+    @staticmethod
+    def owned_labels(
+        labels: List[np.ndarray],
+        extended: Tuple[slice, slice],
+        core: Tuple[slice, slice],
+    ) -> np.ndarray:
+        """Return the IDs whose centroid falls inside the core tile.
+
+        Centroids are computed on the union of ``labels`` so that objects
+        sharing an ID across outputs are kept or dropped together.
+        """
+        union = labels[0]
+        for lab in labels[1:]:
+            union = np.where(union == 0, lab, union)
+
+        rows, cols = np.nonzero(union)
+        ids = union[rows, cols]
+        if ids.size == 0:
+            return ids
+
+        n = int(ids.max()) + 1
+        count = np.bincount(ids, minlength=n)
+        present = np.flatnonzero(count[1:]) + 1
+        cy = np.bincount(ids, weights=rows, minlength=n)[present] / count[present]
+        cx = np.bincount(ids, weights=cols, minlength=n)[present] / count[present]
+
+        # centroids in image coordinates
+        cy += extended[0].start
+        cx += extended[1].start
+        inside = (
+            (cy >= core[0].start)
+            & (cy < core[0].stop)
+            & (cx >= core[1].start)
+            & (cx < core[1].stop)
+        )
+        return present[inside]
+
+    def stitch(
+        self,
+        outputs: List[np.ndarray],
+        tile_labels: List[np.ndarray],
+        extended: Tuple[slice, slice],
+        core: Tuple[slice, slice],
+        next_id: int,
+    ) -> int:
+        """Paste the objects owned by one tile into the full outputs.
+
+        Returns:
+            The first unused global object ID.
+        """
+        tile_labels = [np.asarray(lab) for lab in tile_labels]
+        owned = self.owned_labels(tile_labels, extended, core)
+        if owned.size == 0:
+            return next_id
+
+        lut = np.zeros(int(owned.max()) + 1, dtype=np.int32)
+        lut[owned] = np.arange(next_id, next_id + owned.size, dtype=np.int32)
+
+        for out, lab in zip(outputs, tile_labels):
+            lab = np.where(lab <= owned.max(), lab, 0).astype(np.intp)
+            relabelled = lut[lab]
+            # objects from earlier tiles win where neighbours overlap at seams
+            target = out[extended]
+            free = (relabelled > 0) & (target == 0)
+            target[free] = relabelled[free]
+
+        return next_id + owned.size
+
+    def run(self, *in_image):
+
+        in_image = [np.asarray(im) for im in in_image]
+        shape = in_image[0].shape[-2:]
+        for im in in_image[1:]:
+            if im.shape[-2:] != shape:
+                raise ValueError("All inputs must have the same spatial shape.")
+
+        grid = self.tile_grid(shape, self.params.tile_size, self.params.overlap)
+        tiles = ([im[(..., *extended)] for im in in_image] for extended, _ in grid)
+        logger.info(f"Segmenting {len(grid)} tile(s) with '{self.params.segmenter}'.")
+
+        if self.segmenter is not None:
+            results = (self.segmenter.run(*t) for t in tiles)
+            executor = None
+        else:
+            # the workers start on the first submit and inherit the caps
+            with inherited_thread_limits(self.params.threads_per_worker):
+                executor = ProcessPoolExecutor(
+                    max_workers=self.params.n_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_tile_worker,
+                    initargs=(
+                        self.processor_class,
+                        self.params.parameters,
+                        self.params.threads_per_worker,
+                    ),
+                )
+                results = executor.map(_segment_tile, tiles)
+
+        outputs = None
+        next_id = 1
+        try:
+            # tiles are stitched in grid order, which keeps the IDs reproducible
+            for (extended, core), result in zip(grid, results):
+                single = not isinstance(result, (list, tuple))
+                tile_labels = [result] if single else list(result)
+                if outputs is None:
+                    outputs = [np.zeros(shape, dtype=np.int32) for _ in tile_labels]
+                next_id = self.stitch(outputs, tile_labels, extended, core, next_id)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        logger.info(f"Stitched {next_id - 1} object(s).")
+
+        return outputs[0] if single else outputs
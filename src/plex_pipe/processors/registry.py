@@ -5,13 +5,14 @@ from typing import Any, Dict, Literal, Type
 
 from pydantic import BaseModel
 
-from plex_pipe.processors.base import BaseOp
+from plex_pipe.processors.base import BaseOp, ProcessorCapabilities
 
 
 @dataclass
 class RegistryEntry:
     processor_class: Type[BaseOp]
     param_model: Type[BaseModel]
+    capabilities: ProcessorCapabilities
 
 
 Kind = Literal[
@@ -38,7 +39,9 @@ def register(kind: Kind, name: str):
 
         # Create and store the complete registry entry
         REGISTRY[kind][name] = RegistryEntry(
-            processor_class=cls, param_model=param_model
+            processor_class=cls,
+            param_model=param_model,
+            capabilities=cls.declared_capabilities(),
         )
         cls.kind = kind
         cls.type_name = name
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Dict, List, Optional, Sequence, Set
+
+from loguru import logger
+
+from plex_pipe.processors.controller import ResourceBuildingController
+
+
+class StepScheduler:
+    """Runs the steps of a pipeline as a dependency graph.
+
+    The graph is derived from the input and output names of the steps, in
+    the order in which they are listed (the same order that
+    `AnalysisConfig.validate_pipeline` checks). A step depends on the last
+    earlier step producing one of its inputs. A step that overwrites an
+    element also waits for the earlier producer of that element and for
+    every step reading it in between. Steps whose dependencies are met
+    run concurrently in a thread pool.
+
+    Elements produced by steps with `keep: false` are intermediates. They
+    are removed from the SpatialData object as soon as the last step reading
+    them has finished.
+
+    Changes to the SpatialData object (clearing, storing and writing
+    outputs) are serialized with a lock. Running the builders and computing
+    the intermediates read by later steps is not. Lazy outputs of tiled
+    builders that are kept are not held in memory; they are written to disk
+    tile by tile under the lock and read back lazily.
+
+    Concurrency follows the capabilities of the builders: a step whose
+    builder is not thread-safe never runs next to another such step, and
+    with a `memory_budget` a step only starts if its estimated memory use
+    fits next to the steps already running. A step always starts when no
+    other step is running, so a single large step cannot stall the run.
+    """
+
+    def __init__(
+        self,
+        controllers: Sequence[ResourceBuildingController],
+        max_workers: Optional[int] = None,
+        memory_budget: Optional[int] = None,
+    ) -> None:
+        """Initializes the StepScheduler.
+
+        Args:
+            controllers: The steps of the pipeline, in config order.
+            max_workers: The maximum number of steps running at once. If
+                None, the default of `ThreadPoolExecutor` is used.
+            memory_budget: The memory in bytes the steps running at once may
+                use together. If None, memory does not limit concurrency.
+        """
+
+        self.controllers = list(controllers)
+        self.max_workers = max_workers
+        self.memory_budget = memory_budget
+
+        for controller in self.controllers:
+            in_list, out_list = controller.builder.validate_io(
+                inputs=controller.input_names, outputs=controller.output_names
+            )
+            controller.input_names = in_list
+            controller.output_names = out_list
+
+        self.dependencies = self.build_graph()
+        self.releases = self.plan_releases()
+
+    def build_graph(self) -> List[Set[int]]:
+        """Returns the set of steps every step has to wait for."""
+
+        last_writer: Dict[str, int] = {}
+        readers: Dict[str, Set[int]] = {}
+        dependencies = []
+
+        for i, controller in enumerate(self.controllers):
+            deps = set()
+            for name in controller.input_names:
+                if name in last_writer:
+                    deps.add(last_writer[name])
+            for name in controller.output_names:
+                if name in last_writer:
+                    deps.add(last_writer[name])
+                deps |= readers.get(name, set())
+            deps.discard(i)
+            dependencies.append(deps)
+
+            for name in controller.input_names:
+                readers.setdefault(name, set()).add(i)
+            for name in controller.output_names:
+                last_writer[name] = i
+                readers[name] = set()
+
+        return dependencies
+
+    def plan_releases(self) -> List[Dict[str, Set[int]]]:
+        """Returns, per step, its intermediate outputs and the steps reading them.
+
+        An output stops being read once a later step overwrites it.
+        """
+
+        releases = []
+        for i, controller in enumerate(self.controllers):
+            consumers = {}
+            if not controller.keep:
+                for name in controller.output_names:
+                    consumers[name] = set()
+                    for j in range(i + 1, len(self.controllers)):
+                        later = self.controllers[j]
+                        if name in later.input_names:
+                            consumers[name].add(j)
+                        if name in later.output_names:
+                            break
+            releases.append(consumers)
+
+        return releases
+
+    def release(self, sdata, name: str) -> None:
+        """Removes an intermediate element from the SpatialData object."""
+        if name in sdata:
+            del sdata[name]
+            for controller in self.controllers:
+                controller.invalidate_cache(sdata, name)
+            logger.info(f"Intermediate element '{name}' released.")
+
+    def finish(self, sdata, i: int, pending_reads: Dict[str, Set[int]]) -> None:
+        """Releases the intermediates that are no longer read after step i.
+
+        Args:
+            sdata: The SpatialData object the step ran on.
+            i: The index of the finished step.
+            pending_reads: The intermediates of the SpatialData object still
+                waiting for some of their readers. Updated in place.
+        """
+        for name, readers in self.releases[i].items():
+            if readers:
+                pending_reads[name] = set(readers)
+            else:
+                self.release(sdata, name)
+        for name in self.controllers[i].input_names:
+            readers = pending_reads.get(name)
+            if readers is not None and i in readers:
+                readers.discard(i)
+                if not readers:
+                    del pending_reads[name]
+                    self.release(sdata, name)
+
+    def run(self, sdata):
+        """Runs all steps on a SpatialData object.
+
+        Args:
+            sdata: The SpatialData object to process.
+
+        Returns:
+            The processed SpatialData object.
+
+        Raises:
+            Exception: The first error raised by a step. Steps that are
+                already running are allowed to finish; no new steps start.
+        """
+
+        lock = threading.Lock()
+
+        # intermediates still waiting for some of their readers
+        pending_reads: Dict[str, Set[int]] = {}
+
+        def run_step(i):
+            controller = self.controllers[i]
+            with lock:
+                fingerprint = controller.prepare(sdata)
+            if fingerprint is None:
+                return
+            # tiled builders return lazy outputs; intermediates read by later
+            # steps are computed here, outside the lock, while saved outputs
+            # are streamed to disk on commit and read back lazily
+            persist = any(self.releases[i].values())
+            prepared = controller.prepare_outputs(
+                sdata, controller.build(sdata), persist=persist
+            )
+            with lock:
+                controller.commit_outputs(sdata, prepared, fingerprint)
+
+        def can_start(i):
+            controller = self.controllers[i]
+            if self.memory_budget is not None:
+                with lock:
+                    estimates[i] = controller.estimate_memory(sdata)
+            if not running:
+                return True
+            if not controller.builder.capabilities().thread_safe and any(
+                not self.controllers[j].builder.capabilities().thread_safe
+                for j in running.values()
+            ):
+                return False
+            if self.memory_budget is not None:
+                in_use = sum(estimates[j] for j in running.values())
+                if in_use + estimates[i] > self.memory_budget:
+                    return False
+            return True
+
+        waiting = {i: set(deps) for i, deps in enumerate(self.dependencies)}
+        running: Dict[Future, int] = {}
+        estimates = dict.fromkeys(range(len(self.controllers)), 0)
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while waiting or running:
+                if error is None:
+                    for i in sorted(i for i, deps in waiting.items() if not deps):
+                        if not can_start(i):
+                            continue
+                        del waiting[i]
+                        running[pool.submit(run_step, i)] = i
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        logger.error(
+                            f"Step {i} ('{self.controllers[i].builder.type_name}') failed."
+                        )
+                        continue
+                    with lock:
+                        self.finish(sdata, i, pending_reads)
+                    for deps in waiting.values():
+                        deps.discard(i)
+
+        if error is not None:
+            raise error
+
+        return sdata
@@ -0,0 +1,346 @@
+"""Long-running segmentation worker and its client.
+
+Loading segmentation models (and importing their frameworks) dominates the
+start-up time of ``02_segment.py``. The worker keeps built processors alive
+between requests so that several pipeline processes on one node can share
+a single warm model. Requests travel over a local socket
+(:mod:`multiprocessing.connection`), image and label arrays travel through
+:mod:`multiprocessing.shared_memory` so that only a small header is pickled.
+
+Both ends unpickle what they receive, so only processes of the same user may
+connect: the socket lives in a directory private to the user and connections
+are authenticated with a random key kept in a file only the user can read.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import getpass
+import json
+import os
+import secrets
+import sys
+import tempfile
+import threading
+from multiprocessing import AuthenticationError, resource_tracker
+from multiprocessing.connection import Client, Connection, Listener
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+SOCKET_NAME = "segmentation.sock"
+AUTHKEY_NAME = "worker.key"
+
+# (shared memory name, shape, dtype string)
+ArrayHeader = Tuple[str, Tuple[int, ...], str]
+
+
+def runtime_dir() -> Path:
+    """Return the directory of the worker files, private to the current user.
+
+    It is ``$XDG_RUNTIME_DIR/plex_pipe`` if the variable is set and a
+    per-user directory in the temporary directory otherwise. It is created
+    with mode 0700 if missing.
+
+    Raises:
+        PermissionError: If the directory belongs to another user.
+    """
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if base:
+        path = Path(base) / "plex_pipe"
+    else:
+        path = Path(tempfile.gettempdir()) / f"plex_pipe-{getpass.getuser()}"
+
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if os.name == "posix":
+        stat = path.lstat()
+        if stat.st_uid != os.getuid() or not path.is_dir() or path.is_symlink():
+            raise PermissionError(
+                f"{path} is not a directory owned by the current user."
+            )
+        if stat.st_mode & 0o077:
+            path.chmod(0o700)
+    return path
+
+
+def default_address() -> str:
+    """Return the socket path used when no address is given."""
+    return str(runtime_dir() / SOCKET_NAME)
+
+
+def load_authkey() -> bytes:
+    """Return the key shared by the worker and its clients.
+
+    The key is generated on first use and kept in a file of the user's
+    runtime directory that only the user can read.
+    """
+    path = runtime_dir() / AUTHKEY_NAME
+    if not path.exists():
+        # write the key aside and link it into place, so that concurrent
+        # first uses agree on one key and never read a partial file
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(secrets.token_bytes(32))
+            with contextlib.suppress(FileExistsError):
+                os.link(tmp, path)
+        finally:
+            os.unlink(tmp)
+    return path.read_bytes()
+
+
+def open_shared_memory(
+    name: str | None = None, size: int = 0, create: bool = False
+) -> SharedMemory:
+    """Open a shared memory block without registering it for cleanup.
+
+    The worker never owns the blocks it touches: inputs belong to the
+    client and outputs are handed over to it. Keeping them away from this
+    process' resource tracker stops it from unlinking them behind the
+    client's back.
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, create=create, size=size, track=False)
+    shm = SharedMemory(name=name, create=create, size=size)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def share_array(arr: np.ndarray, shm: SharedMemory) -> ArrayHeader:
+    """Copy ``arr`` into ``shm`` and return the header describing it."""
+    view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+    view[...] = arr
+    return shm.name, arr.shape, arr.dtype.str
+
+
+def view_array(header: ArrayHeader, shm: SharedMemory) -> np.ndarray:
+    """Return an array viewing the shared memory described by ``header``."""
+    _, shape, dtype = header
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+class SegmentationWorker:
+    """Serve segmentation requests with processors kept in memory.
+
+    Each client connection is handled in its own thread. Processors are
+    cached by kind, type and parameters; calls into the same processor are
+    serialized, calls into different processors may run concurrently.
+
+    Args:
+        address (str, optional): Unix socket path (or Windows pipe name) to
+            listen on. Defaults to a socket in the user's runtime directory.
+        authkey (bytes, optional): Shared secret the clients must present.
+            Defaults to the key of the user (see :func:`load_authkey`).
+    """
+
+    def __init__(self, address: str | None = None, authkey: bytes | None = None):
+        self.address = str(address) if address is not None else default_address()
+        self.authkey = authkey if authkey is not None else load_authkey()
+        self.processors: Dict[str, Tuple[Any, threading.Lock]] = {}
+        self._cache_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def cache_key(kind: str, type_name: str, params: Dict[str, Any]) -> str:
+        return json.dumps([kind, type_name, params], sort_keys=True, default=str)
+
+    def get_processor(self, kind: str, type_name: str, params: Dict[str, Any]):
+        """Return a cached processor, building it on first use."""
+        from plex_pipe.processors.registry import build_processor
+
+        key = self.cache_key(kind, type_name, params)
+        with self._cache_lock:
+            if key not in self.processors:
+                logger.info(f"Loading {kind} '{type_name}' with params {params}.")
+                processor = build_processor(kind, type_name, **params)
+                self.processors[key] = (processor, threading.Lock())
+            return self.processors[key]
+
+    def segment(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Run one request and hand the outputs over in shared memory."""
+        processor, lock = self.get_processor(
+            request["kind"], request["type"], request["params"]
+        )
+
+        inputs = [open_shared_memory(header[0]) for header in request["inputs"]]
+        try:
+            arrays = [view_array(h, s) for h, s in zip(request["inputs"], inputs)]
+            with lock:
+                result = processor.run(*arrays)
+
+            single = not isinstance(result, (list, tuple))
+            headers = []
+            for out in [result] if single else result:
+                out = np.ascontiguousarray(out)
+                shm = open_shared_memory(create=True, size=max(out.nbytes, 1))
+                headers.append(share_array(out, shm))
+                shm.close()
+        finally:
+            # drop every view on the inputs before unmapping them
+            arrays = result = out = None
+            for shm in inputs:
+                shm.close()
+
+        return {"ok": True, "outputs": headers, "single": single}
+
+    def handle_connection(self, conn: Connection) -> None:
+        """Answer requests on one client connection until it closes."""
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                op = request.get("op")
+                try:
+                    if op == "segment":
+                        response = self.segment(request)
+                    elif op == "ping":
+                        response = {"ok": True, "loaded": len(self.processors)}
+                    elif op == "shutdown":
+                        conn.send({"ok": True})
+                        self.shutdown()
+                        return
+                    else:
+                        raise ValueError(f"Unknown request '{op}'.")
+                except Exception as e:  # noqa: BLE001 - keep serving other requests
+                    logger.exception(f"Request '{op}' failed.")
+                    response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+                conn.send(response)
+
+    def serve_forever(self) -> None:
+        """Accept client connections until :meth:`shutdown` is called."""
+        if os.path.exists(self.address):
+            # a socket file left behind by a worker that did not exit cleanly
+            try:
+                Client(self.address, authkey=self.authkey).close()
+            except OSError:
+                os.unlink(self.address)
+            else:
+                raise RuntimeError(f"A worker is already serving {self.address}.")
+
+        with Listener(self.address, authkey=self.authkey) as listener:
+            if os.name == "posix":
+                # the socket may be placed outside the runtime directory
+                os.chmod(self.address, 0o600)
+            logger.info(f"Segmentation worker listening on {self.address}.")
+            while not self._stopped.is_set():
+                try:
+                    conn = listener.accept()
+                except (OSError, AuthenticationError) as e:
+                    logger.warning(f"Rejected a connection: {e}")
+                    continue
+                if self._stopped.is_set():
+                    conn.close()
+                    break
+                threading.Thread(
+                    target=self.handle_connection, args=(conn,), daemon=True
+                ).start()
+
+        logger.info("Segmentation worker stopped.")
+
+    def shutdown(self) -> None:
+        """Stop accepting connections."""
+        self._stopped.set()
+        # wake up the accept() call in serve_forever
+        with contextlib.suppress(OSError):
+            Client(self.address, authkey=self.authkey).close()
+
+
+class SegmentationClient:
+    """Send processor runs to a :class:`SegmentationWorker`.
+
+    The connection is opened on first use and reused afterwards.
+
+    Args:
+        address (str, optional): Address the worker listens on. Defaults to
+            the socket in the user's runtime directory.
+        authkey (bytes, optional): Shared secret of the worker. Defaults to
+            the key of the user (see :func:`load_authkey`).
+    """
+
+    def __init__(self, address: str | None = None, authkey: bytes | None = None):
+        self.address = str(address) if address is not None else default_address()
+        self.authkey = authkey if authkey is not None else load_authkey()
+        self._conn: Connection | None = None
+        self._lock = threading.Lock()
+
+    def connect(self) -> Connection:
+        if self._conn is None:
+            try:
+                self._conn = Client(self.address, authkey=self.authkey)
+            except OSError as e:
+                raise ConnectionError(
+                    f"No segmentation worker reachable at {self.address}. "
+                    "Start one with scripts/segmentation_worker.py."
+                ) from e
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            conn = self.connect()
+            conn.send(request)
+            response = conn.recv()
+        if not response.get("ok", False):
+            raise RuntimeError(f"Segmentation worker failed: {response.get('error')}")
+        return response
+
+    def ping(self) -> Dict[str, Any]:
+        return self.request({"op": "ping"})
+
+    def run(
+        self,
+        kind: str,
+        type_name: str,
+        params: Dict[str, Any],
+        arrays: Sequence[np.ndarray],
+    ) -> np.ndarray | List[np.ndarray]:
+        """Run processor ``kind``/``type_name`` built with ``params`` remotely.
+
+        Returns:
+            Whatever the processor's ``run`` returns: a single array or a
+            list of arrays.
+        """
+        inputs = []
+        try:
+            headers = []
+            for arr in arrays:
+                arr = np.ascontiguousarray(arr)
+                shm = SharedMemory(create=True, size=max(arr.nbytes, 1))
+                inputs.append(shm)
+                headers.append(share_array(arr, shm))
+
+            response = self.request(
+                {
+                    "op": "segment",
+                    "kind": kind,
+                    "type": type_name,
+                    "params": params,
+                    "inputs": headers,
+                }
+            )
+        finally:
+            for shm in inputs:
+                shm.close()
+                shm.unlink()
+
+        outputs = []
+        for header in response["outputs"]:
+            shm = SharedMemory(name=header[0])
+            try:
+                outputs.append(view_array(header, shm).copy())
+            finally:
+                shm.close()
+                shm.unlink()
+
+        return outputs[0] if response["single"] else outputs
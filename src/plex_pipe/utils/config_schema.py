@@ -17,9 +17,14 @@ from pydantic import (
     Field,
     ValidationInfo,
     create_model,
+    field_validator,
     model_validator,
 )
 
+from plex_pipe.object_quantification.engine import (
+    validate_morphology,
+    validate_statistics,
+)
 from plex_pipe.processors.registry import REGISTRY, Kind
 
 if TYPE_CHECKING:
@@ -73,12 +78,32 @@ class QuantTask(BaseModel):
     name: str
     masks: Dict[str, str]
     layer_connection: str | None = None
+    statistics: List[str] = ["mean", "median"]
+    morphology: List[str] = ["area", "centroid", "eccentricity"]
+    neighbors_radius: float | None = Field(None, gt=0)
+    neighbors_k: int | None = Field(None, gt=0)
+    contact_graph: bool = False
+
+    @field_validator("statistics")
+    @classmethod
+    def check_statistics(cls, v: List[str]) -> List[str]:
+        validate_statistics(v)
+        return v
+
+    @field_validator("morphology")
+    @classmethod
+    def check_morphology(cls, v: List[str]) -> List[str]:
+        validate_morphology(v)
+        return v
 
 
 class StorageSettings(BaseModel):
     chunk_size: List[int]
     max_pyramid_level: int
     downscale: int
+    label_dtype: Literal["smallest", "int32"] = "smallest"
+    relabel_sequential: bool = False
+    image_dtype: Literal["float32", "float16", "uint16"] = "float32"
 
 
 ###################################################################
@@ -140,6 +165,7 @@ class AnalysisConfig(BaseModel):
     core_info_file_path: Path = Path(".")
     cores_dir_tif_path: Path = Path(".")
     cores_dir_output_path: Path = Path(".")
+    feature_store_path: Path = Path(".")
 
     @model_validator(mode="after")
     def _resolve_paths(self, info: ValidationInfo) -> AnalysisConfig:
@@ -182,6 +208,7 @@ class AnalysisConfig(BaseModel):
         )
 
         self.temp_dir = defaults["temp_dir"]
+        self.feature_store_path = analysis_dir / "feature_store"
 
         return self
 
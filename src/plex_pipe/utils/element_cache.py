@@ -0,0 +1,122 @@
+"""Memory-bounded cache of SpatialData elements loaded into memory."""
+
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+import spatialdata as sd
+from loguru import logger
+
+
+class ElementCache:
+    """
+    LRU cache of elements materialized from a SpatialData object.
+
+    Entries are keyed by the SpatialData object, the element name and the
+    resolution level, so controllers working on the same core share the decoded
+    arrays. Cached arrays are read-only; the least recently used entries are
+    evicted once the total size exceeds ``max_bytes``. Entries of a SpatialData
+    object are dropped when the object is garbage collected.
+
+    Args:
+        max_bytes (int): Upper bound on the memory held by the cache.
+    """
+
+    def __init__(self, max_bytes: int = 2 * 1024**3):
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Tuple[int, str, int], np.ndarray] = OrderedDict()
+        self._owners = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _register_owner(self, sdata) -> int:
+        owner = id(sdata)
+        if owner not in self._owners:
+            self._owners[owner] = weakref.finalize(sdata, self._drop_owner, owner)
+        return owner
+
+    def _drop_owner(self, owner: int) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == owner]:
+                self.nbytes -= self._entries.pop(key).nbytes
+            self._owners.pop(owner, None)
+
+    def get(
+        self,
+        sdata,
+        name: str,
+        level: int = 0,
+        loader: Optional[Callable[[], np.ndarray]] = None,
+    ) -> np.ndarray:
+        """
+        Returns an element as a read-only numpy array, loading it on a miss.
+
+        Args:
+            sdata (SpatialData): The object holding the element.
+            name (str): The element name.
+            level (int): The resolution level.
+            loader (callable, optional): Loads the array on a cache miss. By
+                default the squeezed pyramid level is read.
+        Returns:
+            np.ndarray: The cached array.
+        """
+        key = (id(sdata), name, level)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        if loader is None:
+            arr = np.array(sd.get_pyramid_levels(sdata[name], n=level)).squeeze()
+        else:
+            arr = np.asarray(loader())
+        arr.setflags(write=False)
+
+        if arr.nbytes > self.max_bytes:
+            logger.debug(f"Element '{name}' is larger than the cache; not cached.")
+            return arr
+
+        with self._lock:
+            self._register_owner(sdata)
+            if key not in self._entries:
+                self._entries[key] = arr
+                self.nbytes += arr.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+        return arr
+
+    def invalidate(self, sdata, name: Optional[str] = None) -> None:
+        """
+        Drops the cached levels of an element, or all elements of ``sdata``.
+
+        Args:
+            sdata (SpatialData): The object holding the element.
+            name (str, optional): The element name. If None, every element of
+                ``sdata`` is dropped.
+        """
+        owner = id(sdata)
+        with self._lock:
+            for key in [
+                k
+                for k in self._entries
+                if k[0] == owner and (name is None or k[1] == name)
+            ]:
+                self.nbytes -= self._entries.pop(key).nbytes
+
+    def clear(self) -> None:
+        """Drops all entries."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
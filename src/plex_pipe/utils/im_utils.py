@@ -1,5 +1,6 @@
 """Image utilities for reading multiscale images and preparing RGB previews."""
 
+import dask
 import dask.array as da
 import numpy as np
 import zarr
@@ -95,6 +96,182 @@ def prepare_rgb_image(im_path, perc_min=0.01, perc_max=99, req_level=0):
     return im_rgb
 
 
-def calculate_median(mask, im):
-    # extra property for regionprops
-    return np.median(im[mask > 0])
+def upscale_nearest(arr, factor, shape=None, chunks=None):
+    """
+    Nearest-neighbour upscaling by an integer factor through block replication.
+
+    Every pixel is repeated into a block of ``factor`` pixels along each axis.
+    The result is a lazy dask array with the dtype of the input, so labels are
+    never converted to floats and are only materialized chunk by chunk.
+
+    Args:
+        arr (np.ndarray or da.Array): The array to upscale.
+        factor (int or tuple): The upscaling factor, for all or for each axis.
+        shape (tuple, optional): Target shape. The upscaled array is cropped to
+            it, or padded by repeating its edge if it falls short (for pyramid
+            levels of odd-sized images).
+        chunks (tuple, optional): Approximate chunk size of the result.
+    Returns:
+        da.Array: The upscaled array.
+    """
+    factors = (factor,) * arr.ndim if np.isscalar(factor) else tuple(factor)
+
+    if chunks is not None:
+        small_chunks = tuple(max(1, c // f) for c, f in zip(chunks, factors))
+    else:
+        small_chunks = "auto"
+    up = da.asarray(arr).rechunk(small_chunks)
+
+    def replicate(block):
+        for axis, f in enumerate(factors):
+            block = np.repeat(block, f, axis=axis)
+        return block
+
+    up = up.map_blocks(
+        replicate,
+        chunks=tuple(
+            tuple(c * f for c in axis_chunks)
+            for axis_chunks, f in zip(up.chunks, factors)
+        ),
+        dtype=up.dtype,
+    )
+
+    if shape is not None:
+        up = up[tuple(slice(0, s) for s in shape)]
+        pad = [(0, s - n) for s, n in zip(shape, up.shape)]
+        if any(after for _, after in pad):
+            up = da.pad(up, pad, mode="edge")
+
+    return up
+
+
+# key in `SpatialData.attrs` mapping quantized image elements to the scale
+# needed to restore their values
+QUANTIZATION_KEY = "plex_pipe_quantization"
+
+
+def smallest_label_dtype(max_label):
+    """
+    Returns the smallest unsigned integer dtype holding labels up to ``max_label``.
+
+    Args:
+        max_label (int): The largest label.
+    Returns:
+        np.dtype: uint8, uint16, uint32 or uint64.
+    """
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if max_label <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError(f"Label {max_label} does not fit into an unsigned integer.")
+
+
+def compact_labels(arrays, relabel=False, max_label=None):
+    """
+    Stores label arrays in the smallest unsigned dtype that fits all of them.
+
+    With ``relabel`` the labels are first renumbered sequentially (1..n). The
+    arrays are relabelled jointly with one lookup table, so an object keeps
+    the same ID in all of them (e.g. the nucleus and the cell of Instanseg).
+    Lazy arrays stay lazy. If their labels are needed, they are computed
+    into memory once and the result is used for the conversion too.
+
+    Args:
+        arrays (list of np.ndarray or da.Array): Label arrays, background 0.
+        relabel (bool): Whether to renumber the labels sequentially.
+        max_label (int, optional): A known upper bound of the labels; the
+            dtype is then chosen without looking at the arrays.
+    Returns:
+        list: The converted arrays, in order.
+    """
+    if not arrays:
+        return []
+
+    if max_label is not None and not relabel:
+        dtype = smallest_label_dtype(int(max_label))
+        return [a.astype(dtype) for a in arrays]
+
+    lazy = [i for i, a in enumerate(arrays) if isinstance(a, da.Array)]
+    if lazy:
+        arrays = list(arrays)
+        persisted = dask.persist(*(arrays[i] for i in lazy))
+        for i, a in zip(lazy, persisted):
+            arrays[i] = a
+
+    if relabel:
+        uniques = [
+            da.unique(a).compute() if isinstance(a, da.Array) else np.unique(a)
+            for a in arrays
+        ]
+        labels = np.union1d(np.concatenate(uniques), [0]).astype(np.int64)
+        dtype = smallest_label_dtype(len(labels) - 1)
+        # labels are sorted with 0 first, so searchsorted yields 0..n
+
+        def renumber(block):
+            return np.searchsorted(labels, block).astype(dtype)
+
+        return [
+            (
+                a.map_blocks(renumber, dtype=dtype)
+                if isinstance(a, da.Array)
+                else renumber(np.asarray(a))
+            )
+            for a in arrays
+        ]
+
+    maxima = [a.max() for a in arrays]
+    if any(isinstance(m, da.Array) for m in maxima):
+        maxima = da.compute(*maxima)
+    dtype = smallest_label_dtype(int(max(maxima)))
+    return [a.astype(dtype) for a in arrays]
+
+
+def quantize_image(arr, dtype):
+    """
+    Converts a float image to a compact dtype for storage.
+
+    For uint16 the value range is mapped linearly onto 0..65535; the scale and
+    offset needed to restore the values are returned. float16 is a plain cast.
+
+    Args:
+        arr (np.ndarray or da.Array): The float image.
+        dtype (str): "uint16" or "float16".
+    Returns:
+        tuple: The converted array and a dict describing the conversion, for
+        `dequantize_image`.
+    """
+    if dtype == "float16":
+        return arr.astype(np.float16), {"dtype": "float16"}
+    if dtype != "uint16":
+        raise ValueError(f"Unsupported storage dtype '{dtype}'.")
+
+    low, high = arr.min(), arr.max()
+    if isinstance(arr, da.Array):
+        low, high = da.compute(low, high)
+    low, high = float(low), float(high)
+    scale = (high - low) / np.iinfo(np.uint16).max or 1.0
+
+    quantized = ((arr - low) / scale).round().clip(0, np.iinfo(np.uint16).max)
+    return quantized.astype(np.uint16), {
+        "dtype": "uint16",
+        "scale": scale,
+        "offset": low,
+    }
+
+
+def dequantize_image(arr, info):
+    """
+    Restores a stored image as float32, undoing `quantize_image`.
+
+    Args:
+        arr (np.ndarray or da.Array): The stored image.
+        info (dict or None): The description returned by `quantize_image`. If
+            None, the array is returned unchanged.
+    Returns:
+        np.ndarray or da.Array: The restored image.
+    """
+    if info is None:
+        return arr
+    arr = arr.astype(np.float32)
+    if info["dtype"] == "uint16":
+        arr = arr * np.float32(info["scale"]) + np.float32(info["offset"])
+    return arr
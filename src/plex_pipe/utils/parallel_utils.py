@@ -0,0 +1,198 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from loguru import logger
+
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+
+@contextmanager
+def inherited_thread_limits(n_threads: Optional[int]) -> Iterator[None]:
+    """
+    Caps the BLAS/OpenMP threads of the processes started within the block.
+
+    The libraries read the environment variables once, when they are loaded.
+    Spawned processes copy the environment of their parent before importing
+    anything, so the caps must be set here rather than in their initializer.
+    The previous values are restored on exit.
+
+    Args:
+        n_threads (int or None): Thread cap. If None, nothing is changed.
+    """
+    if n_threads is None:
+        yield
+        return
+
+    previous = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    os.environ.update(dict.fromkeys(THREAD_ENV_VARS, str(n_threads)))
+    try:
+        yield
+    finally:
+        for var, value in previous.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def limit_threads(n_threads: Optional[int]) -> None:
+    """
+    Caps the threads used by BLAS/OpenMP libraries, torch and dask in this process.
+
+    The environment variables only take effect for libraries loaded afterwards;
+    the thread pools of loaded ones are capped with threadpoolctl, if installed.
+    Use `inherited_thread_limits` for processes started from this one.
+
+    Args:
+        n_threads (int or None): Thread cap. If None, nothing is changed.
+    """
+    if n_threads is None:
+        return
+
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(n_threads)
+
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        pass
+    else:
+        threadpool_limits(limits=n_threads)
+
+    import dask
+
+    dask.config.set(num_workers=n_threads)
+
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(n_threads)
+
+
+def worker_log_path(log_dir: Path, log_name: str) -> Path:
+    """Returns the log file of the current worker process."""
+    return Path(log_dir) / f"{log_name}_worker{os.getpid()}.log"
+
+
+def init_worker(
+    n_threads: Optional[int], log_dir: Optional[Path], log_name: str
+) -> None:
+    """
+    Prepares a worker process: thread caps and a log file of its own.
+    """
+    limit_threads(n_threads)
+
+    if log_dir is not None:
+        logger.remove()
+        logger.add(worker_log_path(log_dir, log_name), level="DEBUG")
+
+
+def run_logged(func: Callable[[Any], Any], item: Any) -> Any:
+    """Runs ``func`` on ``item``, logging a traceback to the worker log on failure."""
+    try:
+        return func(item)
+    except Exception:
+        logger.exception(f"Processing of '{item}' failed.")
+        raise
+
+
+def run_per_core(
+    func: Callable[[Any], Any],
+    items: Sequence[Any],
+    n_workers: int = 1,
+    threads_per_worker: Optional[int] = None,
+    log_dir: Optional[Path] = None,
+    log_name: str = "cores",
+    max_retries: int = 1,
+) -> Dict[str, List[Any]]:
+    """
+    Runs ``func`` on every item (core) in a pool of worker processes.
+
+    A failing core is logged and recorded, the remaining cores are still processed.
+    If a worker dies (e.g. killed for running out of memory) the cores it was
+    processing cannot be told apart from the others in flight, so all unfinished
+    cores are resubmitted to a fresh pool, at most ``max_retries`` times each.
+
+    Args:
+        func (callable): Picklable function processing one item.
+        items (sequence): The items to process, e.g. paths of cores.
+        n_workers (int): Number of worker processes. With 1 the items are
+            processed in the current process.
+        threads_per_worker (int or None): Thread cap of every worker.
+        log_dir (Path or None): Directory for the per worker log files.
+        log_name (str): Prefix of the log files.
+        max_retries (int): How often a core is resubmitted after a worker crash.
+
+    Returns:
+        dict: ``{"done": [...], "failed": [...], "results": {...}}`` with the
+        processed items and the value ``func`` returned for every done item.
+    """
+    done, failed, results = [], [], {}
+
+    if n_workers <= 1:
+        limit_threads(threads_per_worker)
+        for item in items:
+            try:
+                results[item] = func(item)
+                done.append(item)
+            except Exception:  # noqa: BLE001 - one bad core must not stop the run
+                logger.exception(f"Processing of '{item}' failed.")
+                failed.append(item)
+        return {"done": done, "failed": failed, "results": results}
+
+    log_name = f"{log_name}_{datetime.now():%Y-%m-%d_%H-%M-%S}"
+    attempts = dict.fromkeys(range(len(items)), 0)
+    remaining = list(range(len(items)))
+
+    while remaining:
+        broken = []
+        # spawned workers take the thread caps from the environment at start-up
+        with inherited_thread_limits(threads_per_worker):
+            with ProcessPoolExecutor(
+                max_workers=n_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(threads_per_worker, log_dir, log_name),
+            ) as pool:
+                futures = {
+                    pool.submit(run_logged, func, items[i]): i for i in remaining
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        results[items[i]] = future.result()
+                        done.append(items[i])
+                        logger.info(f"Finished '{items[i]}'.")
+                    except BrokenProcessPool:
+                        broken.append(i)
+                    except Exception as e:  # noqa: BLE001 - isolate failing cores
+                        logger.error(f"Processing of '{items[i]}' failed: {e!r}")
+                        failed.append(items[i])
+
+        remaining = []
+        for i in sorted(broken):
+            attempts[i] += 1
+            if attempts[i] > max_retries:
+                logger.error(f"A worker died while processing '{items[i]}'.")
+                failed.append(items[i])
+            else:
+                remaining.append(i)
+        if remaining:
+            logger.warning(
+                f"A worker died; resubmitting {len(remaining)} unfinished core(s)."
+            )
+
+    return {"done": done, "failed": failed, "results": results}
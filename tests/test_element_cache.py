@@ -0,0 +1,85 @@
+import gc
+
+import numpy as np
+import pytest
+import spatialdata as sd
+from spatialdata.models import Labels2DModel
+
+from plex_pipe.utils.element_cache import ElementCache
+
+
+def make_sdata(*names, shape=(32, 32)):
+    return sd.SpatialData(
+        labels={
+            name: Labels2DModel.parse(
+                np.full(shape, i, dtype=np.int32), dims=("y", "x"), scale_factors=[2]
+            )
+            for i, name in enumerate(names, start=1)
+        }
+    )
+
+
+def test_cache_hits_and_read_only():
+    sdata = make_sdata("a")
+    cache = ElementCache()
+
+    first = cache.get(sdata, "a")
+    second = cache.get(sdata, "a")
+
+    assert first is second
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not first.flags.writeable
+    with pytest.raises(ValueError):
+        first[0, 0] = 5
+
+    # levels are cached separately
+    assert cache.get(sdata, "a", level=1).shape == (16, 16)
+    assert len(cache) == 2
+
+
+def test_cache_evicts_least_recently_used():
+    sdata = make_sdata("a", "b", "c")
+    element_bytes = 32 * 32 * 4
+    cache = ElementCache(max_bytes=2 * element_bytes)
+
+    cache.get(sdata, "a")
+    cache.get(sdata, "b")
+    cache.get(sdata, "a")  # 'b' is now the least recently used
+    cache.get(sdata, "c")
+
+    assert cache.nbytes == 2 * element_bytes
+    misses = cache.misses
+    cache.get(sdata, "a")
+    assert cache.misses == misses
+    cache.get(sdata, "b")
+    assert cache.misses == misses + 1
+
+
+def test_cache_skips_oversized_elements():
+    sdata = make_sdata("a")
+    cache = ElementCache(max_bytes=100)
+
+    assert cache.get(sdata, "a").shape == (32, 32)
+    assert len(cache) == 0
+
+
+def test_cache_invalidation():
+    sdata = make_sdata("a", "b")
+    other = make_sdata("a")
+    cache = ElementCache()
+
+    cache.get(sdata, "a")
+    cache.get(sdata, "b")
+    cache.get(other, "a")
+
+    cache.invalidate(sdata, "a")
+    assert len(cache) == 2
+
+    cache.invalidate(sdata)
+    assert len(cache) == 1
+
+    # entries go away with their SpatialData object
+    del other
+    gc.collect()
+    assert len(cache) == 0
+    assert cache.nbytes == 0
@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import numpy as np
+import pyarrow.dataset as ds
+import pytest
+import spatialdata as sd
+
+from plex_pipe.object_quantification.feature_store import FeatureStore
+
+
+@pytest.fixture(scope="module")
+def table():
+    path = Path(__file__).parent / "example_data" / "Core_000.zarr"
+    return sd.read_zarr(path)["instanseg_table"]
+
+
+def test_cores_are_stored_as_partitions(tmp_path, table):
+    store = FeatureStore(tmp_path)
+
+    store.write("quant", "Core_000", table)
+    # a second core quantified with fewer channels
+    store.write("quant", "Core_001", table[:10, :4].copy())
+    # re-running a core replaces its partition
+    store.write("quant", "Core_001", table[:10, :4].copy())
+
+    assert store.cores("quant") == ["Core_000", "Core_001"]
+    assert (tmp_path / "quant" / "core=Core_001" / "part-0.parquet").exists()
+
+    # column and row selections read only what is requested
+    var = table.var_names[0]
+    frame = store.read(
+        "quant", columns=[var, "area_cell"], where=ds.field("area_cell") > 500
+    )
+    assert list(frame.columns) == ["core", var, "area_cell"]
+    assert (frame["area_cell"] > 500).all()
+    assert (
+        len(frame)
+        == (table.obs["area_cell"] > 500).sum()
+        + (table.obs["area_cell"][:10] > 500).sum()
+    )
+
+    adata = store.read_anndata("quant")
+    assert adata.n_obs == table.n_obs + 10
+    assert list(adata.var_names) == list(table.var_names)
+    assert set(adata.obs["core"]) == {"Core_000", "Core_001"}
+
+    core = adata[adata.obs["core"] == "Core_000"]
+    np.testing.assert_allclose(core.X, np.asarray(table.X))
+    np.testing.assert_allclose(
+        core.obsm["centroid_cell"], np.asarray(table.obsm["centroid_cell"])
+    )
+    # channels missing from a core are NaN
+    assert np.isnan(adata[adata.obs["core"] == "Core_001"].X[:, 4:]).all()
+
+    store.remove("quant", "Core_001")
+    assert store.cores("quant") == ["Core_000"]
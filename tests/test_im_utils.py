@@ -80,3 +80,73 @@ def test_prepare_rgb_image_math(mock_get_small):
     # (50 - 10) / (90 - 10) = 40/80 = 0.5 -> 127.5
     mid_pixel = rgb[5, 0]  # Input value 50
     assert 120 < mid_pixel[0] < 135
+
+
+def test_upscale_nearest():
+    """Verifies lazy block replication with per-axis factors and chunking."""
+    import dask.array as da
+
+    small = np.array([[1, 2], [3, 4]], dtype=np.uint16)
+
+    up = im_utils.upscale_nearest(small, (2, 3), chunks=(4, 6))
+
+    assert isinstance(up, da.Array)
+    assert up.dtype == np.uint16
+    assert up.chunksize == (4, 6)
+    np.testing.assert_array_equal(
+        up.compute(), np.kron(small, np.ones((2, 3), dtype=np.uint16))
+    )
+
+
+def test_compact_labels():
+    """Verifies the smallest dtype and the joint sequential relabelling."""
+    import dask.array as da
+
+    nuclei = np.array([[0, 7], [300, 0]], dtype=np.int64)
+    cells = np.array([[7, 7], [300, 300]], dtype=np.int64)
+
+    compact = im_utils.compact_labels([nuclei, cells])
+    assert all(a.dtype == np.uint16 for a in compact)
+    np.testing.assert_array_equal(compact[0], nuclei)
+
+    # the same objects get the same new IDs in both outputs
+    lazy_cells = da.from_array(cells, chunks=1)
+    nuc, cell = im_utils.compact_labels([nuclei, lazy_cells], relabel=True)
+    assert nuc.dtype == np.uint8 and isinstance(cell, da.Array)
+    np.testing.assert_array_equal(nuc, [[0, 1], [2, 0]])
+    np.testing.assert_array_equal(cell.compute(), [[1, 1], [2, 2]])
+
+
+def test_compact_labels_computes_lazy_labels_once():
+    """Verifies that lazy labels are computed once, or not at all with a bound."""
+    import dask.array as da
+
+    calls = []
+
+    def count(block):
+        calls.append(block.shape)
+        return block
+
+    cells = np.array([[7, 7], [300, 300]], dtype=np.int64)
+    lazy_cells = da.from_array(cells, chunks=1).map_blocks(count)
+    calls.clear()  # dask probes the function when building the graph
+
+    (compact,) = im_utils.compact_labels([lazy_cells], max_label=300)
+    assert compact.dtype == np.uint16 and not calls
+
+    (compact,) = im_utils.compact_labels([lazy_cells])
+    np.testing.assert_array_equal(compact.compute(), cells)
+    assert compact.dtype == np.uint16 and len(calls) == 4
+
+
+@pytest.mark.parametrize("dtype", ["uint16", "float16"])
+def test_quantize_image_round_trip(dtype):
+    """Verifies that quantized images are restored within the precision."""
+    img = np.linspace(-0.5, 3.0, 1000, dtype=np.float32).reshape(20, 50)
+
+    stored, info = im_utils.quantize_image(img, dtype)
+    restored = im_utils.dequantize_image(stored, info)
+
+    assert stored.dtype == np.dtype(dtype)
+    assert restored.dtype == np.float32
+    np.testing.assert_allclose(restored, img, atol=3.5 / 65535 + 2e-3)
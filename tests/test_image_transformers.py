@@ -8,6 +8,7 @@ from plex_pipe.processors.image_transformers import (
     DenoiseWithMedian,
     MeanOfImages,
     Normalize,
+    SubtractBackground,
 )
 
 # --- Tests for Normalize Transformer ---
@@ -130,7 +131,8 @@ def test_denoise_median_run(mock_disk, mock_median):
 def test_denoise_median_params():
     """Verifies parameter validation (radius > 0)."""
     with pytest.raises(
-        ValueError, match="Parameters for 'denoise_with_median' are not correct"
+        ValueError,
+        match="Parameters for 'denoise_with_median' are not correct",
     ):
         DenoiseWithMedian(disk_radius=0)
 
@@ -184,3 +186,210 @@ def test_mean_of_images_scalar_input():
     transformer = MeanOfImages()
     with pytest.raises(ValueError, match="expected image array"):
         transformer.run(np.array(5))  # 0-d array
+
+
+def test_mean_of_images_weighted():
+    """Verifies the weighted mean: (1 * 0 + 3 * 8) / 4 = 6."""
+    transformer = MeanOfImages(weights=[1, 3])
+
+    img1 = np.zeros((4, 4), dtype=np.uint16)
+    img2 = np.full((4, 4), 8, dtype=np.uint16)
+
+    result = transformer.run(img1, img2)
+
+    assert np.allclose(result, 6.0)
+    assert result.dtype == np.float32
+
+
+def test_mean_of_images_weights_count_mismatch():
+    """Verifies error when the number of weights does not match the inputs."""
+    transformer = MeanOfImages(weights=[1, 2, 3])
+
+    with pytest.raises(ValueError, match="3 weights for 2 images"):
+        transformer.run(np.zeros((4, 4)), np.zeros((4, 4)))
+
+
+def test_mean_of_images_normalized():
+    """
+    Verifies per-input percentile normalization before averaging.
+    Both inputs span their full range, so after normalization they are equal.
+    """
+    transformer = MeanOfImages(normalize=True, low=0, high=100)
+    assert not transformer.TILEABLE
+
+    img1 = np.linspace(0, 10, 16).reshape(4, 4)
+    img2 = np.linspace(100, 1100, 16).reshape(4, 4)
+
+    result = transformer.run(img1, img2)
+
+    assert np.allclose(result, np.linspace(0, 1, 16).reshape(4, 4), atol=1e-6)
+
+
+@pytest.mark.parametrize("radius", [1, 2, 5])
+@pytest.mark.parametrize(
+    "dtype, low, high", [(np.uint8, 0, 256), (np.uint16, 1000, 1200)]
+)
+def test_denoise_median_histogram_matches_skimage(radius, dtype, low, high):
+    """
+    Verifies the sliding-histogram median is exact: same result as
+    skimage.filters.median with a disk footprint, including the borders.
+    """
+    from skimage.filters import median
+    from skimage.morphology import disk
+
+    rng = np.random.default_rng(radius)
+    img = rng.integers(low, high, size=(37, 41)).astype(dtype)
+
+    transformer = DenoiseWithMedian(disk_radius=radius)
+    result = transformer.run(img)
+
+    np.testing.assert_array_equal(result, median(img, disk(radius)))
+    assert result.dtype == dtype
+
+
+def test_denoise_median_uses_histogram_for_small_ranges():
+    """Verifies the fast path is chosen only for small integer ranges."""
+    transformer = DenoiseWithMedian(disk_radius=3)
+
+    assert transformer.use_histogram(np.array([[0, 255]], dtype=np.uint8))
+    assert transformer.use_histogram(np.array([[5000, 5300]], dtype=np.uint16))
+    assert not transformer.use_histogram(np.array([[0, 60000]], dtype=np.uint16))
+    assert not transformer.use_histogram(np.array([[0.0, 1.0]]))
+
+
+def test_denoise_median_uses_histogram_for_16bit_images():
+    """
+    Verifies the fast path is taken for a full-range 16-bit image (bright
+    spots on a dim background) through the ranks of its intensities, and
+    that the result is exact.
+    """
+    from skimage.filters import median
+    from skimage.morphology import disk
+
+    from plex_pipe.processors import image_transformers
+
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[:160, :160]
+    img = rng.poisson(300, size=yy.shape).astype(float)
+    for cy, cx in rng.integers(20, 140, size=(4, 2)):
+        img += 40000 * np.exp(-((yy - cy) ** 2 + (xx - cx) ** 2) / (2 * 6**2))
+    img = img.astype(np.uint16)
+    assert int(img.max()) - int(img.min()) > 2**15
+
+    transformer = DenoiseWithMedian(disk_radius=10)
+    assert not transformer.use_histogram(img)
+
+    with patch.object(
+        image_transformers,
+        "median_histogram",
+        wraps=image_transformers.median_histogram,
+    ) as spy:
+        result = transformer.run(img)
+
+    spy.assert_called_once()
+    np.testing.assert_array_equal(result, median(img, disk(10)))
+    assert result.dtype == np.uint16
+
+
+# --- Tests for SubtractBackground Transformer ---
+
+
+def test_subtract_background_registered():
+    """Verifies the transformer is available through the registry."""
+    from plex_pipe.processors import REGISTRY
+
+    entry = REGISTRY["image_transformer"]["subtract_background"]
+    assert entry.processor_class is SubtractBackground
+
+
+@pytest.mark.parametrize("method", ["tophat", "rolling_ball"])
+def test_subtract_background_removes_smooth_background(method):
+    """
+    Verifies that a smooth ramp is removed while small bright spots are kept,
+    and that integer images keep their dtype.
+    """
+    yy, xx = np.mgrid[0:200, 0:240]
+    img = (500 + yy + 0.5 * xx).astype(np.uint16)
+    img[100:103, 120:123] += 1000
+
+    transformer = SubtractBackground(radius=20, work_radius=5, method=method)
+    result = transformer.run(img)
+
+    assert result.dtype == np.uint16
+    assert result.shape == img.shape
+
+    assert np.median(result) < 20
+    assert result[101, 121] > 900
+
+
+@pytest.mark.parametrize("method", ["tophat", "rolling_ball"])
+def test_subtract_background_tiled_matches_whole_image(method):
+    """
+    Verifies that running on overlapping tiles with the declared halo gives
+    the whole-image result when the tiles are aligned to the shrink factor.
+    """
+    import dask.array as da
+
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:200, 0:240]
+    img = (500 + yy + 0.5 * xx + rng.integers(0, 50, (200, 240))).astype(np.uint16)
+
+    transformer = SubtractBackground(radius=20, work_radius=5, method=method)
+    assert transformer.capabilities().tileable
+
+    tiled = da.map_overlap(
+        transformer.run,
+        da.from_array(img, chunks=(80, 80)),
+        depth=transformer.halo(),
+        boundary="none",
+        dtype=np.uint16,
+    ).compute()
+
+    np.testing.assert_array_equal(tiled, transformer.run(img))
+
+
+@pytest.mark.parametrize("method", ["tophat", "rolling_ball"])
+def test_subtract_background_controller_tiles_match_whole_image(method):
+    """
+    Verifies that a tiled controller run equals the whole-image result when
+    the configured tile size is not a multiple of the shrink factor.
+    """
+    import spatialdata as sd
+    from spatialdata.models import Image2DModel
+
+    from plex_pipe.processors.controller import ResourceBuildingController
+
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:200, 0:240]
+    img = (500 + yy + 0.5 * xx + rng.integers(0, 50, (200, 240))).astype(np.uint16)
+    sdata = sd.SpatialData(
+        images={
+            "dapi": Image2DModel.parse(
+                img[None], dims=("c", "y", "x"), scale_factors=[2]
+            )
+        }
+    )
+
+    transformer = SubtractBackground(radius=20, work_radius=5, method=method)
+    assert transformer.capabilities().tile_multiple == 4
+
+    controller = ResourceBuildingController(
+        transformer, ["dapi"], ["flat"], chunk_size=[1, 90, 90], tiled=True
+    )
+    assert controller.use_tiling(sdata)
+    assert controller.get_lazy_source(sdata, "dapi").chunksize == (92, 92)
+    controller.run(sdata)
+
+    tiled = np.asarray(sd.get_pyramid_levels(sdata["flat"], n=0)).squeeze()
+    np.testing.assert_array_equal(tiled, transformer.run(img))
+
+
+def test_subtract_background_upsampling_is_seamless():
+    """Verifies that upsampling windows separately equals upsampling all at once."""
+    small = np.random.default_rng(0).random((6, 7)).astype(np.float32)
+
+    full = SubtractBackground.upsample_linear(small, 4, (0, 24), (0, 28))
+    left = SubtractBackground.upsample_linear(small, 4, (0, 24), (0, 13))
+    right = SubtractBackground.upsample_linear(small, 4, (0, 24), (13, 28))
+
+    np.testing.assert_allclose(np.hstack([left, right]), full)
@@ -1,4 +1,4 @@
-from unittest.mock import ANY, patch
+from unittest.mock import patch
 
 import numpy as np
 import pytest
@@ -6,6 +6,7 @@ import pytest
 # Import module under test
 from plex_pipe.processors.mask_builders import (
     BlobBuilder,
+    MaskAlgebraBuilder,
     MultiplicationBuilder,
     RingBuilder,
     SubtractionBuilder,
@@ -70,6 +71,21 @@ def test_multiplication_run_logic():
     assert np.sum(result) == 1
 
 
+def test_multiplication_keeps_labels_of_either_input():
+    """Verifies that a narrow blob mask first does not truncate the labels."""
+    builder = MultiplicationBuilder()
+    labels = np.array([[0, 300], [70000, 5]], dtype=np.int32)
+    blob = np.array([[1, 1], [1, 0]], dtype=np.uint8)
+
+    for result in (builder.run(labels, blob), builder.run(blob, labels)):
+        assert result.dtype == np.int32
+        np.testing.assert_array_equal(result, [[0, 300], [70000, 0]])
+
+    # mixed signedness keeps the item size instead of widening to int64
+    result = builder.run(labels, blob.astype(np.uint32))
+    assert result.dtype == np.int32
+
+
 def test_multiplication_shape_mismatch():
     """Verifies error if masks have different dimensions."""
     builder = MultiplicationBuilder()
@@ -80,6 +96,19 @@ def test_multiplication_shape_mismatch():
         builder.run(m1, m2)
 
 
+def test_derived_masks_cannot_be_relabelled():
+    """Verifies that relabelling is refused for masks derived from other masks."""
+    from plex_pipe.processors.controller import ResourceBuildingController
+
+    with pytest.raises(ValueError, match="cannot be relabelled"):
+        ResourceBuildingController(
+            MultiplicationBuilder(),
+            ["nucleus", "blob"],
+            ["nucleus_blob"],
+            relabel_sequential=True,
+        )
+
+
 # --- Tests for RingBuilder ---
 
 
@@ -125,6 +154,34 @@ def test_ring_builder_run_logic():
     assert result[5, 7] == 1
 
 
+def test_ring_builder_matches_expand_labels():
+    """
+    Verifies the single-pass ring equals expanding the labels by the outer
+    radius and removing the expansion by the inner radius, and that the
+    label dtype is preserved.
+    """
+    from skimage.segmentation import expand_labels
+
+    rng = np.random.default_rng(0)
+    mask = np.zeros((60, 80), dtype=np.uint16)
+    points = rng.integers(0, [60, 80], size=(30, 2))
+    mask[points[:, 0], points[:, 1]] = np.arange(1, 31)
+
+    expected = expand_labels(mask, 5)
+    expected[expand_labels(mask, 2) > 0] = 0
+
+    result = RingBuilder(outer=5, inner=2).run(mask)
+
+    np.testing.assert_array_equal(result, expected)
+    assert result.dtype == np.uint16
+
+
+def test_ring_builder_empty_mask():
+    """Verifies that a mask without objects gives an empty ring."""
+    result = RingBuilder(outer=3, inner=1).run(np.zeros((10, 10), dtype=np.int32))
+    assert not result.any()
+
+
 # --- Tests for BlobBuilder ---
 
 
@@ -139,10 +196,9 @@ def test_blob_builder_params():
     assert builder.params.work_shape == (100, 100)
 
 
-@patch("plex_pipe.processors.mask_builders.resize")
 @patch("plex_pipe.processors.mask_builders.opening")
 @patch("plex_pipe.processors.mask_builders.closing")
-def test_blob_builder_workflow(mock_closing, mock_opening, mock_resize):
+def test_blob_builder_workflow(mock_closing, mock_opening):
     """
     Verifies the pipeline sequence:
     Downsample -> Open -> Close -> Upsample.
@@ -151,30 +207,148 @@ def test_blob_builder_workflow(mock_closing, mock_opening, mock_resize):
 
     input_mask = np.zeros((100, 100), dtype=int)
 
-    # Mock returns
-    mock_resize.return_value = np.zeros((50, 50))  # downsampled
-    mock_opening.return_value = np.zeros((50, 50))
-    mock_closing.return_value = np.zeros((50, 50))
+    mock_opening.return_value = np.zeros((50, 50), dtype=bool)
+    mock_closing.return_value = np.ones((50, 50), dtype=bool)
 
-    # For the second resize call (upsample), we need it to return correct shape
-    # The code calls resize twice.
-    # 1. Downsample to work_shape
-    # 2. Upsample to orig_shape
-    def resize_side_effect(img, shape, **kwargs):
-        return np.zeros(shape)
+    # Execute
+    result = builder.run(input_mask)
 
-    mock_resize.side_effect = resize_side_effect
+    # 1. Morphology runs at the working resolution
+    assert mock_opening.call_args[0][0].shape == (50, 50)
+    mock_closing.assert_called()
 
-    # Execute
-    builder.run(input_mask)
+    # 2. Upsampled back to the original shape
+    assert result.shape == (100, 100)
+    assert np.all(np.asarray(result) == 1)
 
-    # Assertions
-    # 1. Check Downsampling
-    mock_resize.assert_any_call(ANY, (50, 50), order=1, preserve_range=True)
 
-    # 2. Check Morphological Ops
-    mock_opening.assert_called()
-    mock_closing.assert_called()
+def test_blob_builder_output_is_lazy_and_compact():
+    """
+    Verifies that the blob covers the objects, removes isolated specks and
+    is returned as a lazy uint8 array of the input shape.
+    """
+    import dask.array as da
+
+    builder = BlobBuilder(work_shape=(25, 25), radius=2)
+
+    mask = np.zeros((103, 97), dtype=np.int32)
+    mask[20:80, 20:80] = 7  # large tissue region
+    mask[95, 5] = 3  # isolated speck
+
+    result = builder.run(mask)
+
+    assert isinstance(result, da.Array)
+    assert result.dtype == np.uint8
+    assert result.shape == mask.shape
+
+    result = np.asarray(result)
+    assert result[50, 50] == 1
+    assert result[95, 5] == 0
+    assert result[0, 0] == 0
+
+
+def test_blob_builder_uses_controller_chunks():
+    """
+    Verifies that the lazy blob is chunked like the outputs of its controller.
+    """
+    from plex_pipe.processors.controller import ResourceBuildingController
+
+    builder = BlobBuilder(work_shape=(25, 25), radius=2)
+    first = ResourceBuildingController(
+        builder, "nuclei", "blob", chunk_size=[1, 40, 40]
+    )
+    second = ResourceBuildingController(
+        builder, "nuclei", "blob2", chunk_size=[1, 20, 20]
+    )
+
+    mask = np.zeros((100, 100), dtype=np.int32)
+    mask[20:80, 20:80] = 1
+
+    # a shared builder keeps the chunks of each controller apart
+    assert first.builder.run(mask).chunks == ((40, 40, 20), (40, 40, 20))
+    assert second.builder.run(mask).chunks == ((20,) * 5, (20,) * 5)
+    assert builder.output_chunks is None
+
+
+def test_blob_builder_block_any():
+    """Verifies block reduction marks blocks containing any foreground pixel."""
+    mask = np.zeros((5, 7), dtype=int)
+    mask[4, 6] = 2
+
+    reduced = BlobBuilder.block_any(mask, (2, 3))
+
+    assert reduced.shape == (3, 3)
+    assert reduced[2, 2]
+    assert reduced.sum() == 1
+
+
+# --- Tests for MaskAlgebraBuilder ---
+
+
+def test_mask_algebra_matches_chained_builders():
+    """
+    Verifies that the fused expressions reproduce the chain
+    multiply (nucleus) -> multiply (cell) -> subtract (cytoplasm).
+    """
+    rng = np.random.default_rng(0)
+    nucleus = rng.integers(0, 5, size=(20, 30)).astype(np.int32)
+    cell = np.where(rng.random((20, 30)) > 0.2, 9, 0).astype(np.int32)
+    blob = np.zeros((20, 30), dtype=np.uint8)
+    blob[5:15, 5:25] = 1
+
+    builder = MaskAlgebraBuilder(
+        expressions=[
+            "multiply(x0, x2)",
+            "multiply(x1, x2)",
+            "subtract(multiply(x1, x2), multiply(x0, x2))",
+        ]
+    )
+    nuc_out, cell_out, cyto_out = builder.run(nucleus, cell, blob)
+
+    expected_nuc = MultiplicationBuilder().run(nucleus, blob)
+    expected_cell = MultiplicationBuilder().run(cell, blob)
+    # the subtraction writes into its first input
+    expected_cyto = SubtractionBuilder().run(expected_cell.copy(), expected_nuc)
+
+    np.testing.assert_array_equal(nuc_out, expected_nuc)
+    np.testing.assert_array_equal(cell_out, expected_cell)
+    np.testing.assert_array_equal(cyto_out, expected_cyto)
+
+
+def test_mask_algebra_select_and_intersect_dtypes():
+    """Verifies select keeps the label dtype and intersect gives a uint8 mask."""
+    labels = np.array([[3, 0], [5, 7]], dtype=np.uint16)
+    mask = np.array([[1, 1], [0, 1]], dtype=np.int64)
+
+    selected, both = MaskAlgebraBuilder(
+        expressions=["select(x0, x1)", "intersect(x0, x1)"]
+    ).run(labels, mask)
+
+    np.testing.assert_array_equal(selected, [[3, 0], [0, 7]])
+    assert selected.dtype == np.uint16
+    np.testing.assert_array_equal(both, [[1, 0], [0, 1]])
+    assert both.dtype == np.uint8
+
+
+@pytest.mark.parametrize(
+    "expression",
+    ["open(x0, x1)", "select(x0)", "select(x0, cell)", "x0 + x1", "__import__('os')"],
+)
+def test_mask_algebra_rejects_invalid_expressions(expression):
+    """Verifies only known functions with two arguments over inputs are accepted."""
+    with pytest.raises(ValueError):
+        MaskAlgebraBuilder(expressions=[expression])
+
+
+def test_mask_algebra_validate_io():
+    """Verifies one output per expression and enough inputs for the expressions."""
+    builder = MaskAlgebraBuilder(expressions=["select(x0, x2)", "select(x1, x2)"])
+
+    ins, outs = builder.validate_io(["n", "c", "b"], ["n_out", "c_out"])
+    assert outs == ["n_out", "c_out"]
+
+    with pytest.raises(ValueError, match="one per expression"):
+        builder.validate_io(["n", "c", "b"], ["n_out"])
 
-    # 3. Check Upsampling to original shape
-    mock_resize.assert_any_call(ANY, (50, 50), order=1, preserve_range=True)
+    with pytest.raises(ValueError, match="refer to 3 input"):
+        builder.validate_io(["n", "c"], ["n_out", "c_out"])
@@ -0,0 +1,101 @@
+import os
+
+import dask
+import pytest
+
+from plex_pipe.utils.parallel_utils import (
+    THREAD_ENV_VARS,
+    inherited_thread_limits,
+    run_per_core,
+)
+
+
+def check_core(item):
+    """Fails for cores named 'bad', checks the thread caps otherwise."""
+    if item == "bad":
+        raise ValueError("corrupted core")
+    for var in THREAD_ENV_VARS:
+        assert os.environ[var] == "1"
+    return item
+
+
+def crash_core(item):
+    """Kills the worker process for the core named 'crash'."""
+    if item == "crash":
+        os._exit(1)
+    return item
+
+
+def test_run_per_core_in_process_isolates_failures(monkeypatch):
+    for var in THREAD_ENV_VARS:
+        monkeypatch.delenv(var, raising=False)
+
+    # the caps apply to the current process; restore the dask config afterwards
+    with dask.config.set(num_workers=None):
+        result = run_per_core(check_core, ["a", "bad", "b"], threads_per_worker=1)
+
+    assert result == {
+        "done": ["a", "b"],
+        "failed": ["bad"],
+        "results": {"a": "a", "b": "b"},
+    }
+
+
+def test_run_per_core_workers(tmp_path):
+    result = run_per_core(
+        check_core,
+        ["a", "bad", "b", "c"],
+        n_workers=2,
+        threads_per_worker=1,
+        log_dir=tmp_path,
+        log_name="test",
+    )
+
+    assert sorted(result["done"]) == ["a", "b", "c"]
+    assert result["failed"] == ["bad"]
+    assert result["results"] == {"a": "a", "b": "b", "c": "c"}
+
+    # every worker logs to its own file; the failure is logged with its traceback
+    logs = list(tmp_path.glob("test_*_worker*.log"))
+    assert 1 <= len(logs) <= 2
+    assert any("corrupted core" in log.read_text() for log in logs)
+
+
+def test_run_per_core_survives_worker_crash():
+    result = run_per_core(crash_core, ["a", "crash", "b"], n_workers=2)
+
+    assert sorted(result["done"]) == ["a", "b"]
+    assert result["failed"] == ["crash"]
+
+
+def test_inherited_thread_limits_restores_environment(monkeypatch):
+    monkeypatch.setenv("OMP_NUM_THREADS", "8")
+    monkeypatch.delenv("MKL_NUM_THREADS", raising=False)
+
+    with inherited_thread_limits(2):
+        assert all(os.environ[var] == "2" for var in THREAD_ENV_VARS)
+
+    assert os.environ["OMP_NUM_THREADS"] == "8"
+    assert "MKL_NUM_THREADS" not in os.environ
+
+
+def startup_thread_cap(item):
+    """Returns OPENBLAS_NUM_THREADS as it was when the worker process started."""
+    with open("/proc/self/environ", "rb") as f:
+        env = dict(
+            entry.split(b"=", 1) for entry in f.read().split(b"\0") if b"=" in entry
+        )
+    return env.get(b"OPENBLAS_NUM_THREADS")
+
+
+@pytest.mark.skipif(
+    not os.path.exists("/proc/self/environ"), reason="needs the Linux /proc"
+)
+def test_run_per_core_workers_start_with_thread_caps(monkeypatch):
+    monkeypatch.delenv("OPENBLAS_NUM_THREADS", raising=False)
+
+    result = run_per_core(startup_thread_cap, ["a"], n_workers=2, threads_per_worker=1)
+
+    # set before the worker imported numpy, so its BLAS picks the cap up
+    assert result["results"] == {"a": b"1"}
+    assert "OPENBLAS_NUM_THREADS" not in os.environ
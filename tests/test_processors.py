@@ -1,3 +1,4 @@
+import os
 from unittest.mock import MagicMock, patch
 
 import numpy as np
@@ -128,6 +129,22 @@ def test_bring_to_max_resolution(controller):
 
     # Should be 20x20
     assert upscaled.shape == (20, 20)
+    assert upscaled.dtype == small_arr.dtype
+
+
+def test_bring_to_max_resolution_keeps_labels(controller):
+    """Verifies block replication of labels, cropped or padded to the level 0 shape."""
+    small = np.arange(12, dtype=np.int32).reshape(3, 4)
+
+    upscaled = controller.bring_to_max_resolution(small, shape=(7, 8))
+
+    assert upscaled.dtype == np.int32
+    expected = np.repeat(np.repeat(small, 2, axis=0), 2, axis=1)
+    expected = np.vstack([expected, expected[-1:]])[:7, :8]
+    np.testing.assert_array_equal(np.asarray(upscaled), expected)
+
+    cropped = controller.bring_to_max_resolution(small, shape=(5, 7))
+    np.testing.assert_array_equal(np.asarray(cropped), expected[:5, :7])
 
 
 @patch("plex_pipe.processors.controller.Labels2DModel")
@@ -163,17 +180,17 @@ def test_pack_into_model_image(MockImageModel, controller):
 
 
 @patch("plex_pipe.processors.controller.sd.get_pyramid_levels")
-@patch("plex_pipe.processors.controller.resize")  # Mock resize to save time
+@patch("plex_pipe.processors.controller.upscale_nearest")
 @patch("plex_pipe.processors.controller.Labels2DModel")
 def test_run_pipeline(
-    MockLabelsModel, mock_resize, mock_get_pyramid, controller, mock_sdata
+    MockLabelsModel, mock_upscale, mock_get_pyramid, controller, mock_sdata
 ):
     """
     Simulates a full run:
     1. Validation pass.
     2. Data fetching (mocked).
     3. Processing (via MockBuilder).
-    4. Upscaling (via mock_resize).
+    4. Upscaling (via mock_upscale).
     5. Packing.
     6. Saving to sdata.
     """
@@ -186,8 +203,8 @@ def test_run_pipeline(
     # get_pyramid_levels returns the data array
     mock_get_pyramid.return_value = np.zeros((1, 50, 50))  # (c, y, x)
 
-    # Mock Resize (Upscaling)
-    mock_resize.return_value = np.zeros((100, 100))
+    # Mock Upscaling
+    mock_upscale.return_value = np.zeros((100, 100))
 
     # Mock Model Packing
     mock_model_obj = MagicMock()
@@ -203,8 +220,9 @@ def test_run_pipeline(
     # Our MockBuilder returns input, so result is (50, 50)
 
     # 2. Check Upscaling
-    # Controller is set to level 1. It should call resize/bring_to_max_resolution
-    mock_resize.assert_called_once()
+    # Controller is set to level 1. It should upscale to the level 0 shape
+    mock_upscale.assert_called_once()
+    assert mock_upscale.call_args.kwargs["shape"] == (50, 50)
 
     # 3. Check Saving to Sdata
     # "output_label" should now exist in sdata elements
@@ -230,9 +248,385 @@ def test_run_save_to_disk(mock_sdata):
     # Mock data fetch
     with patch("plex_pipe.processors.controller.sd.get_pyramid_levels") as mock_get:
         mock_get.return_value = np.zeros((1, 10, 10))
+        with patch("plex_pipe.processors.controller.sd.read_zarr") as mock_read:
+            mock_read.return_value = {"out": "stored"}
 
-        # Run
-        controller.run(mock_sdata)
+            # Run
+            controller.run(mock_sdata)
 
-    # Verify write called
+    # Verify write called and the saved copy is read back lazily
     mock_sdata.write_element.assert_called_with("out")
+    mock_read.assert_called_once_with(mock_sdata.path, selection=("labels",))
+    assert mock_sdata._elements["out"] == "stored"
+
+
+# --- Tests for Tiled Execution ---
+
+
+@pytest.fixture
+def labels_sdata():
+    """A small in-memory SpatialData object with a labels element."""
+    import spatialdata as sd
+    from spatialdata.models import Labels2DModel
+
+    rng = np.random.default_rng(0)
+    labels = np.zeros((90, 110), dtype=np.int32)
+    for i, (y, x) in enumerate(rng.integers(0, [90, 110], size=(40, 2)), start=1):
+        labels[max(y - 2, 0) : y + 2, max(x - 2, 0) : x + 2] = i
+
+    return sd.SpatialData(
+        labels={
+            "nuclei": Labels2DModel.parse(
+                labels, dims=("y", "x"), scale_factors=[2], chunks={"y": 45, "x": 55}
+            )
+        }
+    )
+
+
+def test_run_tiled_matches_whole_image(labels_sdata):
+    """Verifies that a tileable builder gives the same result in tiles (with halo) as on the whole image."""
+    from plex_pipe.processors.mask_builders import RingBuilder
+
+    builder = RingBuilder(outer=4, inner=1)
+    controller = ResourceBuildingController(
+        builder, ["nuclei"], ["ring"], chunk_size=[1, 32, 32]
+    )
+
+    assert controller.use_tiling(labels_sdata)
+    controller.run(labels_sdata)
+
+    import spatialdata as sd
+
+    expected = builder.run(np.array(sd.get_pyramid_levels(labels_sdata["nuclei"], n=0)))
+    result = np.array(sd.get_pyramid_levels(labels_sdata["ring"], n=0))
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_use_tiling_respects_flag_and_builder(labels_sdata, controller):
+    """Verifies that tiling is used only when enabled and supported by the builder."""
+    from plex_pipe.processors.mask_builders import RingBuilder
+
+    # MockBuilder is not tileable
+    assert not controller.use_tiling(labels_sdata)
+
+    untiled = ResourceBuildingController(
+        RingBuilder(outer=4, inner=1), ["nuclei"], ["ring"], tiled=False
+    )
+    assert not untiled.use_tiling(labels_sdata)
+
+
+def test_run_tiled_multiple_outputs(labels_sdata):
+    """Verifies that every output of a multi-output tileable builder is stored."""
+    import spatialdata as sd
+
+    from plex_pipe.processors.mask_builders import MaskAlgebraBuilder
+
+    builder = MaskAlgebraBuilder(
+        expressions=["intersect(x0, x0)", "subtract(x0, intersect(x0, x0))"]
+    )
+    controller = ResourceBuildingController(
+        builder, ["nuclei"], ["binary", "empty"], chunk_size=[1, 32, 32]
+    )
+    controller.run(labels_sdata)
+
+    labels = np.array(sd.get_pyramid_levels(labels_sdata["nuclei"], n=0))
+    binary = np.array(sd.get_pyramid_levels(labels_sdata["binary"], n=0))
+    empty = np.array(sd.get_pyramid_levels(labels_sdata["empty"], n=0))
+
+    np.testing.assert_array_equal(binary, labels > 0)
+    assert not empty.any()
+
+
+def test_run_tiled_merges_tiles_smaller_than_halo(labels_sdata):
+    """Verifies tiles smaller than the halo are merged, keeping the result exact."""
+    import spatialdata as sd
+
+    from plex_pipe.processors.mask_builders import RingBuilder
+
+    assert ResourceBuildingController.merge_small_chunks((40, 40, 10), 16) == (
+        40,
+        50,
+    )
+    assert ResourceBuildingController.merge_small_chunks((5, 5, 5, 5), 8) == (10, 10)
+    assert ResourceBuildingController.merge_small_chunks((5,), 8) == (5,)
+
+    builder = RingBuilder(outer=12, inner=2)
+    assert builder.halo() == 12
+    expected = builder.run(np.array(sd.get_pyramid_levels(labels_sdata["nuclei"], n=0)))
+
+    # 90 x 110 in tiles of 40 leaves tiles of 10 and 30 pixels
+    controller = ResourceBuildingController(
+        builder, ["nuclei"], ["ring"], chunk_size=[1, 40, 40]
+    )
+    (ring,) = controller.run_tiled([controller.get_lazy_source(labels_sdata, "nuclei")])
+
+    assert ring.chunks == ((40, 50), (40, 40, 30))
+    np.testing.assert_array_equal(ring.compute(), expected)
+
+
+def test_run_tiled_runs_builder_once_per_tile(labels_sdata):
+    """Verifies that all outputs of a tile come from a single builder run."""
+    import spatialdata as sd
+
+    from plex_pipe.processors.mask_builders import MaskAlgebraBuilder
+
+    class CountingAlgebra(MaskAlgebraBuilder):
+        calls = 0
+
+        def run(self, *masks):
+            # the dtype probe runs on a tiny array
+            if np.size(masks[0]) > 4:
+                type(self).calls += 1
+            return super().run(*masks)
+
+    builder = CountingAlgebra(
+        expressions=["multiply(x0, x0)", "intersect(x0, x0)", "select(x0, x0)"]
+    )
+    controller = ResourceBuildingController(
+        builder, ["nuclei"], ["a", "b", "c"], chunk_size=[1, 45, 55]
+    )
+    controller.run(labels_sdata)
+    outputs = [
+        np.array(sd.get_pyramid_levels(labels_sdata[name], n=0))
+        for name in ("a", "b", "c")
+    ]
+
+    # 2 x 2 tiles, 3 outputs
+    assert CountingAlgebra.calls == 4
+    labels = np.array(sd.get_pyramid_levels(labels_sdata["nuclei"], n=0))
+    np.testing.assert_array_equal(outputs[0], labels * labels)
+    np.testing.assert_array_equal(outputs[1], labels > 0)
+    np.testing.assert_array_equal(outputs[2], labels)
+
+
+# --- Tests for Output Fingerprints ---
+
+
+def test_run_skips_up_to_date_outputs(labels_sdata):
+    """Verifies that a step is skipped when its outputs carry the current fingerprint."""
+    from plex_pipe.processors.mask_builders import RingBuilder
+
+    builder = RingBuilder(outer=4, inner=1)
+    controller = ResourceBuildingController(
+        builder, ["nuclei"], ["ring"], overwrite=True, tiled=False
+    )
+    controller.run(labels_sdata)
+    ring = labels_sdata["ring"]
+
+    with patch.object(controller.builder, "run", wraps=controller.builder.run) as spy:
+        controller.run(labels_sdata)
+        spy.assert_not_called()
+    assert labels_sdata["ring"] is ring
+
+    # disabling reuse always recomputes
+    controller.reuse_outputs = False
+    with patch.object(controller.builder, "run", wraps=controller.builder.run) as spy:
+        controller.run(labels_sdata)
+        spy.assert_called_once()
+
+
+def test_fingerprint_changes_propagate(labels_sdata):
+    """Verifies that changed parameters rerun the step and every step downstream."""
+    from plex_pipe.processors.mask_builders import RingBuilder
+
+    first = ResourceBuildingController(
+        RingBuilder(outer=4, inner=1), ["nuclei"], ["ring"], overwrite=True
+    )
+    second = ResourceBuildingController(
+        RingBuilder(outer=2, inner=0), ["ring"], ["ring_of_ring"], overwrite=True
+    )
+    first.run(labels_sdata)
+    second.run(labels_sdata)
+
+    provenance = labels_sdata.attrs["plex_pipe_provenance"]
+    old = dict(provenance)
+    assert second.prepare(labels_sdata) is None
+
+    changed = ResourceBuildingController(
+        RingBuilder(outer=5, inner=1), ["nuclei"], ["ring"], overwrite=True
+    )
+    changed.run(labels_sdata)
+
+    assert provenance["ring"] != old["ring"]
+    assert second.prepare(labels_sdata) is not None
+
+
+def test_element_fingerprint_sees_rewritten_chunks(tmp_path):
+    """Verifies that rewriting a chunk changes the fingerprint of a stored input."""
+    element_dir = tmp_path / "images" / "ch"
+    chunk = element_dir / "0" / "c" / "0" / "0"
+    chunk.parent.mkdir(parents=True)
+    (element_dir / "zarr.json").write_text("{}")
+    chunk.write_bytes(b"old")
+
+    sdata = MagicMock()
+    sdata.attrs = {}
+    sdata.path = tmp_path
+    sdata.is_backed.return_value = True
+    sdata.elements_paths_on_disk.return_value = ["images/ch"]
+
+    with patch("plex_pipe.processors.controller.sd.get_pyramid_levels") as mock_get:
+        mock_get.return_value = np.zeros((1, 4, 4))
+        before = ResourceBuildingController.element_fingerprint(sdata, "ch")
+        dir_stat = os.stat(element_dir)
+        chunk.write_bytes(b"new")
+        os.utime(chunk, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns + 10**9))
+        os.utime(element_dir, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+
+        assert ResourceBuildingController.element_fingerprint(sdata, "ch") != before
+
+
+def test_controller_shares_cache_and_invalidates(labels_sdata):
+    """Verifies that inputs are read once per core and replaced outputs are not served stale."""
+    from plex_pipe.processors.mask_builders import RingBuilder
+    from plex_pipe.utils.element_cache import ElementCache
+
+    cache = ElementCache()
+    controllers = [
+        ResourceBuildingController(
+            RingBuilder(outer=outer, inner=0),
+            ["nuclei"],
+            ["ring"],
+            overwrite=True,
+            tiled=False,
+            cache=cache,
+        )
+        for outer in (2, 3)
+    ]
+
+    controllers[0].run(labels_sdata)
+    ring_2 = controllers[0].get_source(labels_sdata, "ring")
+    controllers[1].run(labels_sdata)
+
+    assert cache.hits >= 1  # 'nuclei' decoded once for both steps
+    ring_3 = controllers[1].get_source(labels_sdata, "ring")
+    assert (ring_3 > 0).sum() > (ring_2 > 0).sum()
+
+
+@pytest.mark.parametrize("tiled", [False, True])
+def test_in_place_builder_gets_private_inputs(labels_sdata, tiled):
+    """Verifies that a builder writing into its inputs leaves shared arrays intact."""
+    import spatialdata as sd
+
+    from plex_pipe.processors.mask_builders import SubtractionBuilder
+    from plex_pipe.utils.element_cache import ElementCache
+
+    builder = SubtractionBuilder()
+    assert not builder.capabilities().in_place_safe
+
+    # chunks held in memory, as for outputs of earlier steps
+    labels_sdata["nuclei"] = labels_sdata["nuclei"].persist()
+
+    cache = ElementCache()
+    controller = ResourceBuildingController(
+        builder,
+        ["nuclei", "nuclei"],
+        ["empty"],
+        tiled=tiled,
+        cache=cache,
+        chunk_size=[1, 45, 55],
+    )
+    nuclei = np.array(sd.get_pyramid_levels(labels_sdata["nuclei"], n=0))
+    cached = controller.get_source(labels_sdata, "nuclei")
+
+    controller.run(labels_sdata)
+
+    # every object is removed from its own mask, but not from the shared one
+    assert not np.array(sd.get_pyramid_levels(labels_sdata["empty"], n=0)).any()
+    np.testing.assert_array_equal(cached, nuclei)
+    np.testing.assert_array_equal(
+        np.array(sd.get_pyramid_levels(labels_sdata["nuclei"], n=0)), nuclei
+    )
+
+
+# --- Tests for Processor Capabilities ---
+
+
+def test_registry_exposes_capabilities():
+    """Verifies that every registered processor declares its capabilities."""
+    from plex_pipe.processors import REGISTRY
+
+    ring = REGISTRY["mask_builder"]["ring"].capabilities
+    assert ring.tileable and ring.halo is None  # the halo depends on 'outer'
+    assert REGISTRY["mask_builder"]["subtract"].capabilities.halo == 0
+
+    cellpose = REGISTRY["object_segmenter"]["cellpose"].capabilities
+    assert not cellpose.tileable and not cellpose.thread_safe
+    assert cellpose.gpu_optional
+
+
+def test_memory_limit_chooses_whole_image_run(labels_sdata):
+    """Verifies that tileable builders fitting the memory limit are not tiled."""
+    from plex_pipe.processors.mask_builders import RingBuilder
+
+    builder = RingBuilder(outer=4, inner=1)
+    assert builder.capabilities().halo == builder.halo()
+
+    controller = ResourceBuildingController(
+        builder, ["nuclei"], ["ring"], chunk_size=[1, 45, 55]
+    )
+    whole = controller.estimate_memory(labels_sdata, tiled=False)
+    tile = controller.estimate_memory(labels_sdata, tiled=True)
+    assert whole == int(builder.MEMORY_MULTIPLIER * 90 * 110 * 4)
+    assert tile < whole
+
+    assert controller.use_tiling(labels_sdata)
+    controller.memory_limit = whole
+    assert not controller.use_tiling(labels_sdata)
+    controller.memory_limit = whole - 1
+    assert controller.use_tiling(labels_sdata)
+
+
+# --- Tests for Storage Dtypes ---
+
+
+def test_outputs_stored_in_compact_dtypes(labels_sdata):
+    """Verifies compact labels and quantized kept images, restored when read."""
+    from plex_pipe.processors.image_transformers import Normalize
+    from plex_pipe.processors.mask_builders import RingBuilder
+
+    labels_sdata.write_element = lambda name: None
+
+    ring = ResourceBuildingController(RingBuilder(outer=4, inner=1), "nuclei", "ring")
+    ring.run(labels_sdata)
+    assert labels_sdata["ring"]["scale0"]["image"].dtype == np.uint8
+
+    normalize = ResourceBuildingController(
+        Normalize(low=0, high=100), "nuclei", "norm", keep=True, image_dtype="uint16"
+    )
+    normalize.run(labels_sdata)
+    assert labels_sdata["norm"]["scale0"]["image"].dtype == np.uint16
+    assert labels_sdata.attrs["plex_pipe_quantization"]["norm"]["dtype"] == "uint16"
+
+    expected = Normalize(low=0, high=100).run(ring.get_source(labels_sdata, "nuclei"))
+    restored = normalize.get_source(labels_sdata, "norm")
+    assert restored.dtype == np.float32
+    np.testing.assert_allclose(restored, expected, atol=1e-4)
+
+
+def test_tiled_labels_computed_once(labels_sdata):
+    """Verifies that finding the storage dtype does not run the tiles again."""
+    from plex_pipe.processors.mask_builders import RingBuilder
+
+    class CountingRing(RingBuilder):
+        calls = 0
+
+        def run(self, mask):
+            # dtype probes run on tiny arrays
+            if min(np.shape(mask)) > 2 * self.halo() + 2:
+                type(self).calls += 1
+            return super().run(mask)
+
+    labels_sdata.write_element = lambda name: None
+    controller = ResourceBuildingController(
+        CountingRing(outer=4, inner=1), "nuclei", "ring", chunk_size=[1, 32, 32]
+    )
+    controller.run(labels_sdata)
+    ring = labels_sdata["ring"]["scale0"]["image"]
+
+    # the ring keeps the labels of 'nuclei', so its dtype needs no tile
+    assert ring.dtype == np.uint8
+    assert CountingRing.calls == 0
+
+    ring.compute()
+    assert CountingRing.calls == 3 * 4
@@ -126,3 +126,254 @@ def test_run_writes_new_table_and_aligns_vars_obs(sdata_read):
     assert any(ch_key in v and "mean" in v for v in var_names)
     assert any(ch_key in v and "median" in v for v in var_names)
     assert "area_cell" in adata.obs.columns
+
+
+def test_parallel_channels_match_serial(sdata_read):
+    """
+    Verifies that threaded, prefetching quantification yields the serial table.
+    """
+    import numpy as np
+
+    def controller(**kwargs):
+        qc = QuantificationController(
+            mask_keys={"cell": "instanseg_cell", "nucleus": "instanseg_nucleus"},
+            statistics=["mean", "std", "median", "p90"],
+            **kwargs,
+        )
+        qc.sdata = sdata_read
+        qc.validate_sdata_as_input()
+        qc.prepare_masks()
+        return qc
+
+    serial = controller().build_X_and_var()
+    parallel = controller(n_threads=2, prefetch=2).build_X_and_var()
+
+    assert list(parallel.columns) == list(serial.columns)
+    np.testing.assert_array_equal(parallel.to_numpy(), serial.to_numpy())
+
+    # a memory cap below one channel still quantifies one channel at a time
+    capped = controller(n_threads=2, prefetch=2, max_channel_memory=1)
+    assert capped.channels_in_flight() == 1
+    np.testing.assert_array_equal(
+        capped.build_X_and_var().to_numpy(), serial.to_numpy()
+    )
+
+
+def test_tiled_quantification_matches_whole_image(sdata_read):
+    """
+    Verifies that tile-wise quantification, with objects crossing tile
+    borders, reproduces the whole-image tables.
+    """
+    import numpy as np
+
+    def tables(**kwargs):
+        qc = QuantificationController(
+            mask_keys={"cell": "instanseg_cell", "nucleus": "instanseg_nucleus"},
+            statistics=["count", "mean", "std", "min", "max", "median", "p90"],
+            reuse_morphology=False,
+            **kwargs,
+        )
+        qc.sdata = sdata_read
+        qc.validate_sdata_as_input()
+        qc.channels = qc.channels[:3]
+        qc.prepare_masks()
+        return qc.build_obs(), qc.build_X_and_var()
+
+    obs, X = tables()
+    tiled_obs, tiled_X = tables(tile_size=64)
+
+    assert list(tiled_obs.columns) == list(obs.columns)
+    np.testing.assert_array_equal(tiled_obs.index, obs.index)
+    np.testing.assert_allclose(tiled_obs.to_numpy(float), obs.to_numpy(float))
+
+    assert list(tiled_X.columns) == list(X.columns)
+    np.testing.assert_allclose(tiled_X.to_numpy(), X.to_numpy(), rtol=1e-6)
+
+
+def test_incremental_run_appends_missing_columns(sdata_read, monkeypatch):
+    """
+    An incremental run only quantifies the new channel and mask and gives
+    the same table as a full run.
+    """
+    import numpy as np
+
+    sdata = sdata_read
+    table_name = "incremental_table"
+
+    def controller(channels, masks, **kwargs):
+        return QuantificationController(
+            mask_keys=masks,
+            to_quantify=channels,
+            table_name=table_name,
+            connect_to_mask="instanseg_cell",
+            overwrite=True,
+            **kwargs,
+        )
+
+    controller(["DAPI"], {"cell": "instanseg_cell"}).run(sdata)
+
+    quantified = []
+    original = QuantificationController.quantify_channel
+
+    def record(self, ch, img):
+        quantified.append((ch, list(self.indexes)))
+        return original(self, ch, img)
+
+    monkeypatch.setattr(QuantificationController, "quantify_channel", record)
+
+    masks = {"cell": "instanseg_cell", "nucleus": "instanseg_nucleus"}
+    controller(["DAPI", "SMA"], {"cell": "instanseg_cell"}, incremental=True).run(sdata)
+    assert quantified == [("SMA", ["cell"])]
+
+    quantified.clear()
+    controller(["DAPI", "SMA"], masks, incremental=True).run(sdata)
+    assert quantified == [("DAPI", ["nucleus"]), ("SMA", ["nucleus"])]
+
+    # nothing is missing: nothing is computed
+    quantified.clear()
+    controller(["DAPI", "SMA"], masks, incremental=True).run(sdata)
+    assert quantified == []
+
+    extended = sdata[table_name]
+    controller(["DAPI", "SMA"], masks).run(sdata)
+    full = sdata[table_name]
+
+    assert set(extended.var_names) == set(full.var_names)
+    assert list(extended.obs_names) == list(full.obs_names)
+    np.testing.assert_allclose(
+        extended[:, full.var_names].X, full.X, rtol=1e-6, equal_nan=True
+    )
+    np.testing.assert_allclose(
+        extended.obs["area_nucleus"], full.obs["area_nucleus"], equal_nan=True
+    )
+    np.testing.assert_allclose(
+        extended.obsm["centroid_nucleus"], full.obsm["centroid_nucleus"], equal_nan=True
+    )
+
+
+def test_incremental_run_rebuilds_table_of_changed_masks(sdata_read, monkeypatch):
+    """
+    An incremental run recomputes the whole table when a mask changed since
+    the table was written.
+    """
+    from plex_pipe.object_quantification.controller import MASKS_KEY
+    from plex_pipe.processors.controller import PROVENANCE_KEY
+
+    sdata = sdata_read
+    table_name = "incremental_table"
+
+    def controller(channels, **kwargs):
+        return QuantificationController(
+            mask_keys={"cell": "instanseg_cell"},
+            to_quantify=channels,
+            table_name=table_name,
+            connect_to_mask="instanseg_cell",
+            overwrite=True,
+            **kwargs,
+        )
+
+    controller(["DAPI"]).run(sdata)
+    assert set(sdata[table_name].uns[MASKS_KEY]) == {"cell"}
+
+    quantified = []
+    original = QuantificationController.quantify_channel
+
+    def record(self, ch, img):
+        quantified.append(ch)
+        return original(self, ch, img)
+
+    monkeypatch.setattr(QuantificationController, "quantify_channel", record)
+
+    # the step producing the mask was rerun with other settings
+    sdata.attrs.setdefault(PROVENANCE_KEY, {})["instanseg_cell"] = "rerun"
+    controller(["DAPI", "SMA"], incremental=True).run(sdata)
+
+    assert quantified == ["DAPI", "SMA"]
+
+
+def test_morphology_is_shared_between_tables(tmp_path, monkeypatch):
+    """
+    Tables using the same mask measure its morphology once; features missing
+    from the store are added, and a rewritten mask invalidates them.
+    """
+    from plex_pipe.object_quantification import controller as quant_controller
+    from plex_pipe.object_quantification.morphology_store import (
+        morphology_table_name,
+    )
+
+    # a fresh copy, without morphology stored by other tests
+    path = tmp_path / "Core_000.zarr"
+    shutil.copytree(Path(__file__).parent / "example_data" / "Core_000.zarr", path)
+    sdata = sd.read_zarr(path)
+    measured = []
+    original = quant_controller.morphology_table
+
+    def record(mask, properties=None, **kwargs):
+        measured.append(list(properties))
+        return original(mask, properties=properties, **kwargs)
+
+    monkeypatch.setattr(quant_controller, "morphology_table", record)
+
+    def run(table_name, morphology):
+        QuantificationController(
+            mask_keys={"cell": "instanseg_cell"},
+            to_quantify=["DAPI"],
+            table_name=table_name,
+            overwrite=True,
+            morphology=morphology,
+        ).run(sdata)
+        return sdata[table_name]
+
+    first = run("table_a", ["area", "centroid"])
+    second = run("table_b", ["area", "centroid", "solidity"])
+
+    # the second table only measures the feature the first did not need
+    assert measured == [["area", "centroid"], ["solidity"]]
+    assert morphology_table_name("instanseg_cell") in sdata
+    assert (first.obs["area_cell"] == second.obs["area_cell"]).all()
+    assert "solidity_cell" in second.obs
+    assert "solidity_cell" not in first.obs
+
+    # the store survives re-reading the core from disk
+    measured.clear()
+    sdata = sd.read_zarr(sdata.path)
+    run("table_c", ["area", "solidity"])
+    assert measured == []
+
+
+def test_neighbour_graphs_are_stored_in_obsp(sdata_read):
+    """
+    Neighbour graphs of the cells are built during quantification, the same
+    for whole images and tiles.
+    """
+    import numpy as np
+
+    def run(**kwargs):
+        QuantificationController(
+            mask_keys={"cell": "instanseg_cell", "nucleus": "instanseg_nucleus"},
+            to_quantify=["DAPI"],
+            table_name="graph_table",
+            connect_to_mask="instanseg_cell",
+            overwrite=True,
+            neighbors_radius=40,
+            neighbors_k=5,
+            contact_graph=True,
+            **kwargs,
+        ).run(sdata_read)
+        return sdata_read["graph_table"]
+
+    adata = run()
+    for key in ("spatial_radius_distances", "spatial_knn_distances"):
+        assert adata.obsp[key].shape == (adata.n_obs, adata.n_obs)
+    assert (adata.obsp["spatial_knn_distances"].getnnz(axis=1) <= 5).all()
+
+    contacts = adata.obsp["spatial_contacts"]
+    assert contacts.nnz > 0
+    assert (contacts != contacts.T).nnz == 0
+
+    tiled = run(tile_size=100, reuse_morphology=False)
+    assert (tiled.obsp["spatial_contacts"] != contacts).nnz == 0
+    np.testing.assert_allclose(
+        tiled.obsp["spatial_radius_distances"].toarray(),
+        adata.obsp["spatial_radius_distances"].toarray(),
+    )
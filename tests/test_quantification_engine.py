@@ -0,0 +1,158 @@
+import numpy as np
+import pytest
+from skimage.measure import regionprops
+
+from plex_pipe.object_quantification.engine import STATISTICS, LabelIndex
+
+
+@pytest.fixture
+def mask_and_image():
+    rng = np.random.default_rng(0)
+    mask = np.zeros((60, 80), dtype=np.uint16)
+    for label, (y, x) in enumerate(rng.integers(3, [57, 77], size=(30, 2)), start=5):
+        mask[y - 3 : y + 3, x - 3 : x + 3] = label
+    img = rng.normal(100, 20, size=mask.shape).astype(np.float32)
+    return mask, img
+
+
+def test_label_index_matches_regionprops(mask_and_image):
+    mask, img = mask_and_image
+
+    index = LabelIndex(mask)
+    stats = index.reduce(img, STATISTICS)
+
+    regions = regionprops(mask, intensity_image=img)
+    assert list(index.labels) == [r.label for r in regions]
+    for i, region in enumerate(regions):
+        values = region.image_intensity[region.image].astype(np.float64)
+        assert stats["count"][i] == region.area
+        np.testing.assert_allclose(stats["sum"][i], values.sum())
+        np.testing.assert_allclose(stats["mean"][i], values.mean())
+        np.testing.assert_allclose(stats["std"][i], values.std())
+        np.testing.assert_allclose(stats["min"][i], values.min())
+        np.testing.assert_allclose(stats["max"][i], values.max())
+        np.testing.assert_allclose(stats["median"][i], np.median(values))
+
+
+def test_label_index_edge_cases():
+    empty = LabelIndex(np.zeros((5, 5), dtype=np.int32))
+    assert len(empty) == 0
+    assert empty.reduce(np.ones((5, 5)), ["mean"])["mean"].size == 0
+
+    index = LabelIndex(np.ones((5, 5), dtype=np.int32))
+    with pytest.raises(ValueError, match="Unknown statistics"):
+        index.reduce(np.ones((5, 5)), ["mode"])
+    with pytest.raises(ValueError, match="does not match the mask"):
+        index.reduce(np.ones((4, 5)), ["mean"])
+
+
+def test_percentiles_match_numpy(mask_and_image):
+    mask, img = mask_and_image
+    # integer images have many ties within an object
+    img = (img // 10).astype(np.uint16)
+
+    index = LabelIndex(mask)
+    stats = index.reduce(img, ["median", "p0", "p25", "p99.5", "p100"])
+
+    for i, label in enumerate(index.labels):
+        values = img[mask == label]
+        np.testing.assert_allclose(stats["median"][i], np.median(values))
+        np.testing.assert_allclose(
+            [stats[p][i] for p in ("p0", "p25", "p99.5", "p100")],
+            np.percentile(values, [0, 25, 99.5, 100]),
+        )
+
+
+def test_quant_task_validates_statistics():
+    from pydantic import ValidationError
+
+    from plex_pipe.utils.config_schema import QuantTask
+
+    task = QuantTask(name="t", masks={"cell": "cell"}, statistics=["mean", "p90"])
+    assert task.statistics == ["mean", "p90"]
+    assert QuantTask(name="t", masks={}).statistics == ["mean", "median"]
+
+    with pytest.raises(ValidationError, match="p101"):
+        QuantTask(name="t", masks={}, statistics=["p101"])
+
+
+def test_quant_task_validates_morphology(mask_and_image):
+    from pydantic import ValidationError
+
+    from plex_pipe.object_quantification.engine import (
+        MOMENT_FEATURES,
+        REGIONPROPS_FEATURES,
+        morphology_table,
+    )
+    from plex_pipe.utils.config_schema import QuantTask
+
+    task = QuantTask(name="t", masks={}, morphology=["area", "solidity"])
+    assert task.morphology == ["area", "solidity"]
+
+    for unknown in (["areaa"], ["intensity_mean"], ["coords"]):
+        with pytest.raises(ValidationError, match="Unknown morphology"):
+            QuantTask(name="t", masks={}, morphology=unknown)
+
+    # every accepted feature can be measured
+    mask, _ = mask_and_image
+    features = sorted(set(MOMENT_FEATURES) | set(REGIONPROPS_FEATURES))
+    table = morphology_table(mask, properties=features)
+    assert len(table) == len(np.unique(mask[mask > 0]))
+
+
+def test_partial_statistics_merge(mask_and_image):
+    from plex_pipe.object_quantification.engine import PartialStatistics
+
+    mask, img = mask_and_image
+    whole = LabelIndex(mask).reduce(img, PartialStatistics.MOMENTS)
+
+    # split the image into two overlapping-free halves cutting through objects
+    parts = []
+    for rows in (slice(0, 31), slice(31, None)):
+        index = LabelIndex(mask[rows])
+        values = index.gather(img[rows]).astype(np.float64)
+        parts.append(PartialStatistics.from_index(index, values))
+    merged = PartialStatistics.merge(parts)
+
+    np.testing.assert_array_equal(merged.labels, np.unique(mask[mask > 0]))
+    for stat, values in merged.finalize(PartialStatistics.MOMENTS).items():
+        np.testing.assert_allclose(values, whole[stat], rtol=1e-6)
+
+
+def test_moment_features_match_regionprops(mask_and_image):
+    import pandas as pd
+    from skimage.measure import regionprops_table
+
+    from plex_pipe.object_quantification.engine import (
+        MOMENT_FEATURES,
+        morphology_table,
+    )
+
+    mask, _ = mask_and_image
+    # overlapping squares give objects of various shapes
+    properties = [*MOMENT_FEATURES, "solidity"]
+
+    table = morphology_table(mask, offset=(10, 20), properties=properties)
+    expected = pd.DataFrame(
+        regionprops_table(mask, properties=["label", *properties])
+    ).set_index("label")
+    for col in expected.columns:
+        if col.startswith(("centroid-", "bbox-")):
+            expected[col] += (10, 20)[int(col.split("-")[1]) % 2]
+
+    assert list(table.columns) == list(expected.columns)
+    np.testing.assert_array_equal(table.index, expected.index)
+    np.testing.assert_allclose(table.to_numpy(), expected.to_numpy(), atol=1e-9)
+
+
+@pytest.mark.parametrize("field", ["neighbors_radius", "neighbors_k"])
+def test_quant_task_rejects_non_positive_neighbors(field):
+    from pydantic import ValidationError
+
+    from plex_pipe.utils.config_schema import QuantTask
+
+    assert getattr(QuantTask(name="t", masks={}), field) is None
+    assert getattr(QuantTask(name="t", masks={}, **{field: 5}), field) == 5
+    for value in (0, -1):
+        with pytest.raises(ValidationError, match=field):
+            QuantTask(name="t", masks={}, **{field: value})
@@ -0,0 +1,239 @@
+import threading
+
+import numpy as np
+import pytest
+import spatialdata as sd
+from spatialdata.models import Labels2DModel
+
+from plex_pipe.processors.base import BaseOp, OutputType
+from plex_pipe.processors.controller import ResourceBuildingController
+from plex_pipe.processors.scheduler import StepScheduler
+
+
+class OffsetBuilder(BaseOp):
+    """Adds an offset to its first input; optionally waits at a barrier."""
+
+    OUTPUT_TYPE = OutputType.LABELS
+    type_name = "offset"
+
+    def __init__(self, offset=1, barrier=None, fail=False):
+        self.offset = offset
+        self.barrier = barrier
+        self.fail = fail
+
+    def run(self, *sources):
+        if self.barrier is not None:
+            self.barrier.wait(timeout=10)
+        if self.fail:
+            raise RuntimeError("step failed")
+        return sources[0] + self.offset
+
+
+def steps(*specs):
+    return [
+        ResourceBuildingController(
+            OffsetBuilder(**kwargs), inputs, outputs, keep=keep, overwrite=True
+        )
+        for inputs, outputs, keep, kwargs in specs
+    ]
+
+
+@pytest.fixture
+def sdata():
+    labels = np.arange(64 * 64, dtype=np.int32).reshape(64, 64) % 7
+    sdata = sd.SpatialData(
+        labels={
+            "nuclei": Labels2DModel.parse(
+                labels, dims=("y", "x"), scale_factors=[2], chunks={"y": 32, "x": 32}
+            )
+        }
+    )
+    # the sdata is not backed by a zarr store; kept elements stay in memory
+    sdata.write_element = lambda name: None
+    return sdata
+
+
+def read(sdata, name):
+    return np.array(sd.get_pyramid_levels(sdata[name], n=0))
+
+
+def test_graph_and_releases():
+    controllers = steps(
+        (["nuclei"], ["blob"], False, {}),
+        (["nuclei", "blob"], ["nucleus"], True, {}),
+        (["nuclei"], ["ring"], True, {}),
+        (["ring"], ["ring"], True, {}),
+    )
+    scheduler = StepScheduler(controllers)
+
+    assert scheduler.dependencies == [set(), {0}, set(), {2}]
+    assert scheduler.releases[0] == {"blob": {1}}
+    assert scheduler.releases[1] == {}
+
+
+def test_overwrite_waits_for_readers():
+    controllers = steps(
+        (["nuclei"], ["tmp"], False, {}),
+        (["tmp"], ["a"], True, {}),
+        (["nuclei"], ["tmp"], False, {}),
+    )
+    scheduler = StepScheduler(controllers)
+
+    assert scheduler.dependencies[2] == {0, 1}
+    # the first 'tmp' is only read by step 1, the second one by nobody
+    assert scheduler.releases[0] == {"tmp": {1}}
+    assert scheduler.releases[2] == {"tmp": set()}
+
+
+def test_run_releases_intermediates(sdata):
+    controllers = steps(
+        (["nuclei"], ["blob"], False, {"offset": 1}),
+        (["blob"], ["nucleus"], True, {"offset": 10}),
+        (["nuclei"], ["ring"], True, {"offset": 100}),
+    )
+
+    StepScheduler(controllers, max_workers=2).run(sdata)
+
+    labels = read(sdata, "nuclei")
+    assert "blob" not in sdata
+    np.testing.assert_array_equal(read(sdata, "nucleus"), labels + 11)
+    np.testing.assert_array_equal(read(sdata, "ring"), labels + 100)
+
+
+def test_independent_steps_run_concurrently(sdata):
+    # both steps wait for each other; this only completes if they run at once
+    barrier = threading.Barrier(2)
+    controllers = steps(
+        (["nuclei"], ["a"], True, {"barrier": barrier}),
+        (["nuclei"], ["b"], True, {"barrier": barrier}),
+    )
+
+    StepScheduler(controllers, max_workers=2).run(sdata)
+
+    assert "a" in sdata and "b" in sdata
+
+
+class TiledOffsetBuilder(OffsetBuilder):
+    """Tileable; only full tiles wait at the barrier, not the dtype probes."""
+
+    TILEABLE = True
+
+    def run(self, *sources):
+        if np.size(sources[0]) < 32 * 32:
+            return sources[0] + self.offset
+        return super().run(*sources)
+
+
+def test_tiled_steps_compute_concurrently(sdata):
+    # intermediates are computed outside the lock, so both tiles meet
+    barrier = threading.Barrier(2)
+    controllers = [
+        ResourceBuildingController(
+            TiledOffsetBuilder(offset=offset, barrier=barrier),
+            ["nuclei"],
+            [name],
+            keep=False,
+            chunk_size=[1, 64, 64],
+        )
+        for offset, name in ((1, "a"), (2, "b"))
+    ]
+    controllers += steps(
+        (["a"], ["a_out"], True, {"offset": 0}),
+        (["b"], ["b_out"], True, {"offset": 0}),
+    )
+
+    StepScheduler(controllers, max_workers=2).run(sdata)
+
+    labels = read(sdata, "nuclei")
+    np.testing.assert_array_equal(read(sdata, "a_out"), labels + 1)
+    np.testing.assert_array_equal(read(sdata, "b_out"), labels + 2)
+
+
+def test_only_intermediates_read_later_are_persisted(sdata, monkeypatch):
+    persisted = {}
+    prepare_outputs = ResourceBuildingController.prepare_outputs
+
+    def spy(self, sdata, new_elements, persist=False):
+        persisted[self.output_names[0]] = persist
+        return prepare_outputs(self, sdata, new_elements, persist=persist)
+
+    monkeypatch.setattr(ResourceBuildingController, "prepare_outputs", spy)
+    controllers = steps(
+        (["nuclei"], ["blob"], False, {}),
+        (["blob"], ["nucleus"], True, {}),
+        (["nuclei"], ["unused"], False, {}),
+    )
+
+    StepScheduler(controllers).run(sdata)
+
+    # kept outputs are streamed to disk instead of being held in memory
+    assert persisted == {"blob": True, "nucleus": False, "unused": False}
+
+
+def test_failure_stops_dependent_steps(sdata):
+    controllers = steps(
+        (["nuclei"], ["a"], True, {"fail": True}),
+        (["a"], ["b"], True, {}),
+    )
+
+    with pytest.raises(RuntimeError, match="step failed"):
+        StepScheduler(controllers).run(sdata)
+
+    assert "b" not in sdata
+
+
+class ConcurrencyBuilder(OffsetBuilder):
+    """Records how many steps run at once."""
+
+    def __init__(self, active, peak, **kwargs):
+        super().__init__(**kwargs)
+        self.active = active
+        self.peak = peak
+
+    def run(self, *sources):
+        with self.active["lock"]:
+            self.active["n"] += 1
+            self.peak.append(self.active["n"])
+        threading.Event().wait(0.05)
+        with self.active["lock"]:
+            self.active["n"] -= 1
+        return super().run(*sources)
+
+
+class ExclusiveBuilder(ConcurrencyBuilder):
+    THREAD_SAFE = False
+
+
+def concurrent_steps(builder_class, names):
+    active, peak = {"n": 0, "lock": threading.Lock()}, []
+    controllers = [
+        ResourceBuildingController(
+            builder_class(active, peak), ["nuclei"], [name], keep=True
+        )
+        for name in names
+    ]
+    return controllers, peak
+
+
+def test_non_thread_safe_steps_run_alone(sdata):
+    controllers, peak = concurrent_steps(ExclusiveBuilder, ["a", "b", "c"])
+
+    StepScheduler(controllers, max_workers=3).run(sdata)
+
+    assert max(peak) == 1
+    assert all(name in sdata for name in ("a", "b", "c"))
+
+
+@pytest.mark.parametrize("steps_in_budget", [1, 2])
+def test_memory_budget_limits_concurrency(sdata, steps_in_budget):
+    controllers, peak = concurrent_steps(ConcurrencyBuilder, ["a", "b", "c", "d"])
+    step_bytes = controllers[0].estimate_memory(sdata)
+    assert step_bytes > 0
+
+    scheduler = StepScheduler(
+        controllers, max_workers=4, memory_budget=steps_in_budget * step_bytes
+    )
+    scheduler.run(sdata)
+
+    assert max(peak) == steps_in_budget
+    assert all(name in sdata for name in ("a", "b", "c", "d"))
@@ -0,0 +1,200 @@
+import os
+import stat
+import threading
+from multiprocessing import AuthenticationError
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from pydantic import BaseModel
+
+from plex_pipe.processors.base import BaseOp, OutputType
+from plex_pipe.processors.object_segmenters import (
+    Cellpose4Segmenter,
+    InstansegSegmenter,
+    worker_params,
+)
+from plex_pipe.processors.registry import REGISTRY, register
+from plex_pipe.processors.segmentation_worker import (
+    SegmentationClient,
+    SegmentationWorker,
+    default_address,
+    load_authkey,
+    runtime_dir,
+)
+
+
+class _ThresholdOp(BaseOp):
+    """Labels every pixel above the threshold with 1."""
+
+    EXPECTED_INPUTS = 1
+    EXPECTED_OUTPUTS = 1
+    OUTPUT_TYPE = OutputType.LABELS
+    n_built = 0
+
+    class Params(BaseModel):
+        threshold: float = 0
+
+    def __init__(self, **cfg):
+        super().__init__(**cfg)
+        type(self).n_built += 1
+
+    def run(self, img):
+        return (img > self.params.threshold).astype(np.int32)
+
+
+@pytest.fixture
+def threshold_op():
+    _ThresholdOp.n_built = 0
+    register("object_segmenter", "threshold")(_ThresholdOp)
+    yield _ThresholdOp
+    del REGISTRY["object_segmenter"]["threshold"]
+
+
+@pytest.fixture(autouse=True)
+def private_runtime_dir(tmp_path, monkeypatch):
+    # keep the keys of the tests away from the user's runtime directory
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path / "run"))
+
+
+@pytest.fixture
+def worker(tmp_path):
+    worker = SegmentationWorker(str(tmp_path / "worker.sock"))
+    thread = threading.Thread(target=worker.serve_forever, daemon=True)
+    thread.start()
+
+    # wait until the worker accepts connections
+    client = SegmentationClient(worker.address)
+    for _ in range(100):
+        try:
+            client.ping()
+            break
+        except ConnectionError:
+            client.close()
+            threading.Event().wait(0.05)
+    client.close()
+
+    yield worker
+
+    worker.shutdown()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def test_worker_keeps_processor_loaded(worker, threshold_op):
+    img = np.arange(20, dtype=np.uint16).reshape(4, 5)
+    clients = [SegmentationClient(worker.address) for _ in range(2)]
+
+    for client in clients:
+        out = client.run("object_segmenter", "threshold", {"threshold": 9}, [img])
+        np.testing.assert_array_equal(out, (img > 9).astype(np.int32))
+
+    assert threshold_op.n_built == 1
+    assert clients[0].ping()["loaded"] == 1
+
+    # different parameters get their own processor
+    clients[0].run("object_segmenter", "threshold", {"threshold": 3}, [img])
+    assert threshold_op.n_built == 2
+
+    for client in clients:
+        client.close()
+
+
+def test_worker_reports_errors(worker):
+    client = SegmentationClient(worker.address)
+
+    with pytest.raises(RuntimeError, match="Unknown object_segmenter 'missing'"):
+        client.run("object_segmenter", "missing", {}, [np.zeros((2, 2))])
+
+    # the connection stays usable after a failed request
+    assert client.ping()["ok"]
+    client.close()
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX permissions")
+def test_worker_files_are_private(tmp_path, worker):
+    path = runtime_dir()
+    assert path == tmp_path / "run" / "plex_pipe"
+    assert stat.S_IMODE(path.stat().st_mode) == 0o700
+    assert default_address() == str(path / "segmentation.sock")
+
+    key = load_authkey()
+    assert len(key) == 32
+    assert load_authkey() == key
+    assert stat.S_IMODE((path / "worker.key").stat().st_mode) == 0o600
+
+    # the socket is private even outside the runtime directory
+    assert stat.S_IMODE(os.stat(worker.address).st_mode) == 0o600
+
+
+def test_worker_rejects_other_keys(worker):
+    client = SegmentationClient(worker.address, authkey=b"not the key")
+
+    with pytest.raises(AuthenticationError):
+        client.ping()
+
+    # the worker keeps serving clients with the right key
+    client = SegmentationClient(worker.address)
+    assert client.ping()["ok"]
+    client.close()
+
+
+def test_client_without_worker(tmp_path):
+    client = SegmentationClient(str(tmp_path / "nothing.sock"))
+
+    with pytest.raises(ConnectionError, match="No segmentation worker"):
+        client.ping()
+
+
+def test_instanseg_client_mode(worker):
+    mock_model = MagicMock()
+    mock_model.eval_medium_image.return_value = (
+        np.ones((1, 2, 8, 8), dtype=np.int32),
+        None,
+    )
+
+    with patch.dict("sys.modules", {"instanseg": MagicMock()}):
+        with patch("instanseg.InstanSeg", return_value=mock_model) as mock_cls:
+            segmenter = InstansegSegmenter(worker_address=worker.address)
+
+            # the model is only loaded in the worker
+            mock_cls.assert_not_called()
+
+            out = segmenter.run(np.zeros((8, 8)), np.zeros((8, 8)))
+            segmenter.run(np.zeros((8, 8)), np.zeros((8, 8)))
+
+            mock_cls.assert_called_once()
+
+    assert len(out) == 2
+    assert out[0].shape == (8, 8)
+
+    # the worker address is not forwarded to the model
+    _, kwargs = mock_model.eval_medium_image.call_args
+    assert "worker_address" not in kwargs
+    segmenter.client.close()
+
+
+def test_cellpose_client_shares_warm_model(worker):
+    mock_model = MagicMock()
+    mock_model.eval.return_value = (np.ones((8, 8), dtype=np.int32), None, None)
+    mock_models = MagicMock()
+    mock_models.CellposeModel.return_value = mock_model
+
+    with patch.dict("sys.modules", {"cellpose": MagicMock(models=mock_models)}):
+        segmenter = Cellpose4Segmenter(gpu=False, worker_address=worker.address)
+
+        # warm-up as done by scripts/segmentation_worker.py
+        worker.get_processor(
+            "object_segmenter", "cellpose", worker_params(segmenter.params)
+        )
+        segmenter.run(np.zeros((8, 8)))
+
+    # the request reuses the warm model, built on the requested device
+    mock_models.CellposeModel.assert_called_once_with(gpu=False)
+    assert len(worker.processors) == 1
+
+    # neither the device nor the worker address reach the model call
+    _, kwargs = mock_model.eval.call_args
+    assert "gpu" not in kwargs
+    assert "worker_address" not in kwargs
+    segmenter.client.close()
@@ -6,10 +6,13 @@ import pytest
 # Import module under test
 # We assume the registry decorator logic works or is tested elsewhere,
 # so we import the classes directly.
+from plex_pipe.processors.base import BaseOp, OutputType
 from plex_pipe.processors.object_segmenters import (
     Cellpose4Segmenter,
     InstansegSegmenter,
+    TiledSegmenter,
 )
+from plex_pipe.processors.registry import REGISTRY, register
 
 # --- Fixtures for Mocking External Libraries ---
 
@@ -209,3 +212,93 @@ def test_cellpose_params_passed(mock_cellpose_lib):
     _, kwargs = mock_model.eval.call_args
     assert kwargs["diameter"] == 50
     assert kwargs["flow_threshold"] == 0.8
+    assert "gpu" not in kwargs
+
+
+def test_cellpose_cpu(mock_cellpose_lib):
+    mock_cls, _ = mock_cellpose_lib
+
+    Cellpose4Segmenter(gpu=False)
+
+    mock_cls.assert_called_with(gpu=False)
+
+
+# --- Tests for TiledSegmenter ---
+
+
+class _PairSegmenter(BaseOp):
+    """Labels connected blobs as cells and their bright centres as nuclei."""
+
+    EXPECTED_INPUTS = 1
+    EXPECTED_OUTPUTS = 2
+    OUTPUT_TYPE = OutputType.LABELS
+
+    def run(self, img):
+        from scipy import ndimage as ndi
+
+        cells, _ = ndi.label(img > 0)
+        nuclei = np.where(img > 1, cells, 0)
+        return [nuclei, cells]
+
+
+@pytest.fixture
+def pair_segmenter():
+    register("object_segmenter", "pair")(_PairSegmenter)
+    yield
+    del REGISTRY["object_segmenter"]["pair"]
+
+
+@pytest.fixture
+def blobs_image():
+    rng = np.random.default_rng(0)
+    img = np.zeros((130, 170), dtype=np.uint8)
+    yy, xx = np.mgrid[:130, :170]
+    for cy, cx in rng.integers(5, [125, 165], size=(40, 2)):
+        d2 = (yy - cy) ** 2 + (xx - cx) ** 2
+        if (img[d2 <= 36] > 0).any():
+            continue
+        img[d2 <= 25] = 1
+        img[d2 <= 4] = 2
+    return img
+
+
+def assert_same_objects(a, b):
+    """Both label images contain the same objects up to renumbering."""
+    assert np.array_equal(a > 0, b > 0)
+    pairs = np.unique(np.stack([a[a > 0], b[a > 0]]), axis=1)
+    assert pairs.shape[1] == len(np.unique(a[a > 0])) == len(np.unique(b[b > 0]))
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_tiled_matches_whole_image(pair_segmenter, blobs_image, n_workers):
+    whole_nuclei, whole_cells = _PairSegmenter().run(blobs_image)
+
+    segmenter = TiledSegmenter(
+        segmenter="pair", tile_size=40, overlap=12, n_workers=n_workers
+    )
+    nuclei, cells = segmenter.run(blobs_image)
+
+    assert segmenter.EXPECTED_OUTPUTS == 2
+    assert_same_objects(whole_cells, cells)
+    assert_same_objects(whole_nuclei, nuclei)
+
+    # IDs are consecutive and nuclei keep the ID of their cell
+    assert np.array_equal(np.unique(cells[cells > 0]), np.arange(1, cells.max() + 1))
+    assert np.array_equal(nuclei[nuclei > 0], cells[nuclei > 0])
+
+
+def test_tiled_grid_covers_image():
+    grid = TiledSegmenter.tile_grid((100, 70), tile_size=32, overlap=5)
+
+    covered = np.zeros((100, 70), dtype=int)
+    for extended, core in grid:
+        covered[core] += 1
+        assert extended[0].start == max(core[0].start - 5, 0)
+        assert extended[1].stop == min(core[1].stop + 5, 70)
+
+    assert (covered == 1).all()
+
+
+def test_tiled_unknown_segmenter():
+    with pytest.raises(ValueError, match="Unknown segmenter 'missing'"):
+        TiledSegmenter(segmenter="missing")
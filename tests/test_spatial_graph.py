@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from scipy.spatial.distance import cdist
+
+from plex_pipe.object_quantification.spatial_graph import (
+    contact_graph,
+    contact_pairs,
+    knn_graph,
+    radius_graph,
+)
+from plex_pipe.object_quantification.tiled import tiled_contact_pairs
+
+
+@pytest.fixture
+def coords():
+    coords = np.random.default_rng(0).uniform(0, 100, size=(200, 2))
+    # an object missing from the mask of the graph
+    coords[5] = np.nan
+    return coords
+
+
+def test_radius_graph_matches_pairwise_distances(coords):
+    graph = radius_graph(coords, 10).toarray()
+
+    distances = cdist(coords, coords)
+    expected = (distances <= 10) & ~np.eye(len(coords), dtype=bool)
+
+    np.testing.assert_array_equal(graph > 0, expected)
+    np.testing.assert_allclose(graph[expected], distances[expected])
+    np.testing.assert_array_equal(graph, graph.T)
+
+
+def test_knn_graph_connects_nearest_neighbours(coords):
+    graph = knn_graph(coords, 4)
+
+    degree = graph.getnnz(axis=1)
+    assert degree[5] == 0
+    assert (np.delete(degree, 5) == 4).all()
+
+    distances = cdist(coords, coords)
+    np.fill_diagonal(distances, np.inf)
+    for row in (0, 1, 100):
+        expected = np.sort(distances[row])[:4]
+        np.testing.assert_allclose(np.sort(graph[row].data), expected)
+
+
+def test_contacts_follow_shared_borders():
+    import dask.array as da
+
+    mask = np.zeros((40, 50), dtype=np.uint16)
+    mask[5:20, 5:20] = 1
+    mask[5:20, 20:30] = 2
+    mask[20:30, 5:30] = 3
+    mask[0:4, 40:50] = 4  # touches nothing
+
+    a, b, lengths = contact_pairs(mask)
+    contacts = {(int(x), int(y)): int(n) for x, y, n in zip(a, b, lengths)}
+    assert contacts == {(1, 2): 15, (1, 3): 15, (2, 3): 10}
+
+    # tiles cutting through the objects give the same contacts
+    tiled = tiled_contact_pairs(da.from_array(mask, chunks=16), 16)
+    for expected, found in zip((a, b, lengths), tiled):
+        np.testing.assert_array_equal(expected, found)
+
+    graph = contact_graph(np.array([3, 1, 2, 4]), a, b, lengths).toarray()
+    np.testing.assert_array_equal(
+        graph,
+        [[0, 15, 10, 0], [15, 0, 15, 0], [10, 15, 0, 0], [0, 0, 0, 0]],
+    )